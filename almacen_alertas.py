@@ -0,0 +1,238 @@
+import bisect
+from array import array
+from collections import namedtuple
+from itertools import compress
+
+
+# Una alerta tal y como la devuelve el almacén (es una copia: para
+# cambiarla hay que usar los métodos del almacén)
+Alerta = namedtuple("Alerta", ["id", "ticker", "alias", "target", "chat_id", "triggered"])
+
+
+def _bit(bits, i):
+    return bits[i >> 3] >> (i & 7) & 1
+
+
+def _poner_bit(bits, i, valor):
+    if valor:
+        bits[i >> 3] |= 1 << (i & 7)
+    else:
+        bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+
+# byte -> sus 8 bits como 8 bytes 0/1 (el bit 0 primero), para expandir en C
+_BITS_EN_BYTES = [bytes(byte >> k & 1 for k in range(8)) for byte in range(256)]
+_NEGAR = bytes.maketrans(b"\0\1", b"\1\0")
+
+
+def _expandir(bits, n):
+    """Los n primeros bits como bytes, un 0/1 por posición."""
+    return b"".join(map(_BITS_EN_BYTES.__getitem__, bits))[:n]
+
+
+class AlmacenAlertas:
+    """
+    Las alertas de bot-con-cache.py en memoria, en COLUMNAS (arrays) en vez
+    de un dict por alerta: ~22 bytes por alerta + el índice por chat.
+
+    - Cada alerta tiene un ID que no cambia nunca (1, 2, 3...; no se
+      reutilizan ni al borrar ni al reiniciar, ver persistencia.py).
+    - Columnas paralelas ordenadas por ID: ID (u32), chat_id (int64),
+      objetivo (float64) y nº de par (ticker, alias) (u16, cada par se
+      guarda UNA vez), más un bit "disparada" y un bit "borrada" por alerta.
+      El ID se busca con bisect: O(log n).
+    - Borrar solo marca el bit; cuando la mitad son huecos se compacta.
+    - {chat_id: IDs} para listar o borrar las de un usuario sin recorrer
+      las de todos (un int si tiene una sola, un array si tiene varias).
+    - Ningún método hace 'await': cada operación se completa entera antes
+      de que otro handler pueda tocar el almacén.
+    """
+
+    def __init__(self):
+        self.siguiente_id = 1
+        self._ids = array("I")
+        self._chats = array("q")
+        self._objetivos = array("d")
+        self._pares = array("H")
+        self._disparadas = bytearray()
+        self._borradas = bytearray()
+        self._n_borradas = 0
+        self._lista_pares = []   # nº de par -> (ticker, alias)
+        self._numero_par = {}    # (ticker, alias) -> nº de par
+        self._por_chat = {}      # chat_id -> ID o array("I") de IDs
+        # Si se pone, se le apunta cada cambio (ver PersistenciaAlertas)
+        self.persistencia = None
+
+    def __len__(self):
+        return len(self._ids) - self._n_borradas
+
+    # --- Por dentro ---
+
+    def _posicion(self, alert_id):
+        """Posición en las columnas de la alerta 'alert_id', o None si no existe."""
+        i = bisect.bisect_left(self._ids, alert_id)
+        if i < len(self._ids) and self._ids[i] == alert_id and not _bit(self._borradas, i):
+            return i
+        return None
+
+    def _alerta(self, i):
+        ticker, alias = self._lista_pares[self._pares[i]]
+        return Alerta(self._ids[i], ticker, alias, self._objetivos[i], self._chats[i],
+                      bool(_bit(self._disparadas, i)))
+
+    def _ids_del_chat(self, chat_id):
+        ids = self._por_chat.get(chat_id, ())
+        return (ids,) if isinstance(ids, int) else ids
+
+    def _compactar(self):
+        """Quita los huecos de las alertas borradas (O(n), cada muchas bajas)."""
+        n = len(self._ids)
+        vivas = [not _bit(self._borradas, i) for i in range(n)]
+        disparadas = [_bit(self._disparadas, i) for i in compress(range(n), vivas)]
+
+        self._ids = array("I", compress(self._ids, vivas))
+        self._chats = array("q", compress(self._chats, vivas))
+        self._objetivos = array("d", compress(self._objetivos, vivas))
+        self._pares = array("H", compress(self._pares, vivas))
+        self._borradas = bytearray((len(self._ids) + 7) // 8)
+        self._disparadas = bytearray(len(self._borradas))
+        for i, disparada in enumerate(disparadas):
+            if disparada:
+                _poner_bit(self._disparadas, i, True)
+        self._n_borradas = 0
+
+    # --- Cambios ---
+
+    def anadir(self, ticker, alias, target, chat_id, triggered=False, alert_id=None):
+        """Guarda la alerta y devuelve su ID ('alert_id' solo al cargar del disco)."""
+        if alert_id is None:
+            alert_id = self.siguiente_id
+        if self._ids and alert_id <= self._ids[-1]:
+            raise ValueError(f"ID {alert_id} fuera de orden (el último es {self._ids[-1]})")
+        self.siguiente_id = max(self.siguiente_id, alert_id + 1)
+
+        par = (ticker, alias)
+        numero = self._numero_par.get(par)
+        if numero is None:
+            numero = self._numero_par[par] = len(self._lista_pares)
+            self._lista_pares.append(par)
+
+        i = len(self._ids)
+        if i & 7 == 0:
+            self._disparadas.append(0)
+            self._borradas.append(0)
+        self._ids.append(alert_id)
+        self._chats.append(chat_id)
+        self._objetivos.append(target)
+        self._pares.append(numero)
+        _poner_bit(self._disparadas, i, triggered)
+
+        ids = self._por_chat.get(chat_id)
+        if ids is None:
+            self._por_chat[chat_id] = alert_id
+        elif isinstance(ids, int):
+            self._por_chat[chat_id] = array("I", (ids, alert_id))
+        else:
+            ids.append(alert_id)
+
+        if self.persistencia is not None:
+            self.persistencia.alta(Alerta(alert_id, ticker, alias, target, chat_id, triggered))
+        return alert_id
+
+    def borrar(self, alert_id, chat_id=None):
+        """
+        Borra la alerta y la devuelve. Si se da 'chat_id', solo la borra si
+        es de ese chat. Devuelve None si no existe (o no es suya).
+        """
+        i = self._posicion(alert_id)
+        if i is None or (chat_id is not None and self._chats[i] != chat_id):
+            return None
+        alerta = self._alerta(i)
+
+        _poner_bit(self._borradas, i, True)
+        self._n_borradas += 1
+        ids = self._por_chat[alerta.chat_id]
+        if isinstance(ids, int):
+            del self._por_chat[alerta.chat_id]
+        else:
+            ids.remove(alert_id)
+            if len(ids) == 1:
+                self._por_chat[alerta.chat_id] = ids[0]
+
+        if self.persistencia is not None:
+            self.persistencia.baja(alert_id)
+        if self._n_borradas > 1024 and self._n_borradas * 2 > len(self._ids):
+            self._compactar()
+        return alerta
+
+    def marcar(self, alert_id, disparada):
+        """Cambia el estado 'triggered' de la alerta (si sigue existiendo)."""
+        i = self._posicion(alert_id)
+        if i is None:
+            return
+        _poner_bit(self._disparadas, i, disparada)
+        if self.persistencia is not None:
+            self.persistencia.estado(alert_id, disparada)
+
+    # --- Consultas ---
+
+    def obtener(self, alert_id):
+        i = self._posicion(alert_id)
+        return self._alerta(i) if i is not None else None
+
+    def de_chat(self, chat_id):
+        """Las alertas del chat, de la más antigua a la más nueva."""
+        return [self._alerta(self._posicion(alert_id)) for alert_id in self._ids_del_chat(chat_id)]
+
+    def todas(self):
+        """
+        TODAS las alertas. Es una copia: se puede recorrer con 'await' de
+        por medio aunque otros añadan o borren mientras tanto.
+        """
+        return [self._alerta(i) for i in range(len(self._ids)) if not _bit(self._borradas, i)]
+
+    def columnas_vivas(self):
+        """
+        Copia de solo las columnas que necesita el job de alertas en cada
+        tick, sin huecos: (ids, objetivos, pares, disparadas, lista de pares),
+        con 'disparadas' un byte 0/1 por alerta. ~15 bytes por alerta y se
+        copia en C, sin crear una Alerta por cada una: el resto (alias,
+        chat) se pide con obtener() solo para las que cambian de estado.
+        """
+        n = len(self._ids)
+        disparadas = _expandir(self._disparadas, n)
+        if not self._n_borradas:
+            return (array("I", self._ids), array("d", self._objetivos), array("H", self._pares),
+                    disparadas, list(self._lista_pares))
+        vivas = _expandir(self._borradas, n).translate(_NEGAR)
+        return (array("I", compress(self._ids, vivas)), array("d", compress(self._objetivos, vivas)),
+                array("H", compress(self._pares, vivas)), bytes(compress(disparadas, vivas)),
+                list(self._lista_pares))
+
+    # --- Para la persistencia (foto en columnas) ---
+
+    def columnas(self):
+        """(ids, chats, objetivos, pares, bits de disparadas, lista de pares), sin huecos."""
+        if self._n_borradas:
+            self._compactar()
+        return self._ids, self._chats, self._objetivos, self._pares, self._disparadas, self._lista_pares
+
+    def cargar_columnas(self, ids, chats, objetivos, pares, disparadas, lista_pares, siguiente_id):
+        """Rellena el almacén (vacío) con las columnas de una foto."""
+        self._ids, self._chats, self._objetivos, self._pares = ids, chats, objetivos, pares
+        self._disparadas = bytearray(disparadas)
+        self._borradas = bytearray(len(self._disparadas))
+        self._n_borradas = 0
+        self._lista_pares = list(lista_pares)
+        self._numero_par = {par: numero for numero, par in enumerate(self._lista_pares)}
+        self.siguiente_id = max(siguiente_id, ids[-1] + 1 if ids else 1)
+
+        por_chat = self._por_chat = {}
+        for alert_id, chat_id in zip(ids, chats):
+            actual = por_chat.get(chat_id)
+            if actual is None:
+                por_chat[chat_id] = alert_id
+            elif isinstance(actual, int):
+                por_chat[chat_id] = array("I", (actual, alert_id))
+            else:
+                actual.append(alert_id)
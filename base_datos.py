@@ -0,0 +1,289 @@
+import asyncio
+import sys
+import time
+from decimal import Decimal
+
+import asyncpg
+
+from config import (
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    DB_TIMEOUT_ADQUIRIR,
+    DB_TIMEOUT_ARRANQUE,
+    DB_TIMEOUT_SENTENCIA,
+    DB_CACHE_SENTENCIAS)
+from metricas import Histograma
+
+
+# --- Pool de conexiones ASYNC (asyncpg) ---
+# Todas las funciones de este módulo son 'await'-eables: ninguna bloquea el
+# bucle de eventos mientras habla con PostgreSQL.
+
+ErrorBD = asyncpg.PostgresError
+
+
+class BaseDatosOcupada(Exception):
+    """No ha quedado libre ninguna conexión del pool a tiempo (pool agotado)."""
+
+
+class BaseDatosNoLista(BaseDatosOcupada):
+    """El pool no ha terminado de crearse / prepararse a tiempo (bot recién arrancado)."""
+
+
+_pool = None
+# Se activa cuando el pool está creado y preparado (el bot ya atiende mientras tanto)
+_pool_listo = asyncio.Event()
+
+
+async def crear_pool(dsn, preparar=None):
+    """
+    Crea el pool de conexiones. Se llama UNA vez al arrancar el bot.
+    'preparar' (ej: las migraciones) se ejecuta antes de dar paso al resto:
+    hasta que termina, conexion() espera (salvo conexion(arranque=True)).
+    """
+    global _pool
+    print("Creando pool de conexiones a la base de datos...")
+    _pool = await asyncpg.create_pool(
+        dsn=dsn,
+        min_size=DB_POOL_MIN,
+        max_size=DB_POOL_MAX,
+        command_timeout=DB_TIMEOUT_SENTENCIA,
+        statement_cache_size=DB_CACHE_SENTENCIAS,
+    )
+    print("Pool de conexiones creado con éxito.")
+    if preparar is not None:
+        await preparar()
+    _pool_listo.set()
+    return _pool
+
+
+async def cerrar_pool():
+    """Cierra el pool (al apagar el bot)."""
+    global _pool
+    _pool_listo.clear()
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+# --- Métricas del pool (para dimensionarlo con datos) ---
+
+_metricas = {
+    "en_uso": 0,
+    "esperando": 0,
+    "prestamos_totales": 0,
+    "fallos_adquisicion": 0,
+    # La espera a que el pool esté listo al arrancar va APARTE: no dice
+    # nada del tamaño del pool (ni entra en el histograma de esperas)
+    "esperando_arranque": 0,
+    "fallos_arranque": 0,
+    "max_retenida_segundos": 0.0,
+    "max_retenida_por": None,
+}
+_histograma_espera = Histograma()
+_prestamos_activos = {}  # id(prestamo) -> (quien, instante)
+
+
+def _quien_llama():
+    """Nombre de la primera función FUERA de este módulo (el handler o job)."""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get("__name__") == __name__:
+        frame = frame.f_back
+    return frame.f_code.co_name if frame is not None else "?"
+
+
+class _Prestamo:
+    """
+    Préstamo de UNA conexión del pool (se usa con 'async with').
+    - Si no hay conexiones libres, ESPERA en cola hasta DB_TIMEOUT_ADQUIRIR
+      segundos; si se agota el plazo lanza BaseDatosOcupada.
+    - Si el pool aún no está listo (bot recién arrancado), espera a que se
+      cree y se prepare hasta DB_TIMEOUT_ARRANQUE segundos; si se agota
+      lanza BaseDatosNoLista (con su propio mensaje y contador).
+    - Apunta cuánto se esperó, quién la tiene y cuánto la retiene.
+    """
+
+    def __init__(self, quien, arranque=False):
+        self._quien = quien
+        self._arranque = arranque
+        self._conn = None
+        self._inicio = 0.0
+
+    async def __aenter__(self):
+        if _pool is None or (not self._arranque and not _pool_listo.is_set()):
+            await self._esperar_arranque()
+
+        _metricas["esperando"] += 1
+        inicio_espera = time.monotonic()
+        try:
+            self._conn = await _pool.acquire(timeout=DB_TIMEOUT_ADQUIRIR)
+        except asyncio.TimeoutError:
+            _metricas["fallos_adquisicion"] += 1
+            print(f"!!! Pool de BD agotado: '{self._quien}' esperó {DB_TIMEOUT_ADQUIRIR}s sin conexión !!!")
+            raise BaseDatosOcupada(f"Sin conexión libre tras {DB_TIMEOUT_ADQUIRIR}s") from None
+        finally:
+            _metricas["esperando"] -= 1
+            _histograma_espera.observar(time.monotonic() - inicio_espera)
+
+        self._inicio = time.monotonic()
+        _metricas["en_uso"] += 1
+        _metricas["prestamos_totales"] += 1
+        _prestamos_activos[id(self)] = (self._quien, self._inicio)
+        return self._conn
+
+    async def _esperar_arranque(self):
+        """Arranque en frío: el pool todavía se está creando / migrando."""
+        _metricas["esperando_arranque"] += 1
+        try:
+            await asyncio.wait_for(_pool_listo.wait(), DB_TIMEOUT_ARRANQUE)
+        except asyncio.TimeoutError:
+            _metricas["fallos_arranque"] += 1
+            print(f"!!! BD aún no lista: '{self._quien}' esperó {DB_TIMEOUT_ARRANQUE}s a que arrancara el pool !!!")
+            raise BaseDatosNoLista(f"Pool sin preparar tras {DB_TIMEOUT_ARRANQUE}s") from None
+        finally:
+            _metricas["esperando_arranque"] -= 1
+
+    async def __aexit__(self, *exc_info):
+        retenida = time.monotonic() - self._inicio
+        _metricas["en_uso"] -= 1
+        del _prestamos_activos[id(self)]
+        if retenida > _metricas["max_retenida_segundos"]:
+            _metricas["max_retenida_segundos"] = retenida
+            _metricas["max_retenida_por"] = self._quien
+        await _pool.release(self._conn)
+
+
+def conexion(arranque=False):
+    """
+    Pide una conexión al pool (usar con 'async with').
+    Si no hay ninguna libre en DB_TIMEOUT_ADQUIRIR segundos, lanza BaseDatosOcupada.
+    'arranque=True' es para lo que prepara la BD (no espera a que esté lista).
+    """
+    return _Prestamo(_quien_llama(), arranque)
+
+
+def metricas_pool():
+    """Foto en vivo del pool: uso, esperas, fallos y la conexión más retenida."""
+    ahora = time.monotonic()
+    mas_retenida = None
+    if _prestamos_activos:
+        quien, inicio = min(_prestamos_activos.values(), key=lambda prestamo: prestamo[1])
+        mas_retenida = {"por": quien, "segundos": round(ahora - inicio, 3)}
+
+    return {
+        "tamano": _pool.get_size() if _pool is not None else 0,
+        "libres": _pool.get_idle_size() if _pool is not None else 0,
+        "maximo": DB_POOL_MAX,
+        **_metricas,
+        "max_retenida_segundos": round(_metricas["max_retenida_segundos"], 3),
+        "retenida_ahora_mas_tiempo": mas_retenida,
+        "espera_segundos": _histograma_espera.foto(),
+    }
+
+
+# --- Sentencias ---
+
+# Modo "sql": PostgreSQL compara TODAS las alertas con la foto de precios de
+# golpe. Los precios viajan como dos arrays paralelos (símbolos y precios).
+# Los precios van como NUMERIC, igual que target_price: con float8 Postgres
+# convertiría target_price a float8 y no podría usar la parte target_price
+# de idx_alerts_simbolo_estado_objetivo (migración 3) para el rango.
+SQL_DISPARAR_ALERTAS = """
+UPDATE alerts a
+SET is_triggered = TRUE
+FROM unnest($1::varchar[], $2::numeric[]) AS p(ticker_symbol, precio)
+WHERE a.ticker_symbol = p.ticker_symbol
+  AND NOT a.is_triggered
+  AND p.precio < a.target_price
+RETURNING a.id, a.chat_id, a.ticker_symbol, a.alias_general, a.target_price
+"""
+
+SQL_REARMAR_ALERTAS = """
+UPDATE alerts a
+SET is_triggered = FALSE
+FROM unnest($1::varchar[], $2::numeric[]) AS p(ticker_symbol, precio)
+WHERE a.ticker_symbol = p.ticker_symbol
+  AND a.is_triggered
+  AND p.precio > a.target_price
+RETURNING a.id, a.chat_id, a.ticker_symbol, a.alias_general, a.target_price
+"""
+
+# Modo "indice": todos los cambios de estado del tick en UNA sola sentencia
+SQL_GUARDAR_ESTADOS = """
+UPDATE alerts a
+SET is_triggered = v.is_triggered
+FROM unnest($1::int[], $2::boolean[]) AS v(id, is_triggered)
+WHERE a.id = v.id
+"""
+
+
+# --- Acceso a datos ---
+
+async def insertar_alerta(chat_id, ticker_simbolo, alias_general, target_price, moneda):
+    """Guarda una alerta nueva. Devuelve su id."""
+    # (NUMERIC en la BD: lo pasamos como Decimal para no perder céntimos)
+    async with conexion() as conn:
+        return await conn.fetchval(
+            """
+            INSERT INTO alerts (chat_id, ticker_symbol, alias_general, target_price, currency)
+            VALUES ($1, $2, $3, $4, $5)
+            RETURNING id
+            """,
+            chat_id, ticker_simbolo, alias_general, Decimal(str(target_price)), moneda
+        )
+
+
+async def alertas_de_chat(chat_id):
+    """Alertas de UN usuario: filas (id, alias_general, ticker_symbol, target_price, currency)."""
+    async with conexion() as conn:
+        return await conn.fetch(
+            "SELECT id, alias_general, ticker_symbol, target_price, currency FROM alerts WHERE chat_id = $1",
+            chat_id
+        )
+
+
+async def borrar_alerta(alert_id, chat_id):
+    """
+    Borra la alerta SOLO si es de este chat (para que no borres alertas de otros).
+    Devuelve el alias de la alerta borrada, o None si no existía / no era suya.
+    """
+    async with conexion() as conn:
+        return await conn.fetchval(
+            "DELETE FROM alerts WHERE id = $1 AND chat_id = $2 RETURNING alias_general",
+            alert_id, chat_id
+        )
+
+
+async def todas_las_alertas():
+    """Filas (id, chat_id, ticker_symbol, alias_general, target_price, is_triggered)."""
+    async with conexion() as conn:
+        return await conn.fetch(
+            "SELECT id, chat_id, ticker_symbol, alias_general, target_price, is_triggered FROM alerts"
+        )
+
+
+async def alertas_por_simbolo():
+    """Dict {símbolo: número de alertas} de los símbolos que tienen alguna alerta."""
+    async with conexion() as conn:
+        filas = await conn.fetch("SELECT ticker_symbol, count(*) FROM alerts GROUP BY ticker_symbol")
+    return {simbolo: cuantas for simbolo, cuantas in filas}
+
+
+async def evaluar_alertas(simbolos, valores):
+    """
+    Modo "sql": dos UPDATE ... FROM ... RETURNING (uno dispara, otro re-arma)
+    en UNA transacción. Devuelve (filas_disparadas, filas_rearmadas) con
+    (id, chat_id, ticker_symbol, alias_general, target_price).
+    """
+    valores = [Decimal(str(valor)) for valor in valores]
+    async with conexion() as conn:
+        async with conn.transaction():
+            disparadas = await conn.fetch(SQL_DISPARAR_ALERTAS, simbolos, valores)
+            rearmadas = await conn.fetch(SQL_REARMAR_ALERTAS, simbolos, valores)
+    return disparadas, rearmadas
+
+
+async def guardar_estados(ids, estados):
+    """Escribe de golpe los cambios de estado (id -> is_triggered) del tick."""
+    async with conexion() as conn:
+        await conn.execute(SQL_GUARDAR_ESTADOS, ids, estados)
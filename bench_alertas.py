@@ -0,0 +1,277 @@
+"""
+Benchmark OFFLINE de check_all_alerts (sin Internet, sin PostgreSQL, sin Telegram).
+
+Ejecuta el job REAL de bot.py contra:
+  - una BD de mentira en SQLite (en memoria) con las mismas funciones que
+    usa el job de base_datos.py, que cuenta las idas y vueltas a la BD,
+  - un proveedor de precios falso (paseo aleatorio por símbolo),
+  - un Bot falso que solo apunta los send_message.
+
+Para cada tamaño (10k, 100k, 1M alertas por defecto) y cada modo de
+evaluación ("indice" / "sql") mide, tick a tick:
+  tiempo del tick, idas y vueltas a la BD, memoria (RSS máximo del proceso,
+  o el pico de Python del tick con --tracemalloc) y mensajes por segundo al
+  vaciar la cola de avisos. Al final, dos ticks de disparo en masa: todos
+  los precios caen por debajo de todos los objetivos ("caída") y luego
+  suben por encima ("subida").
+
+Cada prueba (tamaño, modo) corre en su PROPIO proceso: el RSS máximo no
+baja nunca, así que en un proceso compartido todas las pruebas verían el
+pico de la más grande hasta el momento. (El RSS incluye la BD SQLite en
+memoria, igual para los dos modos.)
+
+Uso:
+  python bench_alertas.py [--alertas 10000 100000 1000000] [--simbolos 50]
+                          [--ticks 3] [--modos indice sql] [--limites-reales]
+                          [--tracemalloc]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# bot.py exige estas variables al importarse (aquí no se usan de verdad)
+os.environ.setdefault("MI_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("MI_CHAT_ID", "1")
+os.environ.setdefault("DATABASE_URL", "postgresql://benchmark")
+
+import bot  # noqa: E402
+from notificaciones import Despachador  # noqa: E402
+
+
+PRECIO_BASE = 100.0
+
+
+class BaseDatosSQLite:
+    """
+    Sustituto de base_datos.py (solo lo que usa check_all_alerts) sobre SQLite.
+    'idas_y_vueltas' cuenta las sentencias que PostgreSQL recibiría.
+    """
+
+    def __init__(self, n_alertas, simbolos, semilla=1):
+        self.conn = sqlite3.connect(":memory:")
+        self.idas_y_vueltas = 0
+        self.conn.executescript("""
+            CREATE TABLE alerts (
+                id INTEGER PRIMARY KEY,
+                chat_id INTEGER NOT NULL,
+                ticker_symbol TEXT NOT NULL,
+                alias_general TEXT NOT NULL,
+                target_price REAL NOT NULL,
+                is_triggered INTEGER NOT NULL DEFAULT 0,
+                currency TEXT
+            );
+        """)
+        azar = random.Random(semilla)
+        filas = (
+            (i, 10_000 + azar.randrange(n_alertas // 3 + 1), simbolo, f"Alias {simbolo}",
+             round(PRECIO_BASE * azar.uniform(0.8, 1.2), 2), "EUR")
+            for i, simbolo in ((i, azar.choice(simbolos)) for i in range(1, n_alertas + 1))
+        )
+        self.conn.executemany(
+            "INSERT INTO alerts (id, chat_id, ticker_symbol, alias_general, target_price, currency) "
+            "VALUES (?, ?, ?, ?, ?, ?)", filas)
+        # El mismo índice que la migración 3
+        self.conn.execute("CREATE INDEX idx_alerts_simbolo_estado_objetivo ON alerts (ticker_symbol, is_triggered, target_price)")
+        self.conn.commit()
+
+    # --- Lo que usa check_all_alerts ---
+
+    async def alertas_por_simbolo(self):
+        self.idas_y_vueltas += 1
+        return dict(self.conn.execute("SELECT ticker_symbol, count(*) FROM alerts GROUP BY ticker_symbol"))
+
+    async def todas_las_alertas(self):
+        self.idas_y_vueltas += 1
+        return self.conn.execute(
+            "SELECT id, chat_id, ticker_symbol, alias_general, target_price, is_triggered FROM alerts").fetchall()
+
+    async def guardar_estados(self, ids, estados):
+        # En PostgreSQL es UNA sentencia (unnest de dos arrays)
+        self.idas_y_vueltas += 1
+        self.conn.executemany("UPDATE alerts SET is_triggered = ? WHERE id = ?", zip(estados, ids))
+        self.conn.commit()
+
+    async def evaluar_alertas(self, simbolos, valores):
+        # En PostgreSQL: BEGIN + 2 UPDATE ... RETURNING + COMMIT
+        self.idas_y_vueltas += 4
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS precios (ticker_symbol TEXT PRIMARY KEY, precio REAL)")
+        self.conn.execute("DELETE FROM precios")
+        self.conn.executemany("INSERT INTO precios VALUES (?, ?)", zip(simbolos, valores))
+        disparadas = self.conn.execute("""
+            UPDATE alerts SET is_triggered = 1
+            FROM precios p
+            WHERE alerts.ticker_symbol = p.ticker_symbol AND NOT alerts.is_triggered AND p.precio < alerts.target_price
+            RETURNING id, chat_id, ticker_symbol, alias_general, target_price
+        """).fetchall()
+        rearmadas = self.conn.execute("""
+            UPDATE alerts SET is_triggered = 0
+            FROM precios p
+            WHERE alerts.ticker_symbol = p.ticker_symbol AND alerts.is_triggered AND p.precio > alerts.target_price
+            RETURNING id, chat_id, ticker_symbol, alias_general, target_price
+        """).fetchall()
+        self.conn.commit()
+        return disparadas, rearmadas
+
+    def metricas_pool(self):
+        return {"tamano": 1, "libres": 1, "maximo": 1, "en_uso": 0, "esperando": 0, "fallos_adquisicion": 0, "fallos_arranque": 0}
+
+
+class ProveedorPreciosFalso:
+    """Paseo aleatorio por símbolo: cada tick el precio se mueve hasta ±'paso'."""
+
+    def __init__(self, simbolos, paso=0.03, semilla=2):
+        self._azar = random.Random(semilla)
+        self._paso = paso
+        self.precios = {simbolo: PRECIO_BASE for simbolo in simbolos}
+
+    def mover(self):
+        for simbolo, precio in self.precios.items():
+            self.precios[simbolo] = precio * (1 + self._azar.uniform(-self._paso, self._paso))
+
+    def llevar_todos(self, precio):
+        """Todos los símbolos a 'precio' de golpe (para disparar o rearmar todo a la vez)."""
+        for simbolo in self.precios:
+            self.precios[simbolo] = precio
+
+    async def obtener_varios_async(self, simbolos, uso="interactivo", timeout=None):
+        anterior = PRECIO_BASE
+        resultados = {
+            simbolo: (self.precios[simbolo], "EUR", (self.precios[simbolo] - anterior) / anterior * 100)
+            for simbolo in simbolos
+        }
+        return resultados, set()
+
+
+class BotFalso:
+    """Solo cuenta los send_message (no hay red)."""
+
+    def __init__(self):
+        self.enviados = 0
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.enviados += 1
+
+
+async def un_tick(bd, proveedor, bot_falso, medir_memoria):
+    """Un check_all_alerts completo + vaciar la cola de avisos. Devuelve sus números."""
+    idas_antes, enviados_antes = bd.idas_y_vueltas, bot_falso.enviados
+
+    if medir_memoria:
+        tracemalloc.start()
+    inicio_tick = inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # (cada aviso hace un print)
+        await bot.check_all_alerts(None)
+    duracion_tick = time.perf_counter() - inicio
+    pico_memoria = None
+    if medir_memoria:
+        pico_memoria = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    # Los avisos se van enviando YA durante el tick: contamos desde que empezó
+    await bot.despachador.esperar_vacia()
+    duracion_envio = time.perf_counter() - inicio_tick
+
+    mensajes = bot_falso.enviados - enviados_antes
+    return {
+        "tick_s": duracion_tick,
+        "idas_bd": bd.idas_y_vueltas - idas_antes,
+        "mensajes": mensajes,
+        "msg_s": mensajes / duracion_envio if mensajes and duracion_envio > 0 else 0.0,
+        "pico_mb": pico_memoria / 1e6 if pico_memoria is not None else rss_maximo_mb(),
+    }
+
+
+def rss_maximo_mb():
+    """Memoria máxima (RSS) que ha usado el proceso hasta ahora (ru_maxrss: KB en Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def una_prueba(n_alertas, n_simbolos, modo, ticks, limites_reales, con_tracemalloc):
+    simbolos = [f"SIM{i}.DE" for i in range(n_simbolos)]
+
+    inicio = time.perf_counter()
+    bd = BaseDatosSQLite(n_alertas, simbolos)
+    siembra = time.perf_counter() - inicio
+
+    proveedor = ProveedorPreciosFalso(simbolos)
+    bot_falso = BotFalso()
+
+    # Enchufamos las piezas falsas en el bot REAL
+    bot.base_datos = bd
+    bot.obtener_varios_async = proveedor.obtener_varios_async
+    bot.MODO_EVALUACION_ALERTAS = modo
+    bot.indice_alertas = bot.IndiceAlertas()
+    if limites_reales:
+        bot.despachador = Despachador()
+    else:
+        # Sin los límites de Telegram: mide cuánto da de sí el propio bot
+        bot.despachador = Despachador(mensajes_por_segundo=1e9, segundos_por_chat=0)
+    bot.despachador.arrancar(bot_falso)
+
+    print(f"\n=== {n_alertas:,} alertas, {n_simbolos} símbolos, modo '{modo}' "
+          f"(BD sembrada en {siembra:.1f}s) ===")
+    memoria = "pico MB" if con_tracemalloc else "RSS MB"
+    print(f"{'tick':>5} {'tiempo (s)':>11} {'idas BD':>8} {'mensajes':>9} {'msg/s':>10} {memoria:>8}")
+    for tick in range(1, ticks + 1):
+        # (el tick 1 carga el índice en frío y dispara todo lo que ya está por debajo)
+        resultado = await un_tick(bd, proveedor, bot_falso, con_tracemalloc)
+        print(f"{tick:>5} {resultado['tick_s']:>11.3f} {resultado['idas_bd']:>8} "
+              f"{resultado['mensajes']:>9,} {resultado['msg_s']:>10,.0f} {resultado['pico_mb']:>8.1f}")
+        proveedor.mover()
+
+    # Disparo en masa: todo se hunde por debajo de todos los objetivos y
+    # luego sube por encima (todas las alertas cambian de estado a la vez)
+    for nombre, precio in (("caída", PRECIO_BASE * 0.5), ("subida", PRECIO_BASE * 2)):
+        proveedor.llevar_todos(precio)
+        resultado = await un_tick(bd, proveedor, bot_falso, con_tracemalloc)
+        print(f"{nombre:>6}{resultado['tick_s']:>11.3f} {resultado['idas_bd']:>8} "
+              f"{resultado['mensajes']:>9,} {resultado['msg_s']:>10,.0f} {resultado['pico_mb']:>8.1f}")
+
+    await bot.despachador.parar()
+    bd.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline de check_all_alerts")
+    parser.add_argument("--alertas", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--simbolos", type=int, default=50)
+    parser.add_argument("--ticks", type=int, default=3)
+    parser.add_argument("--modos", nargs="+", default=["indice", "sql"], choices=["indice", "sql"])
+    parser.add_argument("--limites-reales", action="store_true",
+                        help="envía con los límites de Telegram de config.py (mucho más lento)")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="pico de memoria de Python de cada tick (los tiempos salen peores)")
+    parser.add_argument("--en-este-proceso", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.en_este_proceso:
+        for n_alertas in args.alertas:
+            for modo in args.modos:
+                asyncio.run(una_prueba(n_alertas, args.simbolos, modo, args.ticks,
+                                       args.limites_reales, args.tracemalloc))
+        return
+
+    # Una prueba por proceso (ver arriba por qué)
+    for n_alertas in args.alertas:
+        for modo in args.modos:
+            orden = [sys.executable, os.path.abspath(__file__), "--en-este-proceso",
+                     "--alertas", str(n_alertas), "--modos", modo,
+                     "--simbolos", str(args.simbolos), "--ticks", str(args.ticks)]
+            if args.limites_reales:
+                orden.append("--limites-reales")
+            if args.tracemalloc:
+                orden.append("--tracemalloc")
+            subprocess.run(orden, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark del router de intenciones de manejar_texto.
+
+Compara, para catálogos cada vez más grandes (activos sintéticos además de
+los de config.py), los mensajes enrutados por segundo de:
+  - "bucle":  la cadena de re.search de antes (un patrón tras otro)
+  - "router": RouterIntenciones (índice de palabras + regex ya compiladas)
+
+Uso:  python bench_intenciones.py [segundos_por_prueba]
+"""
+import random
+import re
+import sys
+import time
+
+from config import TICKERS_A_VIGILAR
+from intenciones import INTENCIONES_TEXTO, RouterIntenciones
+
+
+MENSAJES_BASE = [
+    "hola",
+    "gracias crack",
+    "dime el precio del sp500",
+    "y el bitcoin?",
+    "mis alertas",
+    "que tienes?",
+    "resumen del mercado",
+    "opciones",
+    "esto no es nada de nada",
+    "jajaja vale",
+]
+
+
+def catalogo_sintetico(n_activos):
+    """Los activos reales + (n_activos - reales) inventados, con alias únicos."""
+    catalogo = list(TICKERS_A_VIGILAR)
+    for i in range(len(catalogo), n_activos):
+        catalogo.append({
+            "alias_general": f"Activo {i}",
+            "patron_regex": rf"\b(act{i}|activo{i}|a{i}x)\b",
+            "tickers": [{"nombre": "ETF", "symbol": f"ACT{i}.DE"}],
+        })
+    return catalogo
+
+
+def mensajes_de_prueba(catalogo):
+    """Mensajes reales + otros que nombran activos del principio, medio y final."""
+    mensajes = list(MENSAJES_BASE)
+    for i in (0, len(catalogo) // 2, len(catalogo) - 1):
+        if i >= len(TICKERS_A_VIGILAR):
+            mensajes.append(f"como va el act{i}?")
+    random.Random(42).shuffle(mensajes)
+    return mensajes
+
+
+def enrutar_con_bucle(texto, catalogo):
+    """La lógica de siempre: un re.search por activo y por intención."""
+    for ticker_info in catalogo:
+        if re.search(ticker_info["patron_regex"], texto):
+            return "ticker", ticker_info
+    for intencion, patron in INTENCIONES_TEXTO:
+        if re.search(patron, texto):
+            return intencion, None
+    return None, None
+
+
+def medir(funcion, mensajes, segundos):
+    """Mensajes por segundo de 'funcion' durante ~'segundos'."""
+    enrutados = 0
+    inicio = time.perf_counter()
+    fin = inicio + segundos
+    while time.perf_counter() < fin:
+        for texto in mensajes:
+            funcion(texto)
+        enrutados += len(mensajes)
+    return enrutados / (time.perf_counter() - inicio)
+
+
+def main():
+    segundos = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+
+    print(f"{'activos':>8} {'bucle (msg/s)':>15} {'router (msg/s)':>15} {'x':>6}")
+    for n_activos in (len(TICKERS_A_VIGILAR), 50, 100, 250, 500, 1000):
+        catalogo = catalogo_sintetico(n_activos)
+        mensajes = mensajes_de_prueba(catalogo)
+
+        inicio = time.perf_counter()
+        router = RouterIntenciones(tickers=catalogo)
+        compilacion = time.perf_counter() - inicio
+
+        # Los dos tienen que decidir LO MISMO
+        for texto in mensajes:
+            assert router.enrutar(texto) == enrutar_con_bucle(texto, catalogo), texto
+
+        bucle = medir(lambda texto: enrutar_con_bucle(texto, catalogo), mensajes, segundos)
+        compilado = medir(router.enrutar, mensajes, segundos)
+        print(f"{n_activos:>8} {bucle:>15,.0f} {compilado:>15,.0f} {compilado / bucle:>6.1f}"
+              f"   (compilar: {compilacion * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Benchmark de MEMORIA de las alertas de bot-con-cache.py: bytes por alerta
+con N alertas (1M por defecto) en cada forma de guardarlas.
+
+  - lista de dicts           -> como estaban en bot_data["user_alerts"]
+  - lista de dicts (JSON)    -> igual, pero con los textos repetidos en cada
+                                alerta (lo que deja un json.load)
+  - dict por ID + por chat   -> {id: dict} + {chat_id: set(ids)} (el
+                                AlmacenAlertas antes de pasarlo a columnas)
+  - AlmacenAlertas           -> columnas (array) + bits + índice por chat
+
+La memoria se mide con tracemalloc (lo que reserva Python al construirlo);
+los tiempos, en otra pasada sin tracemalloc: construirlo y sacar la copia
+que recorre check_all_alerts en cada tick (en AlmacenAlertas, solo las
+columnas que usa: columnas_vivas()). "pico tick" es lo que reserva esa
+copia mientras vive: se suma a la memoria de arriba en cada tick. La
+columna "x" compara con "dict por ID + por chat" (lo que había).
+
+Uso:
+  python bench_memoria.py [--alertas 1000000] [--chats 250000]
+"""
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from config import TICKERS_A_VIGILAR
+from almacen_alertas import AlmacenAlertas
+
+
+def filas_al_azar(n, n_chats, azar):
+    """(ticker, alias, objetivo, chat_id, disparada) como las crean los handlers."""
+    pares = [(info["tickers"][0]["symbol"], info["alias_general"]) for info in TICKERS_A_VIGILAR]
+    chats = [azar.randrange(10**9, 10**10) for _ in range(n_chats)]
+    return [(*azar.choice(pares), round(azar.uniform(10, 1000), 2), azar.choice(chats), azar.random() < 0.1)
+            for _ in range(n)]
+
+
+def lista_de_dicts(filas):
+    return [{"ticker": ticker, "alias": alias, "target": objetivo, "chat_id": chat_id, "triggered": disparada}
+            for ticker, alias, objetivo, chat_id, disparada in filas]
+
+
+def lista_de_dicts_json(filas):
+    return json.loads(json.dumps(lista_de_dicts(filas)))
+
+
+def dict_por_id(filas):
+    alertas, por_chat = {}, {}
+    for alert_id, (ticker, alias, objetivo, chat_id, disparada) in enumerate(filas, 1):
+        alertas[alert_id] = {"ticker": ticker, "alias": alias, "target": objetivo,
+                             "chat_id": chat_id, "triggered": disparada}
+        por_chat.setdefault(chat_id, set()).add(alert_id)
+    return alertas, por_chat
+
+
+def almacen_columnas(filas):
+    almacen = AlmacenAlertas()
+    for fila in filas:
+        almacen.anadir(*fila)
+    return almacen
+
+
+def medir_memoria(construir, filas):
+    """Bytes que reserva construir(filas) (sin contar 'filas')."""
+    gc.collect()
+    tracemalloc.start()
+    resultado = construir(filas)
+    gc.collect()
+    memoria, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del resultado
+    return memoria
+
+
+def medir_pico_copia(construir, copiar, filas):
+    """Bytes que reserva (como máximo) sacar la copia de un tick."""
+    resultado = construir(filas)
+    gc.collect()
+    tracemalloc.start()
+    copia = copiar(resultado)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del copia
+    return pico
+
+
+def medir_tiempos(construir, todas, filas):
+    """(segundos en construir, segundos en sacar la copia de un tick)."""
+    gc.collect()
+    inicio = time.perf_counter()
+    resultado = construir(filas)
+    construido = time.perf_counter()
+    todas(resultado)
+    return construido - inicio, time.perf_counter() - construido
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria por alerta según cómo se guardan")
+    parser.add_argument("--alertas", type=int, default=1_000_000)
+    parser.add_argument("--chats", type=int, help="usuarios distintos (por defecto, alertas / 4)")
+    args = parser.parse_args()
+    n_chats = args.chats or max(1, args.alertas // 4)
+
+    azar = random.Random(1)
+    filas = filas_al_azar(args.alertas, n_chats, azar)
+    print(f"=== {args.alertas:,} alertas de {n_chats:,} chats ===")
+    print(f"{'':<26} {'memoria':>10} {'B/alerta':>9} {'pico tick':>10} {'construir':>10} {'copia':>8}")
+
+    formas = [
+        ("lista de dicts", lista_de_dicts, list),
+        ("lista de dicts (JSON)", lista_de_dicts_json, list),
+        ("dict por ID + por chat", dict_por_id, lambda r: list(r[0].items())),
+        ("AlmacenAlertas", almacen_columnas, lambda r: r.columnas_vivas()),
+    ]
+    medidas = []
+    for nombre, construir, todas in formas:
+        memoria = medir_memoria(construir, filas)
+        pico = medir_pico_copia(construir, todas, filas)
+        medidas.append((nombre, memoria, pico, *medir_tiempos(construir, todas, filas)))
+
+    referencia = medidas[2][1]
+    for nombre, memoria, pico, construir, recorrer in medidas:
+        print(f"{nombre:<26} {memoria / 1e6:>8.1f}MB {memoria / args.alertas:>9.1f} {pico / 1e6:>8.1f}MB "
+              f"{construir * 1000:>8.0f}ms {recorrer * 1000:>6.0f}ms   x{referencia / memoria:.1f}")
+
+
+if __name__ == "__main__":
+    main()
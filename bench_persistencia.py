@@ -0,0 +1,149 @@
+"""
+Benchmark de la persistencia de alertas de bot-con-cache.py (persistencia.py
+sobre el AlmacenAlertas).
+
+Para N alertas (100k por defecto) mide:
+  - tamaño y tiempo de escritura de la foto (comparado con JSON),
+  - tiempo de carga al arrancar: solo foto, y foto + registro de cambios,
+  - que sobrevive a un "crash": registro cortado a medio cambio y foto
+    nueva sin registro nuevo (se comprueba que lo cargado es lo bueno).
+
+Uso:
+  python bench_persistencia.py [--alertas 100000] [--cambios 20000] [--directorio RUTA]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from config import TICKERS_A_VIGILAR
+from almacen_alertas import AlmacenAlertas
+from persistencia import PersistenciaAlertas
+
+
+def alertas_al_azar(n, azar):
+    pares = [(info["tickers"][0]["symbol"], info["alias_general"]) for info in TICKERS_A_VIGILAR]
+    alertas = []
+    for _ in range(n):
+        ticker, alias = azar.choice(pares)
+        alertas.append({"ticker": ticker, "alias": alias, "target": round(azar.uniform(10, 1000), 2),
+                        "chat_id": azar.randrange(10**9, 10**10), "triggered": azar.random() < 0.1})
+    return alertas
+
+
+def cambios_al_azar(almacen, n, azar):
+    """Hace n cambios al almacén (como los handlers y el job de alertas)."""
+    ids = [alerta.id for alerta in almacen.todas()]
+    for alerta in alertas_al_azar(n, azar):
+        tirada = azar.random()
+        if tirada < 0.4 or not ids:
+            ids.append(almacen.anadir(**alerta))
+        elif tirada < 0.6:
+            almacen.borrar(ids.pop(azar.randrange(len(ids))))
+        else:
+            alert_id = azar.choice(ids)
+            almacen.marcar(alert_id, not almacen.obtener(alert_id).triggered)
+
+
+def contenido(almacen):
+    """Lo que tiene que sobrevivir al reinicio: las alertas con su ID y el siguiente ID."""
+    return almacen.todas(), almacen.siguiente_id
+
+
+def cargar(directorio):
+    """Carga como al arrancar el bot. Devuelve (almacén, segundos)."""
+    almacen = AlmacenAlertas()
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        PersistenciaAlertas(directorio).cargar(almacen)
+    return almacen, time.perf_counter() - inicio
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark de persistencia.py")
+    parser.add_argument("--alertas", type=int, default=100_000)
+    parser.add_argument("--cambios", type=int, default=20_000)
+    parser.add_argument("--directorio", help="carpeta de trabajo (por defecto, una temporal)")
+    args = parser.parse_args()
+
+    directorio = args.directorio or tempfile.mkdtemp(prefix="bench_persistencia_")
+    shutil.rmtree(directorio, ignore_errors=True)
+    azar = random.Random(1)
+    alertas = alertas_al_azar(args.alertas, azar)
+    print(f"=== {args.alertas:,} alertas en {directorio} ===")
+
+    # 1. Foto
+    almacen = AlmacenAlertas()
+    persistencia = PersistenciaAlertas(directorio)
+    with contextlib.redirect_stdout(io.StringIO()):
+        persistencia.cargar(almacen)
+        for alerta in alertas:
+            almacen.anadir(**alerta)
+        inicio = time.perf_counter()
+        await persistencia.guardar_foto(almacen)
+    escritura = time.perf_counter() - inicio
+    tamano = os.path.getsize(persistencia.ruta_foto)
+
+    inicio = time.perf_counter()
+    texto_json = json.dumps(alertas)
+    escritura_json = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    json.loads(texto_json)
+    carga_json = time.perf_counter() - inicio
+
+    cargado, carga = cargar(directorio)
+    assert contenido(cargado) == contenido(almacen)
+    print(f"{'':<26} {'tamaño':>10} {'B/alerta':>9} {'escribir':>10} {'cargar':>10}")
+    print(f"{'foto binaria':<26} {tamano / 1e6:>8.2f}MB {tamano / len(alertas):>9.1f} "
+          f"{escritura * 1000:>8.0f}ms {carga * 1000:>8.0f}ms")
+    print(f"{'JSON (referencia)':<26} {len(texto_json) / 1e6:>8.2f}MB {len(texto_json) / len(alertas):>9.1f} "
+          f"{escritura_json * 1000:>8.0f}ms {carga_json * 1000:>8.0f}ms")
+
+    # 2. Foto + registro de cambios (lo normal tras un apagón)
+    cambios_al_azar(almacen, args.cambios, azar)
+    inicio = time.perf_counter()
+    await persistencia.volcar()
+    volcado = time.perf_counter() - inicio
+    tamano_registro = os.path.getsize(persistencia.ruta_registro)
+    cargado, carga = cargar(directorio)
+    assert contenido(cargado) == contenido(almacen)
+    print(f"\n{args.cambios:,} cambios en el registro ({tamano_registro / 1e6:.2f} MB, volcados en "
+          f"{volcado * 1000:.0f} ms) -> carga foto + registro: {carga * 1000:.0f} ms")
+
+    # 3. Crash a medio escribir un cambio: se pierde SOLO ese cambio
+    bueno = contenido(almacen)
+    almacen.borrar(almacen.todas()[0].id)
+    await persistencia.volcar()
+    with open(persistencia.ruta_registro, "r+b") as fichero:
+        fichero.truncate(os.path.getsize(persistencia.ruta_registro) - 3)
+    cargado, _ = cargar(directorio)
+    assert contenido(cargado) == bueno, "el cambio cortado debería ignorarse"
+    print("Crash a medio escribir el registro: OK (se ignora el cambio cortado)")
+
+    # 4. Crash entre la foto nueva y el registro nuevo: el registro viejo se ignora
+    almacen = AlmacenAlertas()
+    persistencia = PersistenciaAlertas(directorio)
+    with contextlib.redirect_stdout(io.StringIO()):
+        persistencia.cargar(almacen)
+        cambios_al_azar(almacen, 100, azar)
+        await persistencia.volcar()
+        registro_viejo = open(persistencia.ruta_registro, "rb").read()
+        await persistencia.guardar_foto(almacen)
+    with open(persistencia.ruta_registro, "wb") as fichero:
+        fichero.write(registro_viejo)  # (como si no hubiera dado tiempo a cambiarlo)
+    cargado, _ = cargar(directorio)
+    assert contenido(cargado) == contenido(almacen), "el registro de la generación anterior debería ignorarse"
+    print("Crash entre foto y registro nuevos: OK (el registro viejo se ignora)")
+
+    if not args.directorio:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
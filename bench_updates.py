@@ -0,0 +1,282 @@
+"""
+Banco de carga EN PROCESO para los handlers de bot.py.
+
+Monta la Application con los handlers REALES (bot.registrar_handlers) y le
+mete Updates sintéticos con 'application.process_update' (sin red):
+  - textos ('sp500', 'hola', 'resumen', 'mis alertas', charla...)
+  - botones 'ticker:N', 'resumen' y 'delete_alert:ID'
+  - conversaciones /alerta completas (comando -> botón -> precio)
+
+Lo de fuera va con dobles:
+  - Bot: una "request" falsa que contesta como la Bot API (con latencia opcional)
+  - Yahoo: la caché REAL de cotizaciones con un descargador falso
+  - BD: alertas en memoria (insertar / listar / borrar)
+
+Para cada nivel de concurrencia (nº de "usuarios" a la vez) da updates/s y
+la latencia p50/p99 por update, en total y por tipo de update.
+
+Uso:
+  python bench_updates.py [--updates 2000] [--concurrencia 1 4 16 64]
+                          [--latencia-telegram MS] [--latencia-yahoo MS]
+                          [--latencia-bd MS] [--sin-foto]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import time
+import warnings
+from collections import defaultdict
+
+# bot.py exige estas variables al importarse (aquí no se usan de verdad)
+os.environ.setdefault("MI_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("MI_CHAT_ID", "1")
+os.environ.setdefault("DATABASE_URL", "postgresql://benchmark")
+
+from telegram import Update  # noqa: E402
+from telegram.ext import ApplicationBuilder  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+from telegram.warnings import PTBUserWarning  # noqa: E402
+
+import bot  # noqa: E402
+import cotizaciones  # noqa: E402
+from config import TICKERS_A_VIGILAR  # noqa: E402
+
+
+TOKEN = "123456:BENCHMARK"
+
+
+class RequestFalsa(BaseRequest):
+    """Contesta a la Bot API sin salir a la red (y cuenta las llamadas por método)."""
+
+    def __init__(self, latencia=0.0):
+        self._latencia = latencia
+        self._ids = itertools.count(1)
+        self.llamadas = defaultdict(int)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        metodo = url.rsplit("/", 1)[-1]
+        self.llamadas[metodo] += 1
+        if self._latencia:
+            await asyncio.sleep(self._latencia)
+
+        parametros = request_data.parameters if request_data else {}
+        if metodo == "getMe":
+            resultado = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif metodo in ("sendMessage", "editMessageText"):
+            resultado = {
+                "message_id": next(self._ids),
+                "date": int(time.time()),
+                "chat": {"id": parametros.get("chat_id", 1), "type": "private"},
+                "text": parametros.get("text", ""),
+            }
+        else:
+            resultado = True
+        return 200, json.dumps({"ok": True, "result": resultado}).encode("utf-8")
+
+
+class BaseDatosMemoria:
+    """Lo que usan los handlers de base_datos.py, con las alertas en un dict."""
+
+    def __init__(self, latencia=0.0):
+        self._latencia = latencia
+        self._ids = itertools.count(1)
+        self.alertas = {}  # id -> (chat_id, alias, ticker, target, moneda)
+
+    async def _esperar(self):
+        if self._latencia:
+            await asyncio.sleep(self._latencia)
+
+    async def insertar_alerta(self, chat_id, ticker_simbolo, alias_general, target_price, moneda):
+        await self._esperar()
+        alert_id = next(self._ids)
+        self.alertas[alert_id] = (chat_id, alias_general, ticker_simbolo, target_price, moneda)
+        return alert_id
+
+    async def alertas_de_chat(self, chat_id):
+        await self._esperar()
+        return [(alert_id, alias, ticker, target, moneda)
+                for alert_id, (chat, alias, ticker, target, moneda) in self.alertas.items() if chat == chat_id]
+
+    async def borrar_alerta(self, alert_id, chat_id):
+        await self._esperar()
+        alerta = self.alertas.get(alert_id)
+        if alerta is None or alerta[0] != chat_id:
+            return None
+        del self.alertas[alert_id]
+        return alerta[1]
+
+    def metricas_pool(self):
+        return {"tamano": 1, "libres": 1, "maximo": 1, "en_uso": 0, "esperando": 0, "fallos_adquisicion": 0, "fallos_arranque": 0}
+
+
+def yahoo_falso(latencia):
+    """Descargadores falsos (individual y en lote) para la caché REAL de cotizaciones."""
+    def descargar(simbolo):
+        time.sleep(latencia)
+        return 100.0, "EUR", 0.5
+
+    def descargar_lote(simbolos):
+        time.sleep(latencia)
+        return {simbolo: (100.0, "EUR", 0.5) for simbolo in simbolos}
+
+    return descargar, descargar_lote
+
+
+# --- Updates sintéticos ---
+
+_ids_update = itertools.count(1)
+TEXTOS = ["sp500", "como va el bitcoin", "oro", "hola", "gracias crack", "resumen", "mis alertas",
+          "que tienes", "opciones", "esto no es nada"]
+
+
+def _usuario(chat_id):
+    return {"id": chat_id, "is_bot": False, "first_name": f"Usuario {chat_id}"}
+
+
+def _mensaje(chat_id, texto):
+    mensaje = {
+        "message_id": next(_ids_update),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": _usuario(chat_id),
+        "text": texto,
+    }
+    if texto.startswith("/"):
+        mensaje["entities"] = [{"type": "bot_command", "offset": 0, "length": len(texto.split()[0])}]
+    return mensaje
+
+
+def update_texto(application, chat_id, texto):
+    return Update.de_json({"update_id": next(_ids_update), "message": _mensaje(chat_id, texto)}, application.bot)
+
+
+def update_boton(application, chat_id, datos):
+    return Update.de_json({
+        "update_id": next(_ids_update),
+        "callback_query": {
+            "id": str(next(_ids_update)),
+            "from": _usuario(chat_id),
+            "chat_instance": str(chat_id),
+            "data": datos,
+            "message": _mensaje(chat_id, "menú"),
+        },
+    }, application.bot)
+
+
+def guion_al_azar(application, azar, chat_id, bd):
+    """
+    Una "sesión" de un usuario: lista de (tipo, update) que van EN ORDEN
+    (una conversación /alerta son 3 updates seguidos del mismo usuario).
+    """
+    tirada = azar.random()
+    if tirada < 0.45:
+        texto = azar.choice(TEXTOS)
+        return [(f"texto:{texto}", update_texto(application, chat_id, texto))]
+    if tirada < 0.65:
+        datos = f"ticker:{azar.randrange(len(TICKERS_A_VIGILAR))}"
+        return [("boton:ticker", update_boton(application, chat_id, datos))]
+    if tirada < 0.75:
+        return [("boton:resumen", update_boton(application, chat_id, "resumen"))]
+    if tirada < 0.85:
+        # Borra una alerta suya si tiene (si no, una que no existe)
+        suyas = [alert_id for alert_id, alerta in list(bd.alertas.items()) if alerta[0] == chat_id]
+        alert_id = suyas[0] if suyas else 10**9
+        return [("boton:delete_alert", update_boton(application, chat_id, f"delete_alert:{alert_id}"))]
+    return [
+        ("alerta:comando", update_texto(application, chat_id, "/alerta")),
+        ("alerta:boton", update_boton(application, chat_id, f"ticker:{azar.randrange(len(TICKERS_A_VIGILAR))}")),
+        ("alerta:precio", update_texto(application, chat_id, f"{azar.randint(50, 150)}")),
+    ]
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    return valores_ordenados[min(len(valores_ordenados) - 1, int(len(valores_ordenados) * p))]
+
+
+async def una_ronda(application, bd, n_updates, concurrencia, semilla):
+    """'concurrencia' usuarios a la vez, cada uno con sus sesiones en orden."""
+    azar = random.Random(semilla)
+    latencias = defaultdict(list)
+    pendientes = [n_updates]
+
+    async def usuario(chat_id):
+        while pendientes[0] > 0:
+            guion = guion_al_azar(application, azar, chat_id, bd)
+            pendientes[0] -= len(guion)
+            for tipo, update in guion:
+                inicio = time.perf_counter()
+                await application.process_update(update)
+                latencias[tipo].append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # (los handlers hacen print)
+        await asyncio.gather(*(usuario(50_000 + semilla * 1000 + i) for i in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+    return latencias, duracion
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Carga en proceso de los handlers de bot.py")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrencia", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--latencia-telegram", type=float, default=0.0, help="ms por llamada a la Bot API")
+    parser.add_argument("--latencia-yahoo", type=float, default=50.0, help="ms por descarga de Yahoo")
+    parser.add_argument("--latencia-bd", type=float, default=0.0, help="ms por consulta a la BD")
+    parser.add_argument("--sin-foto", action="store_true",
+                        help="sin la foto del prefetch: todo pasa por la caché de cotizaciones")
+    args = parser.parse_args()
+
+    # Dobles: Yahoo (caché REAL con descargador falso) y BD en memoria
+    cotizaciones.cache_cotizaciones = cotizaciones.CacheCotizaciones(*yahoo_falso(args.latencia_yahoo / 1000))
+    bd = BaseDatosMemoria(args.latencia_bd / 1000)
+    bot.base_datos = bd
+
+    request = RequestFalsa(args.latencia_telegram / 1000)
+    warnings.filterwarnings("ignore", category=PTBUserWarning)  # (ConversationHandler + per_message)
+    application = ApplicationBuilder().token(TOKEN).request(request).updater(None).build()
+    bot.registrar_handlers(application)
+
+    await application.initialize()
+    try:
+        for ronda, concurrencia in enumerate(args.concurrencia):
+            if not args.sin_foto:
+                # Como en producción: el prefetch ya ha publicado la foto de precios
+                cotizaciones.publicar_foto({simbolo: (100.0, "EUR", 0.5) for simbolo in bot.SIMBOLOS_A_VIGILAR})
+            cotizaciones.cache_cotizaciones = cotizaciones.CacheCotizaciones(*yahoo_falso(args.latencia_yahoo / 1000))
+
+            latencias, duracion = await una_ronda(application, bd, args.updates, concurrencia, ronda)
+            todas = sorted(itertools.chain.from_iterable(latencias.values()))
+            print(f"\n=== concurrencia {concurrencia}: {len(todas):,} updates en {duracion:.2f}s "
+                  f"-> {len(todas) / duracion:,.0f} updates/s | "
+                  f"p50 {percentil(todas, 0.5) * 1000:.2f} ms, p99 {percentil(todas, 0.99) * 1000:.2f} ms ===")
+            print(f"{'tipo de update':<28} {'n':>6} {'p50 ms':>9} {'p99 ms':>9}")
+            for tipo in sorted(latencias):
+                valores = sorted(latencias[tipo])
+                print(f"{tipo:<28} {len(valores):>6} {percentil(valores, 0.5) * 1000:>9.2f} "
+                      f"{percentil(valores, 0.99) * 1000:>9.2f}")
+    finally:
+        await application.shutdown()
+
+    print(f"\nLlamadas a la Bot API: {dict(request.llamadas)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -51,7 +51,19 @@ from config import (
     PATRON_TODO,
     POSIBLES_SALUDOS,
     POSIBLES_DE_NADA,
-    PATRON_MIS_ALERTAS)
+    PATRON_MIS_ALERTAS,
+    PERSISTENCIA_DIRECTORIO,
+    PERSISTENCIA_INTERVALO_VOLCADO)
+# ------------------------------------
+
+# --- Alertas en memoria (con IDs fijos) + persistencia en disco ---
+# El almacén apunta cada cambio en la persistencia y un job lo vuelca al
+# disco (ver almacen_alertas.py y persistencia.py)
+from almacen_alertas import AlmacenAlertas
+from persistencia import PersistenciaAlertas, ErrorPersistencia
+
+almacen_alertas = AlmacenAlertas()
+persistencia_alertas = PersistenciaAlertas(os.environ.get("DATOS_DIR", PERSISTENCIA_DIRECTORIO))
 # ------------------------------------
 
 # Configuramos el logging para ver qué pasa 
@@ -376,26 +388,16 @@ async def nueva_alerta(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
         
     # 3. Creamos y guardamos la alerta
-    if "user_alerts" not in context.bot_data:
-        context.bot_data["user_alerts"] = []
-
     # (Nota: Coge el primer ticker de la lista, ej: SXR8.DE para SP500)
     ticker_simbolo = ticker_info_encontrada["tickers"][0]["symbol"]
+    alias = ticker_info_encontrada["alias_general"]
     
-    nueva_alerta_data = {
-        "ticker": ticker_simbolo,
-        "alias": ticker_info_encontrada["alias_general"],
-        "target": target_price,
-        "chat_id": chat_id, # ¡Alerta personalizada para quien la pide!
-        "triggered": False
-    }
-    
-    context.bot_data["user_alerts"].append(nueva_alerta_data)
+    almacen_alertas.anadir(ticker_simbolo, alias, target_price, chat_id) # ¡Alerta personalizada para quien la pide!
     
     # 4. Confirmamos
     mensaje = (
         f"¡Alerta Creada! ✅\n\n"
-        f"Vigilaré *{nueva_alerta_data['alias']}* y te avisaré si baja de *{target_price:,.2f}*"
+        f"Vigilaré *{alias}* y te avisaré si baja de *{target_price:,.2f}*"
     )
     await update.message.reply_text(mensaje, parse_mode="Markdown")
     
@@ -484,17 +486,8 @@ async def conv_precio_recibido(update: Update, context: ContextTypes.DEFAULT_TYP
         return STATE_SET_PRICE # Nos quedamos en este paso
 
     # 3. ¡TENEMOS TODO! Creamos y guardamos la alerta (en la "memoria a largo plazo")
-    if "user_alerts" not in context.bot_data:
-        context.bot_data["user_alerts"] = []
-
-    nueva_alerta_data = {
-        "ticker": ticker_info["tickers"][0]["symbol"],
-        "alias": ticker_info["alias_general"],
-        "target": target_price,
-        "chat_id": update.message.chat_id,
-        "triggered": False
-    }
-    context.bot_data["user_alerts"].append(nueva_alerta_data)
+    alias = ticker_info["alias_general"]
+    almacen_alertas.anadir(ticker_info["tickers"][0]["symbol"], alias, target_price, update.message.chat_id)
     
     # 4. Limpiamos la memoria a corto plazo
     context.user_data.clear()
@@ -502,7 +495,7 @@ async def conv_precio_recibido(update: Update, context: ContextTypes.DEFAULT_TYP
     # 5. Confirmamos y terminamos
     mensaje = (
         f"¡Alerta Creada! ✅\n\n"
-        f"Vigilaré *{nueva_alerta_data['alias']}* y te avisaré si baja de *{target_price:,.2f}*\n\n"
+        f"Vigilaré *{alias}* y te avisaré si baja de *{target_price:,.2f}*\n\n"
         "Puedes verla con /misalertas."
     )
     await update.message.reply_text(mensaje, parse_mode="Markdown")
@@ -521,13 +514,9 @@ async def mis_alertas(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Muestra las alertas activas del usuario (con tickers) y botones para borrar."""
     
     chat_id = update.message.chat_id
-    user_alerts = context.bot_data.get("user_alerts", [])
     
-    # Filtramos la lista para mostrar solo las de ESTE usuario
-    alertas_de_este_usuario = []
-    for i, alert in enumerate(user_alerts):
-        if alert.get("chat_id") == chat_id:
-            alertas_de_este_usuario.append((i, alert)) # Guardamos (índice_global, alerta)
+    # Solo las de ESTE usuario (índice por chat: no recorre las de los demás)
+    alertas_de_este_usuario = almacen_alertas.de_chat(chat_id) # [Alerta(id, ticker, alias...)...]
     
     if not alertas_de_este_usuario:
         await update.message.reply_text("No tienes ninguna alerta activa.\nCrea una con /alerta <trigger> <precio>")
@@ -536,10 +525,10 @@ async def mis_alertas(update: Update, context: ContextTypes.DEFAULT_TYPE):
     keyboard = []
     partes_del_mensaje = ["Tus Alertas Activas:\n"]
     
-    for i_global, alert in alertas_de_este_usuario:
-        alias = alert['alias']
-        target = alert['target']
-        ticker = alert['ticker'] # <-- ¡AQUÍ ESTÁ!
+    for alert in alertas_de_este_usuario:
+        alias = alert.alias
+        target = alert.target
+        ticker = alert.ticker # <-- ¡AQUÍ ESTÁ!
         
         # --- ¡MODIFICADO! ---
         # Añadimos el '(ticker)'
@@ -548,7 +537,7 @@ async def mis_alertas(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Creamos un botón de borrado para CADA alerta
         boton = InlineKeyboardButton(
             text=f"Borrar {alias} ({ticker})", # <-- (Lo añado aquí también) 
-            callback_data=f"delete_alert:{i_global}"
+            callback_data=f"delete_alert:{alert.id}"
         )
         keyboard.append([boton])
     
@@ -566,18 +555,20 @@ async def borrar_alerta_callback(update: Update, context: ContextTypes.DEFAULT_T
     await query.answer()
     
     try:
-        prefix, index_str = query.data.split(":")
-        index = int(index_str)
-        
-        # Borramos la alerta de la lista global usando su índice
-        alert_borrada = context.bot_data["user_alerts"].pop(index)
-        alias = alert_borrada["alias"]
-        
-        # Editamos el mensaje original para confirmar
-        await query.edit_message_text(f"Alerta para *{alias}* borrada con éxito.", parse_mode="Markdown")
-        
-    except (ValueError, IndexError, KeyError):
+        prefix, id_str = query.data.split(":")
+        alert_id = int(id_str)
+    except ValueError:
+        alert_id = None
+
+    # Borramos por su ID (y solo si es de quien pulsa el botón)
+    alert_borrada = almacen_alertas.borrar(alert_id, query.message.chat_id) if alert_id is not None else None
+    if alert_borrada is None:
         await query.edit_message_text("Error al borrar la alerta. Ya no existe o está corrupta.")
+        return
+
+    # Editamos el mensaje original para confirmar
+    alias = alert_borrada.alias
+    await query.edit_message_text(f"Alerta para *{alias}* borrada con éxito.", parse_mode="Markdown")
  
 
 async def check_all_alerts(context: ContextTypes.DEFAULT_TYPE):
@@ -586,42 +577,51 @@ async def check_all_alerts(context: ContextTypes.DEFAULT_TYPE):
     ¡RECORRE TODAS LAS ALERTAS DE TODOS LOS USUARIOS!
     """
     
-    # 1. Obtiene la lista de alertas. Si no existe, la crea vacía.
-    if "user_alerts" not in context.bot_data:
-        context.bot_data["user_alerts"] = []
-
-    user_alerts = context.bot_data["user_alerts"]
+    # 1. Copia de SOLO las columnas que hacen falta (ID, objetivo, par, disparada):
+    #    se puede recorrer aunque otros usuarios creen o borren alertas durante los 'await'
+    ids, objetivos, pares, disparadas, lista_pares = almacen_alertas.columnas_vivas()
     
-    if not user_alerts:
+    if not ids:
         print("JobQueue: No hay alertas de usuario que comprobar. Durmiendo.")
         return
 
-    print(f"JobQueue: Comprobando {len(user_alerts)} alerta(s) de usuario...")
+    print(f"JobQueue: Comprobando {len(ids)} alerta(s) de usuario...")
+
+    # 2. Un precio por TICKER (no uno por alerta), solo de los que tienen alertas
+    precio_del_ticker = {}
+    for numero in set(pares):
+        ticker_simbolo = lista_pares[numero][0]
+        if ticker_simbolo not in precio_del_ticker:
+            precio_del_ticker[ticker_simbolo] = obtener_precio_actual(ticker_simbolo)
+            if precio_del_ticker[ticker_simbolo][0] is None:
+                print(f"JobQueue: No se pudo obtener el precio para {ticker_simbolo}. Saltando sus alertas.")
+    # nº de par -> (precio, moneda)
+    precio_del_par = [precio_del_ticker.get(ticker_simbolo, (None, None)) for ticker_simbolo, _ in lista_pares]
 
     # Creamos una lista de alertas para eliminar (si dan error)
     alerts_to_remove = []
 
-    # 2. Recorre cada alerta que los usuarios han creado
-    # Usamos enumerate() para poder borrar por índice si algo falla
-    for i, alert in enumerate(user_alerts):
-        
+    # 3. Recorre las columnas: solo las alertas que CAMBIAN de estado se miran en el almacén
+    for alert_id, target_price, numero, is_triggered in zip(ids, objetivos, pares, disparadas):
+        precio, moneda = precio_del_par[numero]
+        if precio is None:
+            continue
+        cambia = precio > target_price if is_triggered else precio < target_price
+        if not cambia:
+            continue
+
+        alert = almacen_alertas.obtener(alert_id)
+        if alert is None:
+            continue # La han borrado mientras tanto
+
         try:
-            ticker_simbolo = alert["ticker"]
-            ticker_alias = alert["alias"]
-            target_price = alert["target"]
-            chat_id_aviso = alert["chat_id"]
-            is_triggered = alert.get("triggered", False)
-
-            # 3. Obtenemos el precio real
-            precio, moneda = obtener_precio_actual(ticker_simbolo)
-            
-            if precio is None:
-                print(f"JobQueue: No se pudo obtener el precio para {ticker_alias}. Saltando.")
-                continue # Pasa a la siguiente alerta del bucle
+            ticker_alias = alert.alias
+            chat_id_aviso = alert.chat_id
 
             # 4. Lógica de la Alerta (¡Tu código, pero con variables!)
-            if precio < target_price and not is_triggered:
+            if not is_triggered:
                 print(f"JobQueue: ¡ALERTA DISPARADA! {ticker_alias} < {target_price}")
+                almacen_alertas.marcar(alert_id, True) # Actualiza el estado
                 
                 mensaje = (
                     f"🔔 *¡ALERTA DE PRECIO!* 🔔\n\n"
@@ -631,10 +631,10 @@ async def check_all_alerts(context: ContextTypes.DEFAULT_TYPE):
                 )
                 
                 await context.bot.send_message(chat_id=chat_id_aviso, text=mensaje, parse_mode="Markdown")
-                alert["triggered"] = True # Actualiza el estado en la lista
 
-            elif precio > target_price and is_triggered:
+            else:
                 print(f"JobQueue: ALERTA RE-ARMADA. {ticker_alias} > {target_price}")
+                almacen_alertas.marcar(alert_id, False) # Actualiza el estado
                 
                 mensaje = (
                     f"✅ *Alerta Reactivada* ✅\n\n"
@@ -643,18 +643,25 @@ async def check_all_alerts(context: ContextTypes.DEFAULT_TYPE):
                 )
                 
                 await context.bot.send_message(chat_id=chat_id_aviso, text=mensaje, parse_mode="Markdown")
-                alert["triggered"] = False # Actualiza el estado
 
         except Exception as e:
             print(f"JobQueue: Error procesando alerta {alert}: {e}. Se marcará para borrar.")
             # Si una alerta está corrupta o falla, la borramos
-            alerts_to_remove.append(i)
+            alerts_to_remove.append(alert_id)
 
     # 5. Limpiamos las alertas que fallaron (si las hubo)
-    # Iteramos a la inversa para no fastidiar los índices
-    for i in sorted(alerts_to_remove, reverse=True):
-        del context.bot_data["user_alerts"][i]
-        
+    for alert_id in alerts_to_remove:
+        almacen_alertas.borrar(alert_id)
+
+
+async def persistir_alertas(context: ContextTypes.DEFAULT_TYPE):
+    """Job: vuelca al disco los cambios de las alertas (y a veces una foto entera)."""
+    await persistencia_alertas.persistir(almacen_alertas)
+
+
+async def al_apagar(application):
+    """Al parar el bot: foto final, así el siguiente arranque no lee registro."""
+    await persistencia_alertas.guardar_foto(almacen_alertas)
     
 
    
@@ -676,7 +683,14 @@ if __name__ == '__main__':
     print(f"Servidor farsante iniciado en un hilo.")
 
     # 3. Iniciamos el BOT
-    application = ApplicationBuilder().token(MI_TOKEN).build()
+    application = ApplicationBuilder().token(MI_TOKEN).post_shutdown(al_apagar).build()
+
+    # Recuperamos las alertas que había al apagar (o al morir) la última vez
+    try:
+        persistencia_alertas.cargar(almacen_alertas)
+    except (OSError, ErrorPersistencia) as error:
+        print("!!! ERROR CRÍTICO: No se pudieron cargar las alertas guardadas !!!", error)
+        exit()
 
     # --- ¡EL NUEVO ORDEN! ---
     
@@ -717,6 +731,7 @@ if __name__ == '__main__':
     # --- Registra el "JobQueue" ---
     job_queue = application.job_queue
     job_queue.run_repeating(check_all_alerts, interval=300, first=10) # 5 min
+    job_queue.run_repeating(persistir_alertas, interval=PERSISTENCIA_INTERVALO_VOLCADO)
     
     # 4. El bot se queda aquí
     print("Iniciando el polling del bot y la JobQueue...")
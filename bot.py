@@ -1,13 +1,11 @@
-import yfinance as yf
 import logging
 import random
-import re
 import os
-import threading
-import psycopg2
-from psycopg2 import pool
+import asyncio
+import secrets
+import signal
+import time
 from dotenv import load_dotenv
-from flask import Flask
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup 
 from telegram.ext import (
     ApplicationBuilder, 
@@ -22,19 +20,72 @@ from telegram.ext import (
 # Estados de la conversación
 STATE_CHOOSE_TICKER, STATE_SET_PRICE = range(2)
 
-# --- SERVIDOR FARSANTE PARA KOYEB ---
-app = Flask(__name__)
+# --- SERVIDOR WEB (health check de Koyeb, métricas y webhook) ---
+# Un único servidor asyncio en $PORT, dentro del bucle del bot (ver servidor_web.py)
+from servidor_web import ServidorWeb, Respuesta, respuesta_texto, respuesta_json
+from webhook import ejecutar_webhook
+from salud import monitor_salud
+from metricas import registro, cronometrar
 
-@app.route('/')
-def hello():
+servidor_web = ServidorWeb()
+
+async def hello(peticion):
     """Respuesta 'estoy vivo' para el health check de Koyeb."""
-    return "Bot is alive!"
+    return respuesta_texto(200, "Bot is alive!")
+
+async def metricas_pool(peticion):
+    """Métricas en vivo del pool de conexiones de la BD (para dimensionarlo)."""
+    return respuesta_json(200, base_datos.metricas_pool())
+
+servidor_web.ruta("GET", "/", hello)
+servidor_web.ruta("GET", "/metricas/pool", metricas_pool)
+# --------------------------------------
 
-def run_web_server():
-    """Ejecuta el servidor web en el puerto que Koyeb asigne."""
-    # Koyeb (y otros) nos dice el puerto a usar en la variable $PORT
-    port = int(os.environ.get("PORT", 8080))
-    app.run(host='0.0.0.0', port=port)
+
+# --- MÉTRICAS (formato Prometheus, en /metrics) ---
+# (las de Yahoo están en cotizaciones.py y las de envíos en notificaciones.py)
+_latencia_handlers = registro.histograma(
+    "bot_handler_duracion_segundos", "Duración de cada handler de Telegram", ["handler"])
+_duracion_tick = registro.histograma(
+    "alertas_tick_duracion_segundos", "Duración de cada check_all_alerts",
+    limites=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+_alertas_evaluadas = registro.contador(
+    "alertas_evaluadas_total", "Alertas comparadas con un precio en check_all_alerts")
+_alertas_disparadas = registro.contador(
+    "alertas_disparadas_total", "Alertas que se han disparado")
+_alertas_rearmadas = registro.contador(
+    "alertas_rearmadas_total", "Alertas que se han vuelto a armar")
+
+registro.calibre("bd_conexiones_en_uso", "Conexiones del pool prestadas ahora mismo",
+                 lambda: base_datos.metricas_pool()["en_uso"])
+registro.calibre("bd_esperando_conexion", "Peticiones esperando una conexión libre del pool",
+                 lambda: base_datos.metricas_pool()["esperando"])
+registro.calibre("avisos_en_cola", "Avisos de alertas pendientes de enviar",
+                 lambda: despachador.estadisticas()["en_cola"])
+registro.calibre("alertas_en_indice", "Alertas cargadas en el índice en memoria",
+                 lambda: len(indice_alertas))
+
+async def metricas_prometheus(peticion):
+    """Todas las métricas del bot, para que las recoja Prometheus."""
+    return Respuesta(200, "text/plain; version=0.0.4; charset=utf-8", registro.texto().encode("utf-8"))
+
+servidor_web.ruta("GET", "/metrics", metricas_prometheus)
+
+
+def medir_handlers(handlers):
+    """
+    Envuelve el callback de cada handler (también los de dentro de un
+    ConversationHandler) para apuntar su duración en /metrics.
+    """
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            medir_handlers(handler.entry_points)
+            for handlers_del_estado in handler.states.values():
+                medir_handlers(handlers_del_estado)
+            medir_handlers(handler.fallbacks)
+        else:
+            nombre = handler.callback.__name__
+            handler.callback = cronometrar(_latencia_handlers, handler=nombre)(handler.callback)
 # --------------------------------------
 
 
@@ -44,6 +95,15 @@ MI_TOKEN = os.environ.get("MI_TOKEN")
 MI_CHAT_ID = os.environ.get("MI_CHAT_ID")
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
+# Koyeb (y otros) nos dice el puerto a usar en la variable $PORT
+PUERTO = int(os.environ.get("PORT", 8080))
+
+# Modo WEBHOOK: URL pública del bot (ej: https://mi-bot.koyeb.app).
+# Si no está, el bot usa polling como siempre.
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+# Token que Telegram nos devuelve en cada update (si no se pone, uno al azar en cada arranque)
+WEBHOOK_SECRETO = os.environ.get("WEBHOOK_SECRETO") or secrets.token_urlsafe(32)
+
 
 if not MI_TOKEN:
     print("!!! ERROR CRÍTICO: No se encontró la variable de entorno MI_TOKEN !!!")
@@ -55,27 +115,26 @@ if not DATABASE_URL:
 
 
 # --- ¡NUEVO! Conexión a la Base de Datos ---
-# Creamos un "pool" de conexiones. Es como una caja de herramientas de BD.
-print("Creando pool de conexiones a la base de datos...")
-try:
-    db_pool = psycopg2.pool.SimpleConnectionPool(1, 5, dsn=DATABASE_URL)
-    print("Pool de conexiones creado con éxito.")
-except (Exception, psycopg2.Error) as error:
-    print("!!! ERROR CRÍTICO: No se pudo conectar a la base de datos !!!", error)
-    exit()
+# El pool es ASYNC (asyncpg, ver base_datos.py) y se crea al arrancar la
+# Application, dentro del bucle de eventos (ver 'al_arrancar').
+import base_datos
+import migraciones
+from base_datos import ErrorBD, BaseDatosOcupada
+
+# Lo que ve el usuario si el pool está agotado (en vez del error en crudo)
+MENSAJE_BD_OCUPADA = "Ahora mismo estoy atendiendo a mucha gente 😅\nPrueba otra vez en unos segundos."
 # ----------------------------------------
 
 
 from config import (
     TICKERS_A_VIGILAR,
-    PATRON_SALUDO,
-    PATRON_GRACIAS,
-    PATRON_TICKERS,
-    PATRON_OPCIONES,
-    PATRON_TODO,
     POSIBLES_SALUDOS,
     POSIBLES_DE_NADA,
-    PATRON_MIS_ALERTAS)
+    TIMEOUT_RESUMEN,
+    INTERVALO_PREFETCH,
+    MAX_EDAD_RESUMEN,
+    MODO_EVALUACION_ALERTAS,
+    WEBHOOK_RUTA)
 # ------------------------------------
 
 # Configuramos el logging para ver qué pasa 
@@ -87,70 +146,46 @@ logging.basicConfig(
 
 # --- 1. Lógica del Mercado  ---
 
-def obtener_precio_actual(ticker_simbolo):
-    """
-    Obtiene el último precio del ticker Y EL CAMBIO DIARIO.
-    Devuelve (precio_actual, moneda, percent_change) o (None, None, None).
-    """
-    print(f"Buscando datos de [{ticker_simbolo}]...")
-    try:
-        ticker = yf.Ticker(ticker_simbolo)
-        info_rapida = ticker.fast_info
-        
-        precio_actual = info_rapida['last_price']
-        moneda = info_rapida['currency']
-        
-        # --- ¡NUEVA LÓGICA! ---
-        precio_anterior = info_rapida.get('previousClose')
-        percent_change = None
-        
-        if precio_anterior and precio_actual:
-            # Calculamos el % de cambio
-            percent_change = ((precio_actual - precio_anterior) / precio_anterior) * 100
-        # ----------------------
-            
-        return precio_actual, moneda, percent_change 
-
-    except Exception as e:
-        print(f"*** ERROR al obtener precio para {ticker_simbolo}: {e} ***")
-        return None, None, None
+# (La descarga y la caché compartida viven en cotizaciones.py)
+from cotizaciones import (
+    obtener_precio_async,
+    obtener_varios_async,
+    obtener_con_foto,
+    precios_de_la_foto,
+    publicar_foto,
+    precargar_yfinance,
+    cache_cotizaciones)
+
+from indice_alertas import Alerta, IndiceAlertas
+from notificaciones import Despachador
+from intenciones import router_intenciones, indice_alias
+
+# Índice en memoria de las alertas de la BD (se carga en el primer tick)
+indice_alertas = IndiceAlertas()
+
+# Cola + trabajadores que envían los avisos de alertas (se arranca al iniciar)
+despachador = Despachador()
+
+# Todos los símbolos de TICKERS_A_VIGILAR (los que mantiene calientes el prefetch)
+SIMBOLOS_A_VIGILAR = [
+    ticker_a_buscar["symbol"]
+    for ticker_info in TICKERS_A_VIGILAR
+    for ticker_a_buscar in ticker_info["tickers"]
+]
 
 # --- 2. Lógica de Comandos del Bot ---
 async def init_db(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    ¡Comando de un solo uso! Crea la tabla de alertas en la BD.
+    (Admin) Vuelve a pasar las migraciones. Ya NO hace falta: se pasan solas
+    al arrancar el bot. Se deja por si acaso.
     """
-    conn = None
     try:
-        # Pide una conexión del pool
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
+        version = await migraciones.migrar()
+        await update.message.reply_text(f"¡Base de datos al día! Esquema en la versión {version}.")
         
-        # Esta es la "sentencia" SQL para crear la tabla
-        create_table_query = """
-        CREATE TABLE IF NOT EXISTS alerts (
-            id SERIAL PRIMARY KEY,
-            chat_id BIGINT NOT NULL,
-            ticker_symbol VARCHAR(20) NOT NULL,
-            alias_general VARCHAR(50) NOT NULL,
-            target_price NUMERIC(12, 2) NOT NULL,
-            is_triggered BOOLEAN DEFAULT FALSE,
-            currency VARCHAR(10)
-        );
-        """
-        cursor.execute(create_table_query)
-        conn.commit()
-        
-        print("¡Tabla 'alerts' verificada/creada con éxito!")
-        await update.message.reply_text("¡Base de datos inicializada! La tabla 'alerts' está lista.")
-        
-    except (Exception, psycopg2.Error) as error:
+    except (Exception, ErrorBD) as error:
         print("Error al inicializar la BD:", error)
         await update.message.reply_text(f"Error al inicializar la BD: {error}")
-    finally:
-        # Devuelve la conexión al pool
-        if conn:
-            db_pool.putconn(conn)
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -223,17 +258,84 @@ async def tickers(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(texto_mensaje, reply_markup=reply_markup, parse_mode="Markdown")
     
     
-async def enviar_resumen_core(reply_object):
+def texto_antiguedad(edad):
+    """Convierte una edad en segundos en un texto corto: 'hace 12 s' / 'hace 3 min'."""
+    if edad < 60:
+        return f"hace {edad:.0f} s"
+    return f"hace {edad / 60:.0f} min"
+
+
+async def enviar_precios_core(reply_object, ticker_info):
     """
-    Función NÚCLEO: Genera y envía el resumen.
-    'reply_object' es el objeto al que responder (ej: update.message o query.message)
+    Función NÚCLEO: Genera y envía los precios de UN activo (todos sus tickers).
+    La usan 'manejar_texto' y 'boton_ticker_pulsado'.
     """
-    # 1. Avisamos al usuario
-    await reply_object.reply_text("Buscando resumen de mercado... ⌛\n(Esto puede tardar unos segundos)")
+    alias_general = ticker_info["alias_general"]
+    lista_de_tickers = ticker_info["tickers"]
+    simbolos = [ticker_a_buscar["symbol"] for ticker_a_buscar in lista_de_tickers]
+    
+    # 1. Si la foto del prefetch ya lo tiene todo, contestamos al instante.
+    #    Si no, avisamos de que vamos a buscar lo que falte.
+    _, faltan, _ = precios_de_la_foto(simbolos)
+    if faltan:
+        await reply_object.reply_text(f"Buscando {alias_general}...")
+    
+    precios, caducados, edad = await obtener_con_foto(simbolos)
+    
+    # --- CONSTRUCCIÓN DE MENSAJE ---
+    partes_del_mensaje = [f""]
+
+    for ticker_a_buscar in lista_de_tickers:
+        nombre_ticker = ticker_a_buscar["nombre"]
+        symbol_ticker = ticker_a_buscar["symbol"]
+        
+        precio, moneda, p_change = precios.get(symbol_ticker, (None, None, None))
+        change_str = f"({p_change:+,.2f}%)" if p_change is not None else ""
+        
+        if precio is not None:
+            linea = f"  -> Precio de {alias_general} ({nombre_ticker}): {precio:,.2f} {moneda} {change_str}\n"
+            partes_del_mensaje.append(linea)
+        else:
+            linea = f"  -> {nombre_ticker} [{symbol_ticker}]: Error al obtener.\n"
+            partes_del_mensaje.append(linea)
+    
+    partes_del_mensaje.append(f"\n_Datos de {texto_antiguedad(edad)}_")
+    
+    # --- Envío del Mensaje ---
+    mensaje_final = "".join(partes_del_mensaje)
+    await reply_object.reply_text(mensaje_final, parse_mode="Markdown")
+
+
+# --- Caché del TEXTO del resumen ---
+# Pintar el resumen es siempre igual si los precios no cambian. Guardamos el
+# último texto junto con la "clave" (los precios con los que se pintó) y su
+# versión. Solo se vuelve a pintar si cambia algún precio o si el texto es
+# más viejo que MAX_EDAD_RESUMEN.
+_resumen_cache = {
+    "clave": None,
+    "texto": "",
+    "version": 0,
+    "instante": 0.0,
+}
+
+
+def renderizar_resumen(precios, caducados):
+    """
+    Devuelve (texto_del_resumen, version) para estos precios.
+    Reutiliza el último texto si se pintó con los mismos precios y no ha caducado.
+    """
+    clave = (
+        tuple((simbolo, precios.get(simbolo)) for simbolo in SIMBOLOS_A_VIGILAR),
+        frozenset(caducados),
+    )
+    ahora = time.monotonic()
+    
+    if _resumen_cache["clave"] == clave and ahora - _resumen_cache["instante"] <= MAX_EDAD_RESUMEN:
+        return _resumen_cache["texto"], _resumen_cache["version"]
     
     partes_del_mensaje = [f"*RESUMEN DEL MERCADO*\n"]
     
-    # 2. Bucle anidado MAESTRO (Tu lógica, intacta)
+    # Bucle anidado MAESTRO (solo pinta, no descarga)
     for ticker_info in TICKERS_A_VIGILAR:
         alias_general = ticker_info["alias_general"]
         lista_de_tickers = ticker_info["tickers"]
@@ -244,7 +346,12 @@ async def enviar_resumen_core(reply_object):
             nombre_ticker = ticker_a_buscar["nombre"]
             symbol_ticker = ticker_a_buscar["symbol"]
             
-            precio, moneda, p_change = obtener_precio_actual(symbol_ticker)
+            if symbol_ticker in caducados:
+                linea = f"  -> {nombre_ticker} [{symbol_ticker}]: Sin respuesta a tiempo ⏱\n"
+                partes_del_mensaje.append(linea)
+                continue
+            
+            precio, moneda, p_change = precios.get(symbol_ticker, (None, None, None))
             change_str = f"({p_change:+,.2f}%)" if p_change is not None else ""
             
             if precio is not None:
@@ -253,9 +360,37 @@ async def enviar_resumen_core(reply_object):
             else:
                 linea = f"  -> {nombre_ticker} [{symbol_ticker}]: Error.\n"
                 partes_del_mensaje.append(linea)
+    
+    _resumen_cache["clave"] = clave
+    _resumen_cache["texto"] = "".join(partes_del_mensaje)
+    _resumen_cache["version"] += 1
+    _resumen_cache["instante"] = ahora
+    
+    return _resumen_cache["texto"], _resumen_cache["version"]
+
+
+async def enviar_resumen_core(reply_object):
+    """
+    Función NÚCLEO: Genera y envía el resumen.
+    'reply_object' es el objeto al que responder (ej: update.message o query.message)
+    """
+    # 1. Si a la foto del prefetch le falta algo, avisamos al usuario
+    _, faltan, _ = precios_de_la_foto(SIMBOLOS_A_VIGILAR)
+    if faltan:
+        await reply_object.reply_text("Buscando resumen de mercado... ⌛")
+    
+    # 2. Foto del prefetch y, los que no estén en ella, todos a la vez
+    #    (cada uno con su plazo máximo)
+    precios, caducados, edad = await obtener_con_foto(
+        SIMBOLOS_A_VIGILAR, uso="resumen", timeout=TIMEOUT_RESUMEN
+    )
+    
+    # 3. Texto del resumen (pintado de nuevo SOLO si ha cambiado algún precio)
+    texto_resumen, version = renderizar_resumen(precios, caducados)
+    print(f"Resumen: enviando versión {version} del texto.")
                 
-    # 3. Envío del Mensaje Final
-    mensaje_final = "".join(partes_del_mensaje)
+    # 4. Envío del Mensaje Final
+    mensaje_final = f"{texto_resumen}\n_Datos de {texto_antiguedad(edad)}_"
     await reply_object.reply_text(mensaje_final, parse_mode="Markdown")
     
     
@@ -266,7 +401,7 @@ async def resumen_mercado(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     query = update.callback_query
     # 1. Responde al click (esto es específico del botón)
-    await query.answer("Buscando, esto tardará unos segundos...")
+    await query.answer("Buscando resumen...")
     
     # 2. Llama a la función núcleo, pasándole el 'query.message'
     await enviar_resumen_core(query.message)
@@ -297,115 +432,45 @@ async def boton_ticker_pulsado(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.message.reply_text("Error: No he reconocido ese botón.")
         return
 
-    # 5. --- (Esta lógica es COPIADA de 'manejar_texto') ---
-    alias_general = ticker_info["alias_general"]
-    lista_de_tickers = ticker_info["tickers"] 
-    
-    # query.message.reply_text envía un NUEVO mensaje
-    await query.message.reply_text(f"Buscando {alias_general}...")
-    
-    partes_del_mensaje = [f""]
-
-    for ticker_a_buscar in lista_de_tickers:
-        nombre_ticker = ticker_a_buscar["nombre"]
-        symbol_ticker = ticker_a_buscar["symbol"]
-        
-        precio, moneda, p_change = obtener_precio_actual(symbol_ticker)
-        change_str = f"({p_change:+,.2f}%)" if p_change is not None else ""
-        
-        if precio is not None:
-            linea = f"  -> Precio de {alias_general} ({nombre_ticker}): {precio:,.2f} {moneda} {change_str}\n"
-            partes_del_mensaje.append(linea)
-        else:
-            linea = f"  -> {nombre_ticker} [{symbol_ticker}]: Error al obtener.\n"
-            partes_del_mensaje.append(linea)
-    
-    mensaje_final = "".join(partes_del_mensaje)
-    # Enviamos el resultado como un mensaje nuevo
-    await query.message.reply_text(mensaje_final, parse_mode="Markdown")
+    # 5. Misma lógica que 'manejar_texto' (un NUEVO mensaje con los precios)
+    await enviar_precios_core(query.message, ticker_info)
 
 
 async def manejar_texto(update: Update, context: ContextTypes.DEFAULT_TYPE):
     texto_recibido = update.message.text.lower().strip()
     
     # --- Lógica de decisión ---
-    ticker_encontrado = False
+    # UNA sola búsqueda con todos los patrones ya compilados. El orden es el de
+    # siempre: primero los tickers y después las intenciones de texto.
+    intencion, ticker_info = router_intenciones.enrutar(texto_recibido)
 
-    # PRIMERO: Recorre la base de datos de tickers (Bucle Exterior)
-    for ticker_info in TICKERS_A_VIGILAR:
-        
-        # Si el texto del usuario coincide con el patrón
-        if re.search(ticker_info["patron_regex"], texto_recibido):
-            
-            ticker_encontrado = True # ¡Lo pillamos!
-            
-            alias_general = ticker_info["alias_general"]
-            lista_de_tickers = ticker_info["tickers"] 
-            
-            await update.message.reply_text(f"Buscando {alias_general}...")
-            
-            # --- CONSTRUCCIÓN DE MENSAJE ---
-            # Vamos a ir guardando las líneas del mensaje aquí
-            
-            #partes_del_mensaje = [f"**Precios de {alias_general}**\n"]
-            partes_del_mensaje = [f""]
+    if intencion == "ticker":
+        await enviar_precios_core(update.message, ticker_info)
+
+    # 1. Intenciones de "AYUDA" (prioritarias)
+    elif intencion == "opciones":
+        # Reutilizamos la función del comando /opciones
+        await opciones(update, context)
+
+    elif intencion == "tickers":
+        # Reutilizamos la función del comando /tickers
+        await tickers(update, context)
+
+    elif intencion == "mis_alertas":
+        await mis_alertas(update, context)
+
+    # 2. Intenciones de "CHARLA" (secundarias)
+    elif intencion == "saludo":
+        saludo_elegido = random.choice(POSIBLES_SALUDOS)
+        await update.message.reply_text(saludo_elegido)
+
+    elif intencion == "gracias":
+        respuesta_gracias = random.choice(POSIBLES_DE_NADA)
+        await update.message.reply_text(respuesta_gracias)
+
+    elif intencion == "todo":
+        await enviar_resumen_core(update.message)
 
-            # SEGUNDO: Recorre los tickers anidados (Bucle Interior)
-            for ticker_a_buscar in lista_de_tickers:
-                
-                nombre_ticker = ticker_a_buscar["nombre"]
-                symbol_ticker = ticker_a_buscar["symbol"]
-                
-                # Llamamos a la función PURIFICADA por cada ticker
-                precio, moneda, p_change = obtener_precio_actual(symbol_ticker)
-                change_str = f"({p_change:+,.2f}%)" if p_change is not None else ""
-                
-                # Construimos la línea para este ticker
-                if precio is not None:
-                    linea = f"  -> Precio de {alias_general} ({nombre_ticker}): {precio:,.2f} {moneda} {change_str}\n"
-                    partes_del_mensaje.append(linea)
-                else:
-                    linea = f"  -> {nombre_ticker} [{symbol_ticker}]: Error al obtener.\n"
-                    partes_del_mensaje.append(linea)
-            
-            # --- Envío del Mensaje ---
-            # Une todas las partes en un solo mensaje y lo envía
-            mensaje_final = "".join(partes_del_mensaje)
-            await update.message.reply_text(mensaje_final, parse_mode="Markdown")
-            
-            # Rompemos el bucle EXTERIOR (ya hemos encontrado lo que queríamos)
-            break 
-    
-    # SI NO se encontró un ticker: Comprueba si es un saludo o gracias
-    if not ticker_encontrado:
-        
-        # --- ¡CADENA DE INTENCIONES CON REGEX! ---
-        # El orden aquí es importante.
-        
-        # 1. Intenciones de "AYUDA" (prioritarias)
-        if re.search(PATRON_OPCIONES, texto_recibido):
-            # Reutilizamos la función del comando /opciones
-            await opciones(update, context)
-            
-        elif re.search(PATRON_TICKERS, texto_recibido):
-            # Reutilizamos la función del comando /tickers
-            await tickers(update, context) 
-            
-        elif re.search(PATRON_MIS_ALERTAS, texto_recibido):
-            await mis_alertas(update, context)
-            
-        # 2. Intenciones de "CHARLA" (secundarias)
-        elif re.search(PATRON_SALUDO, texto_recibido): 
-            saludo_elegido = random.choice(POSIBLES_SALUDOS)
-            await update.message.reply_text(saludo_elegido)
-        
-        elif re.search(PATRON_GRACIAS, texto_recibido): 
-            respuesta_gracias = random.choice(POSIBLES_DE_NADA)
-            await update.message.reply_text(respuesta_gracias)
-            
-        elif re.search(PATRON_TODO, texto_recibido): 
-            await enviar_resumen_core(update.message)
-            
     # Si no es nada, se queda callado. Perfecto.
     
 
@@ -488,7 +553,6 @@ async def conv_precio_recibido(update: Update, context: ContextTypes.DEFAULT_TYP
         return STATE_SET_PRICE # Nos quedamos en este paso
 
     # --- ¡LÓGICA DE BD! ---
-    conn = None
     try:
         ticker_simbolo = ticker_info["tickers"][0]["symbol"]
         alias_general = ticker_info["alias_general"]
@@ -496,20 +560,15 @@ async def conv_precio_recibido(update: Update, context: ContextTypes.DEFAULT_TYP
         
         # --- ¡NUEVA LLAMADA PARA OBTENER MONEDA! ---
         # Hacemos una llamada rápida solo para saber la moneda y mejorar el mensaje
-        precio_actual, moneda, _ = obtener_precio_actual(ticker_simbolo)
+        precio_actual, moneda, _ = await obtener_precio_async(ticker_simbolo, uso="moneda")
         if moneda is None:
             moneda = "" # Si falla, dejamos la moneda vacía
         # -------------------------------------------
 
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
+        alert_id = await base_datos.insertar_alerta(chat_id, ticker_simbolo, alias_general, target_price, moneda)
         
-        insert_query = """
-        INSERT INTO alerts (chat_id, ticker_symbol, alias_general, target_price, currency)
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        cursor.execute(insert_query, (chat_id, ticker_simbolo, alias_general, target_price, moneda))
-        conn.commit()
+        # La apuntamos también en el índice en memoria
+        indice_alertas.agregar(Alerta(alert_id, chat_id, ticker_simbolo, alias_general, round(target_price, 2)))
 
         context.user_data.clear()
 
@@ -522,13 +581,13 @@ async def conv_precio_recibido(update: Update, context: ContextTypes.DEFAULT_TYP
         await update.message.reply_text(mensaje, parse_mode="Markdown")
         return ConversationHandler.END
         
-    except (Exception, psycopg2.Error) as error:
+    except BaseDatosOcupada:
+        await update.message.reply_text(MENSAJE_BD_OCUPADA)
+        return ConversationHandler.END
+    except (Exception, ErrorBD) as error:
         print(f"Error creando alerta en BD: {error}")
         await update.message.reply_text(f"Error al guardar la alerta: {error}")
         return ConversationHandler.END
-    finally:
-        if conn:
-            db_pool.putconn(conn)
 
 
 async def conv_cancelar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -540,69 +599,156 @@ async def conv_cancelar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> i
 
 
 
+async def refrescar_precios(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Job de PREFETCH: refresca todos los TICKERS_A_VIGILAR y publica una foto
+    nueva. Así los handlers contestan desde memoria en milisegundos.
+    """
+    precios, caducados = await obtener_varios_async(SIMBOLOS_A_VIGILAR, uso="prefetch")
+    foto = publicar_foto(precios)
+    
+    if caducados:
+        print(f"Prefetch: sin respuesta para {sorted(caducados)}")
+    print(f"Prefetch: foto publicada con {len(foto.precios)}/{len(SIMBOLOS_A_VIGILAR)} símbolo(s).")
+
+
+async def cargar_indice_alertas():
+    """Lee TODA la tabla 'alerts' y reconstruye el índice en memoria."""
+    # (antes del SELECT: las altas/bajas de los handlers durante el 'await'
+    #  se apuntan y se aplican encima de lo leído)
+    indice_alertas.empezar_carga()
+    indice_alertas.cargar(await base_datos.todas_las_alertas())
+    print(f"JobQueue: Índice de alertas cargado ({len(indice_alertas)} alerta(s)).")
+
+
+async def evaluar_alertas_en_sql(precios):
+    """
+    Modo "sql": dos UPDATE ... FROM ... RETURNING (uno dispara, otro re-arma).
+    Las idas y vueltas a la BD por tick son SIEMPRE las mismas, haya 10 o
+    10.000 alertas. Devuelve (disparadas, rearmadas) como listas de Alerta.
+    """
+    simbolos = [simbolo for simbolo, datos in precios.items() if datos[0] is not None]
+    valores = [precios[simbolo][0] for simbolo in simbolos]
+    if not simbolos:
+        return [], []
+
+    filas_disparadas, filas_rearmadas = await base_datos.evaluar_alertas(simbolos, valores)
+    disparadas = [Alerta(fila[0], fila[1], fila[2], fila[3], float(fila[4])) for fila in filas_disparadas]
+    rearmadas = [Alerta(fila[0], fila[1], fila[2], fila[3], float(fila[4])) for fila in filas_rearmadas]
+    return disparadas, rearmadas
+
+
+def avisar_alerta(alerta, disparada, precio, moneda, p_change):
+    """
+    Encola el aviso de una alerta DISPARADA o RE-ARMADA.
+    (Lo envía el despachador, respetando los límites de Telegram.)
+    """
+    if disparada:
+        # Formateamos el % de cambio (si existe)
+        change_str = f"({p_change:+,.2f}%)" if p_change is not None else ""
+        
+        print(f"JobQueue: ¡ALERTA DISPARADA! {alerta.alias} < {alerta.target}")
+        mensaje = (
+            f"🔔 *¡ALERTA DE PRECIO!* 🔔\n\n"
+            f"El activo *{alerta.alias}* ha caído por debajo de tu objetivo.\n\n"
+            f"Precio Actual -> {precio:,.2f} {moneda} {change_str}\n"
+            f"Tu Objetivo     -> {alerta.target:,.2f} {moneda}"
+        )
+    else:
+        print(f"JobQueue: ALERTA RE-ARMADA. {alerta.alias} > {alerta.target}")
+        mensaje = (
+            f"✅ *Alerta Reactivada* ✅\n\n"
+            f"El activo *{alerta.alias}* se ha recuperado por encima de {alerta.target:,.2f} {moneda}.\n"
+            f"La alerta de precio ha sido reactivada."
+        )
+    despachador.encolar(alerta.chat_id, mensaje, parse_mode="Markdown")
+
+
+async def guardar_cambios_de_estado(disparadas, rearmadas):
+    """Escribe de golpe (UNA sentencia) los cambios de estado del tick."""
+    ids = [alerta.id for alerta in disparadas] + [alerta.id for alerta in rearmadas]
+    estados = [True] * len(disparadas) + [False] * len(rearmadas)
+    if ids:
+        await base_datos.guardar_estados(ids, estados)
+
+
+@cronometrar(_duracion_tick)
 async def check_all_alerts(context: ContextTypes.DEFAULT_TYPE):
     """
-    ¡VERSIÓN SQL! Recorre la tabla 'alerts' de la BD.
+    ¡VERSIÓN SQL! La BD manda. Según MODO_EVALUACION_ALERTAS:
+      - "indice": se evalúa contra el índice en memoria (ordenado por precio
+        objetivo), que solo devuelve las alertas que cambian de estado.
+      - "sql": PostgreSQL hace la comparación entera y nos devuelve las filas
+        que han cambiado.
+    En los dos modos la conexión a la BD se devuelve al pool ANTES de ir a
+    Yahoo y ANTES de empezar a mandar mensajes por Telegram.
     """
-    conn = None
+    # 0. ¿Qué símbolos hay que mirar? (y cuántas alertas tiene cada uno)
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT id, chat_id, ticker_symbol, alias_general, target_price, is_triggered FROM alerts")
-        all_alerts = cursor.fetchall()
+        if MODO_EVALUACION_ALERTAS == "sql":
+            alertas_por_simbolo = await base_datos.alertas_por_simbolo()
+        else:
+            # La primera vez (o tras un error) cargamos el índice desde la BD
+            if not indice_alertas.cargado:
+                await cargar_indice_alertas()
+            alertas_por_simbolo = indice_alertas.alertas_por_simbolo()
+        simbolos_distintos = list(alertas_por_simbolo)
+    
+    except (Exception, ErrorBD) as error:
+        print(f"JobQueue: Error leyendo alertas: {error}")
+        return
 
-        if not all_alerts:
-            print("JobQueue: No hay alertas en la BD. Durmiendo.")
-            return
+    if not simbolos_distintos:
+        print("JobQueue: No hay alertas en la BD. Durmiendo.")
+        monitor_salud.tick_ok()
+        return
 
-        print(f"JobQueue: Comprobando {len(all_alerts)} alerta(s) de la BD...")
+    print(f"JobQueue: Comprobando alertas de {len(simbolos_distintos)} símbolo(s) (modo '{MODO_EVALUACION_ALERTAS}')...")
 
-        for alert in all_alerts:
-            alert_id, chat_id_aviso, ticker_simbolo, ticker_alias, target_price, is_triggered = alert
-            
-            # target_price es un objeto Decimal, lo pasamos a float
-            target_price = float(target_price)
+    # 1. Foto de precios: UNA descarga por símbolo distinto, no por alerta
+    precios, _ = await obtener_varios_async(simbolos_distintos, uso="alertas")
 
-            precio, moneda, p_change = obtener_precio_actual(ticker_simbolo)
-            if precio is None:
-                continue
+    # 2. Calculamos los cambios de estado y los guardamos en UNA transacción
+    disparadas, rearmadas = [], []
+    try:
+        if MODO_EVALUACION_ALERTAS == "sql":
+            # PostgreSQL cambia los estados y nos dice cuáles han cambiado
+            disparadas, rearmadas = await evaluar_alertas_en_sql(precios)
+        else:
+            # El índice nos da SOLO las que cambian (bisect, no recorrido)
+            for ticker_simbolo, (precio, moneda, p_change) in precios.items():
+                if precio is None:
+                    continue
+                nuevas_disparadas, nuevas_rearmadas = indice_alertas.evaluar(ticker_simbolo, precio)
+                disparadas.extend(nuevas_disparadas)
+                rearmadas.extend(nuevas_rearmadas)
+            
+            await guardar_cambios_de_estado(disparadas, rearmadas)
 
-            if precio < target_price and not is_triggered:
-                # 2. Formateamos el % de cambio (si existe)
-                change_str = f"({p_change:+,.2f}%)" if p_change is not None else ""
-                
-                print(f"JobQueue: ¡ALERTA DISPARADA! {ticker_alias} < {target_price}")
-                mensaje = (
-                    f"🔔 *¡ALERTA DE PRECIO!* 🔔\n\n"
-                    f"El activo *{ticker_alias}* ha caído por debajo de tu objetivo.\n\n"
-                    f"Precio Actual -> {precio:,.2f} {moneda} {change_str}\n"
-                    f"Tu Objetivo     -> {target_price:,.2f} {moneda}"
-                )
-                await context.bot.send_message(chat_id=chat_id_aviso, text=mensaje, parse_mode="Markdown")
-                
-                # ¡Actualizamos la BD!
-                cursor.execute("UPDATE alerts SET is_triggered = TRUE WHERE id = %s", (alert_id,))
-                conn.commit()
-
-            elif precio > target_price and is_triggered:
-                print(f"JobQueue: ALERTA RE-ARMADA. {ticker_alias} > {target_price}")
-                mensaje = (
-                    f"✅ *Alerta Reactivada* ✅\n\n"
-                    f"El activo *{ticker_alias}* se ha recuperado por encima de {target_price:,.2f} {moneda}.\n"
-                    f"La alerta de precio ha sido reactivada."
-                )
-                await context.bot.send_message(chat_id=chat_id_aviso, text=mensaje, parse_mode="Markdown")
-                
-                # ¡Actualizamos la BD!
-                cursor.execute("UPDATE alerts SET is_triggered = FALSE WHERE id = %s", (alert_id,))
-                conn.commit()
+    except (Exception, ErrorBD) as error:
+        print(f"JobQueue: Error guardando el estado de las alertas: {error}")
+        # El índice puede haberse quedado por delante de la BD: lo recargamos
+        indice_alertas.cargado = False
+        return
 
-    except (Exception, psycopg2.Error) as error:
-        print(f"JobQueue: Error procesando alertas: {error}")
-    finally:
-        if conn:
-            db_pool.putconn(conn)
+    # 3. Avisamos a los usuarios (ya SIN conexión a la BD). Solo se encolan:
+    #    el despachador los envía a su ritmo y el job termina YA.
+    print(f"JobQueue: {len(disparadas)} disparada(s), {len(rearmadas)} re-armada(s).")
+    _alertas_evaluadas.con().incrementar(sum(
+        cuantas for simbolo, cuantas in alertas_por_simbolo.items()
+        if precios.get(simbolo, (None,))[0] is not None
+    ))
+    _alertas_disparadas.con().incrementar(len(disparadas))
+    _alertas_rearmadas.con().incrementar(len(rearmadas))
+    for alerta in disparadas:
+        avisar_alerta(alerta, True, *precios[alerta.simbolo])
+    for alerta in rearmadas:
+        avisar_alerta(alerta, False, *precios[alerta.simbolo])
+
+    print(f"JobQueue: Caché de cotizaciones -> {cache_cotizaciones.estadisticas()}")
+    print(f"JobQueue: Pool de BD -> {base_datos.metricas_pool()}")
+    print(f"JobQueue: Despachador de avisos -> {despachador.estadisticas()}")
+    monitor_salud.tick_ok()
 
 
 async def nueva_alerta(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -617,11 +763,8 @@ async def nueva_alerta(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     trigger_usuario = context.args[0].lower()
-    ticker_info_encontrada = None
-    for ticker_data in TICKERS_A_VIGILAR:
-        if re.search(ticker_data["patron_regex"], trigger_usuario):
-            ticker_info_encontrada = ticker_data
-            break
+    # Búsqueda directa por alias (sp500, s&p, btc...); la regex solo si no es exacto
+    ticker_info_encontrada = indice_alias.buscar(trigger_usuario)
             
     if not ticker_info_encontrada:
         await update.message.reply_text(f"No reconozco el activo '{trigger_usuario}'.\nUsa /tickers para ver la lista.")
@@ -634,26 +777,20 @@ async def nueva_alerta(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
         
     # --- ¡LÓGICA DE BD! ---
-    conn = None
     try:
         ticker_simbolo = ticker_info_encontrada["tickers"][0]["symbol"]
         alias_general = ticker_info_encontrada["alias_general"]
         
         # --- ¡NUEVA LLAMADA PARA OBTENER MONEDA! ---
-        precio_actual, moneda, _ = obtener_precio_actual(ticker_simbolo)
+        precio_actual, moneda, _ = await obtener_precio_async(ticker_simbolo, uso="moneda")
         if moneda is None:
             moneda = "N/A"
         # -------------------------------------------
 
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
+        alert_id = await base_datos.insertar_alerta(chat_id, ticker_simbolo, alias_general, target_price, moneda)
         
-        insert_query = """
-        INSERT INTO alerts (chat_id, ticker_symbol, alias_general, target_price, currency) 
-        VALUES (%s, %s, %s, %s, %s)
-        """
-        cursor.execute(insert_query, (chat_id, ticker_simbolo, alias_general, target_price, moneda))
-        conn.commit()
+        # La apuntamos también en el índice en memoria
+        indice_alertas.agregar(Alerta(alert_id, chat_id, ticker_simbolo, alias_general, round(target_price, 2)))
         
         mensaje = (
             f"¡Alerta Creada! ✅\n\n"
@@ -661,26 +798,18 @@ async def nueva_alerta(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         await update.message.reply_text(mensaje, parse_mode="Markdown")
 
-    except (Exception, psycopg2.Error) as error:
+    except BaseDatosOcupada:
+        await update.message.reply_text(MENSAJE_BD_OCUPADA)
+    except (Exception, ErrorBD) as error:
         print(f"Error creando alerta en BD: {error}")
         await update.message.reply_text(f"Error al guardar la alerta: {error}")
-    finally:
-        if conn:
-            db_pool.putconn(conn)
 
 
 async def mis_alertas(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """¡VERSIÓN SQL! Muestra las alertas de la BD."""
     chat_id = update.message.chat_id
-    conn = None
     try:
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-
-        select_query = "SELECT id, alias_general, ticker_symbol, target_price, currency FROM alerts WHERE chat_id = %s"
-        cursor.execute(select_query, (chat_id,))
-        
-        alertas_de_este_usuario = cursor.fetchall()
+        alertas_de_este_usuario = await base_datos.alertas_de_chat(chat_id)
         
         if not alertas_de_este_usuario:
             await update.message.reply_text("No tienes ninguna alerta activa.\nCrea una con /alerta")
@@ -707,80 +836,120 @@ async def mis_alertas(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text("".join(partes_del_mensaje), reply_markup=reply_markup)
 
-    except (Exception, psycopg2.Error) as error:
+    except BaseDatosOcupada:
+        await update.message.reply_text(MENSAJE_BD_OCUPADA)
+    except (Exception, ErrorBD) as error:
         print(f"Error listando alertas: {error}")
         await update.message.reply_text(f"Error al listar tus alertas: {error}")
-    finally:
-        if conn:
-            db_pool.putconn(conn)
 
 
 async def borrar_alerta_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """¡VERSIÓN SQL! Borra una alerta de la BD."""
     query = update.callback_query
     await query.answer()
-    conn = None
     try:
         prefix, alert_id_str = query.data.split(":")
         alert_id = int(alert_id_str)
         chat_id = query.message.chat_id # Para seguridad
         
-        conn = db_pool.getconn()
-        cursor = conn.cursor()
-        
-        # Borramos solo si el chat_id coincide (para que no borres alertas de otros)
-        delete_query = "DELETE FROM alerts WHERE id = %s AND chat_id = %s RETURNING alias_general"
-        cursor.execute(delete_query, (alert_id, chat_id))
-        
-        # Obtenemos el resultado de RETURNING
-        deleted_alert = cursor.fetchone()
-        conn.commit()
+        # Borramos solo si el chat_id coincide (devuelve el alias o None)
+        alias = await base_datos.borrar_alerta(alert_id, chat_id)
         
-        if deleted_alert:
-            alias = deleted_alert[0]
+        if alias is not None:
+            indice_alertas.quitar(alert_id)
             await query.edit_message_text(f"Alerta para *{alias}* borrada con éxito.", parse_mode="Markdown")
         else:
             await query.edit_message_text("Error: No se encontró la alerta o no te pertenece.")
 
-    except (Exception, psycopg2.Error) as error:
+    except BaseDatosOcupada:
+        await query.edit_message_text(MENSAJE_BD_OCUPADA)
+    except (Exception, ErrorBD) as error:
         print(f"Error borrando alerta: {error}")
         await query.edit_message_text("Error al borrar la alerta.")
-    finally:
-        if conn:
-            db_pool.putconn(conn)
 
 
     
 
    
 
-# --- 3. El Bucle Principal del Bot ---
-if __name__ == '__main__':
-    # ... (Comprobaciones de TOKEN y CHAT_ID, y el hilo de Flask... todo eso igual)
-    if not MI_TOKEN:
-        print("!!! ERROR CRÍTICO: No se encontró la variable de entorno MI_TOKEN !!!")
-        exit()
-    if not MI_CHAT_ID:
-        print("!!! ERROR CRÍTICO: No se encontró la variable de entorno MI_CHAT_ID !!!")
-        exit()
-    if not DATABASE_URL:
-        print("!!! ERROR CRÍTICO: No se encontró la variable de entorno DATABASE_URL !!!")
-        exit()
-    # ... (etc)
-    
-    print("Iniciando el polling del bot y la JobQueue...")
-    
-    web_thread = threading.Thread(target=run_web_server)
-    web_thread.daemon = True
-    web_thread.start()
-    
-    print(f"Servidor farsante iniciado en un hilo.")
+async def al_arrancar(application):
+    """
+    Se ejecuta dentro del bucle de eventos, antes de empezar el polling / webhook.
+    Solo hace lo RÁPIDO: lo pesado (BD, migraciones, yfinance) sigue en segundo
+    plano para que el bot conteste a /start y /opciones nada más arrancar.
+    """
+    # Lo primero el servidor web: el health check de Koyeb no debe esperar a la BD
+    servidor_web.ruta("GET", "/healthz", lambda peticion: healthz(application))
+    servidor_web.ruta("GET", "/readyz", lambda peticion: readyz(application))
+    await servidor_web.arrancar(PUERTO)
+    monitor_salud.arrancar()
+    despachador.arrancar(application.bot)
 
-    # 3. Iniciamos el BOT
-    application = ApplicationBuilder().token(MI_TOKEN).build()
+    global _tarea_arranque
+    _tarea_arranque = asyncio.create_task(arrancar_en_segundo_plano(application), name="arranque")
 
-    # --- ¡EL NUEVO ORDEN! ---
-    
+
+# La tarea que prepara la BD y yfinance tras arrancar (ver 'al_arrancar')
+_tarea_arranque = None
+
+
+async def arrancar_en_segundo_plano(application):
+    """
+    Prepara lo pesado mientras el bot ya atiende:
+      - el pool de la BD + las migraciones (los handlers que usan la BD
+        esperan a que termine, ver base_datos.conexion)
+      - yfinance (pandas, numpy...), importado en un hilo aparte
+    """
+    inicio = time.perf_counter()
+    try:
+        # Esquema al día (tabla + índices) antes de que nadie use la BD
+        await base_datos.crear_pool(DATABASE_URL, preparar=migraciones.migrar)
+    except (Exception, ErrorBD) as error:
+        print("!!! ERROR CRÍTICO: No se pudo conectar a la base de datos !!!", error)
+        # Sin BD el bot no sirve: nos paramos como si nos mandaran SIGTERM
+        # (polling y webhook lo atienden igual) y la plataforma lo reinicia
+        os.kill(os.getpid(), signal.SIGTERM)
+        return
+    print(f"Arranque: base de datos lista en {time.perf_counter() - inicio:.2f}s.")
+
+    await precargar_yfinance()
+    print(f"Arranque: todo listo en {time.perf_counter() - inicio:.2f}s.")
+
+
+async def al_apagar(application):
+    """Vacía la cola de avisos, cierra el pool de la BD y para el servidor web."""
+    if _tarea_arranque is not None and not _tarea_arranque.done():
+        _tarea_arranque.cancel()
+        await asyncio.gather(_tarea_arranque, return_exceptions=True)
+    await despachador.parar()
+    await base_datos.cerrar_pool()
+    await servidor_web.parar()
+    await monitor_salud.parar()
+
+
+async def healthz(application):
+    """
+    ¿Está VIVO? 503 si el bucle de eventos está atascado o las alertas llevan
+    demasiado sin comprobarse (la plataforma debería reiniciar la instancia).
+    """
+    vivo, _, informe = monitor_salud.informe(application.running)
+    return respuesta_json(200 if vivo else 503, informe)
+
+
+async def readyz(application):
+    """
+    ¿Está LISTO para recibir updates? Además de estar vivo: procesa updates,
+    tiene precios frescos y el pool de la BD no está saturado.
+    """
+    _, listo, informe = monitor_salud.informe(application.running)
+    return respuesta_json(200 if listo else 503, informe)
+
+
+def registrar_handlers(application):
+    """
+    Registra TODOS los handlers del bot en la Application.
+    (Separado del arranque para poder montar el bot en pruebas y benchmarks.)
+    """
     # 3.1. Definimos el ConversationHandler
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler('alerta', conv_start_alerta)],
@@ -816,12 +985,49 @@ if __name__ == '__main__':
     application.add_handler(CallbackQueryHandler(boton_ticker_pulsado, pattern=r'^ticker:'))
     application.add_handler(CallbackQueryHandler(resumen_mercado, pattern=r'^resumen$'))
     application.add_handler(CallbackQueryHandler(borrar_alerta_callback, pattern=r'^delete_alert:'))
+
+    # Cada handler apunta cuánto tarda (ver /metrics)
+    for handlers_del_grupo in application.handlers.values():
+        medir_handlers(handlers_del_grupo)
+
+
+
+# --- 3. El Bucle Principal del Bot ---
+if __name__ == '__main__':
+    # ... (Comprobaciones de TOKEN y CHAT_ID, y el hilo de Flask... todo eso igual)
+    if not MI_TOKEN:
+        print("!!! ERROR CRÍTICO: No se encontró la variable de entorno MI_TOKEN !!!")
+        exit()
+    if not MI_CHAT_ID:
+        print("!!! ERROR CRÍTICO: No se encontró la variable de entorno MI_CHAT_ID !!!")
+        exit()
+    if not DATABASE_URL:
+        print("!!! ERROR CRÍTICO: No se encontró la variable de entorno DATABASE_URL !!!")
+        exit()
+    # ... (etc)
+    
+    # 3. Iniciamos el BOT
+    application = (
+        ApplicationBuilder()
+        .token(MI_TOKEN)
+        .post_init(al_arrancar)
+        .post_shutdown(al_apagar)
+        .build()
+    )
+
+    # 3.1. Todos los handlers (comandos, conversación, botones y texto)
+    registrar_handlers(application)
     
     # --- Registra el "JobQueue" ---
     job_queue = application.job_queue
     job_queue.run_repeating(check_all_alerts, interval=300, first=10) # 5 min
+    job_queue.run_repeating(refrescar_precios, interval=INTERVALO_PREFETCH, first=1)
     
     # 4. El bot se queda aquí
-    print("Iniciando el polling del bot y la JobQueue...")
-    application.run_polling()
+    if WEBHOOK_URL:
+        print("Iniciando el bot en modo WEBHOOK y la JobQueue...")
+        asyncio.run(ejecutar_webhook(application, servidor_web, WEBHOOK_URL.rstrip("/") + WEBHOOK_RUTA, WEBHOOK_SECRETO))
+    else:
+        print("Iniciando el polling del bot y la JobQueue...")
+        application.run_polling()
     
\ No newline at end of file
@@ -55,6 +55,128 @@ TICKERS_A_VIGILAR = [
 ]
 
 
+# --- ¡CONFIGURACIÓN CACHÉ DE COTIZACIONES! ---
+
+# Segundos que una cotización se da por buena, según QUIÉN la pide
+MAX_EDAD_COTIZACION = {
+    "interactivo": 60,   # manejar_texto y botones de ticker
+    "resumen": 60,       # resumen de mercado
+    "alertas": 120,      # JobQueue de alertas (corre cada 5 min)
+    "moneda": 3600,      # al crear una alerta solo queremos saber la moneda
+    "prefetch": 0,       # el job de prefetch SIEMPRE va a Yahoo
+}
+
+# Máximo de símbolos guardados a la vez (se expulsa el menos usado)
+MAX_SIMBOLOS_CACHE = 256
+
+# Hilos que pueden estar hablando con Yahoo a la vez (el resto espera turno)
+MAX_DESCARGAS_SIMULTANEAS = 8
+
+# Segundos máximos que un handler espera por una cotización
+TIMEOUT_COTIZACION = 10
+
+# Plazo del resumen de mercado: lote + plan B de los que falten, todo dentro
+# de este tiempo (cada símbolo que llegue sale; los que no, salen marcados)
+TIMEOUT_RESUMEN = 6
+
+# Parte del plazo (0-1) que se espera al lote antes de lanzar también el plan
+# B de todos sus símbolos (el lote sigue: cada uno sale con lo que llegue antes)
+FRACCION_ESPERA_LOTE = 0.5
+
+# Cada cuántos segundos el job de prefetch refresca TICKERS_A_VIGILAR
+INTERVALO_PREFETCH = 30
+
+# Si la foto del prefetch es más vieja que esto, no se usa (se va a Yahoo)
+MAX_EDAD_FOTO = 120
+
+# Segundos que se reutiliza el texto ya pintado del resumen (si no cambian precios)
+MAX_EDAD_RESUMEN = 60
+
+
+# --- ¡CONFIGURACIÓN ALERTAS! ---
+
+# Cómo se evalúan las alertas en cada tick del JobQueue:
+#   "indice" -> índice ordenado en memoria (indice_alertas.py)
+#   "sql"    -> dos UPDATE ... FROM unnest(...) RETURNING en PostgreSQL
+MODO_EVALUACION_ALERTAS = "indice"
+
+# Envío de avisos (límites de Telegram: ~30 mensajes/s en total y ~1/s por chat)
+NOTIF_TRABAJADORES = 4
+NOTIF_MENSAJES_POR_SEGUNDO = 25
+NOTIF_SEGUNDOS_POR_CHAT = 1.0
+NOTIF_MAX_REINTENTOS = 3
+
+
+# --- ¡CONFIGURACIÓN BASE DE DATOS! ---
+
+# Tamaño del pool de conexiones async (asyncpg)
+DB_POOL_MIN = 1
+DB_POOL_MAX = 5
+
+# Segundos máximos esperando a que quede libre una conexión del pool
+DB_TIMEOUT_ADQUIRIR = 5
+
+# Segundos máximos esperando a que se cree el pool al arrancar
+# (el bot ya contesta mientras la BD "despierta", ej: Neon tras estar parada)
+DB_TIMEOUT_ARRANQUE = 30
+
+# Segundos máximos que puede tardar una sentencia
+DB_TIMEOUT_SENTENCIA = 30
+
+# Sentencias preparadas que recuerda cada conexión.
+# (Ponlo a 0 si usas el "pooler" de Neon / PgBouncer en modo transacción)
+DB_CACHE_SENTENCIAS = 100
+
+
+# --- ¡CONFIGURACIÓN SERVIDOR WEB / WEBHOOK! ---
+
+# Camino donde Telegram nos manda los updates en modo webhook
+# (el modo se activa poniendo la variable de entorno WEBHOOK_URL)
+WEBHOOK_RUTA = "/telegram"
+
+# Conexiones simultáneas que Telegram puede abrir contra el webhook (1-100)
+WEBHOOK_MAX_CONEXIONES = 40
+
+# Tamaño máximo (bytes) del cuerpo de una petición HTTP
+WEB_MAX_CUERPO = 1_000_000
+
+# Segundos que se mantiene abierta una conexión keep-alive sin peticiones
+WEB_TIMEOUT_INACTIVIDAD = 75
+
+
+# --- ¡CONFIGURACIÓN SALUD (/healthz y /readyz)! ---
+
+# Cada cuánto se mide el retraso del bucle de eventos, y durante cuántos
+# segundos se recuerda el peor retraso
+SALUD_INTERVALO_LAG = 0.5
+SALUD_VENTANA_LAG = 60
+
+# Retraso máximo del bucle (segundos) para estar LISTO / para seguir VIVO
+SALUD_MAX_LAG_LISTO = 1.0
+SALUD_MAX_LAG_VIVO = 10.0
+
+# Segundos máximos sin un check_all_alerts correcto (el job va cada 300 s)
+SALUD_MAX_SIN_TICK = 900
+
+# Edad máxima (segundos) de la foto de precios del prefetch
+SALUD_MAX_EDAD_FOTO = 300
+
+
+# --- ¡CONFIGURACIÓN PERSISTENCIA (bot-con-cache.py)! ---
+
+# Carpeta donde se guardan las alertas (se puede cambiar con $DATOS_DIR)
+PERSISTENCIA_DIRECTORIO = "datos"
+
+# Cada cuántos segundos se vuelcan al disco los cambios pendientes
+# (es lo máximo que se pierde si el proceso muere de golpe)
+PERSISTENCIA_INTERVALO_VOLCADO = 2
+
+# Se escribe una foto completa (y se vacía el registro) cada tantos
+# segundos o cuando el registro pasa de tantos bytes
+PERSISTENCIA_INTERVALO_FOTO = 600
+PERSISTENCIA_MAX_REGISTRO = 4_000_000
+
+
 # --- ¡CONFIGURACIÓN TEXTOS! ---
 
 # PATRONES
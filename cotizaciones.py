@@ -0,0 +1,560 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+
+from config import (
+    MAX_EDAD_COTIZACION,
+    MAX_SIMBOLOS_CACHE,
+    MAX_DESCARGAS_SIMULTANEAS,
+    TIMEOUT_COTIZACION,
+    FRACCION_ESPERA_LOTE,
+    MAX_EDAD_FOTO)
+from metricas import registro
+
+
+# Métricas de Yahoo (ver /metrics). La tasa de error es errores / peticiones.
+# Cada símbolo cuenta UNA petición (y como mucho un error) por descarga: la
+# del lote si vino en él (con la duración del lote), o si no la del plan B.
+_yf_peticiones = registro.contador(
+    "yfinance_peticiones_total", "Cotizaciones pedidas a Yahoo, por símbolo", ["simbolo"])
+_yf_errores = registro.contador(
+    "yfinance_errores_total", "Cotizaciones que Yahoo no pudo dar, por símbolo", ["simbolo"])
+_yf_latencia = registro.histograma(
+    "yfinance_latencia_segundos", "Duración de cada llamada a Yahoo, por símbolo", ["simbolo"])
+
+
+# --- 0. yfinance, cargado SOLO cuando hace falta ---
+# yfinance arrastra pandas y numpy (~0,5 s de importación). No lo importamos
+# al cargar el módulo para que el bot conteste a /start nada más arrancar;
+# se carga con la primera descarga (en un hilo del pool) o con precargar_yfinance().
+
+_yf = None
+_yf_lock = threading.Lock()
+
+
+def _yfinance():
+    """Devuelve el módulo yfinance (lo importa la primera vez)."""
+    global _yf
+    if _yf is None:
+        with _yf_lock:
+            if _yf is None:
+                inicio = time.perf_counter()
+                import yfinance
+                _yf = yfinance
+                print(f"yfinance cargado en {time.perf_counter() - inicio:.2f}s.")
+    return _yf
+
+
+async def precargar_yfinance():
+    """Importa yfinance en un hilo aparte (sin parar el bucle de eventos)."""
+    await asyncio.get_running_loop().run_in_executor(_executor, _yfinance)
+
+
+# --- 1. Descarga "en crudo" (sin caché) ---
+
+def descargar_cotizacion(ticker_simbolo):
+    """
+    Pide a Yahoo el último precio del ticker Y EL CAMBIO DIARIO.
+    Devuelve (precio_actual, moneda, percent_change) o (None, None, None).
+    """
+    print(f"Buscando datos de [{ticker_simbolo}]...")
+    _yf_peticiones.con(simbolo=ticker_simbolo).incrementar()
+    inicio = time.perf_counter()
+    try:
+        ticker = _yfinance().Ticker(ticker_simbolo)
+        info_rapida = ticker.fast_info
+
+        precio_actual = info_rapida['last_price']
+        moneda = info_rapida['currency']
+        _monedas[ticker_simbolo] = moneda
+
+        precio_anterior = info_rapida.get('previousClose')
+        percent_change = None
+
+        if precio_anterior and precio_actual:
+            # Calculamos el % de cambio
+            percent_change = ((precio_actual - precio_anterior) / precio_anterior) * 100
+
+        return precio_actual, moneda, percent_change
+
+    except Exception as e:
+        print(f"*** ERROR al obtener precio para {ticker_simbolo}: {e} ***")
+        _yf_errores.con(simbolo=ticker_simbolo).incrementar()
+        return None, None, None
+
+    finally:
+        _yf_latencia.con(simbolo=ticker_simbolo).observar(time.perf_counter() - inicio)
+
+
+# La moneda de un ticker no cambia: la apuntamos la primera vez y listo
+_monedas = {}
+
+
+def _moneda_de(ticker_simbolo):
+    """Devuelve la moneda del ticker (la pide a Yahoo solo la primera vez)."""
+    if ticker_simbolo not in _monedas:
+        _monedas[ticker_simbolo] = _yfinance().Ticker(ticker_simbolo).fast_info['currency']
+    return _monedas[ticker_simbolo]
+
+
+# Las monedas que falten en un lote se piden A LA VEZ (y a la vez que el lote)
+# en su propio pool: el lote ya ocupa un hilo de _executor, y esperar ahí a
+# otros hilos de _executor lo atascaría con el pool lleno
+_executor_monedas = ThreadPoolExecutor(
+    max_workers=MAX_DESCARGAS_SIMULTANEAS,
+    thread_name_prefix="monedas"
+)
+
+
+def descargar_cotizaciones_lote(simbolos):
+    """
+    Pide a Yahoo MUCHOS tickers en UNA sola petición (yf.download).
+    Devuelve un dict {simbolo: (precio_actual, moneda, percent_change)} SOLO
+    con los que vinieron en el lote. Los que falten se piden uno a uno
+    (plan B) desde obtener_varios_async, cada uno en su hilo.
+    """
+    simbolos = sorted(set(simbolos))
+    if not simbolos:
+        return {}
+
+    print(f"Buscando datos en lote de {simbolos}...")
+    resultados = {}
+    inicio = time.perf_counter()
+    # Las monedas que no sabemos, mientras baja el lote (no una tras otra después)
+    monedas_nuevas = {simbolo: _executor_monedas.submit(_moneda_de, simbolo)
+                      for simbolo in simbolos if simbolo not in _monedas}
+    try:
+        # Velas diarias de los últimos días: la última es "hoy" y la
+        # penúltima es el cierre anterior (para el % de cambio)
+        datos = _yfinance().download(
+            simbolos,
+            period="5d",
+            interval="1d",
+            group_by="ticker",
+            auto_adjust=False,
+            progress=False,
+            threads=False,
+        )
+
+        for simbolo in simbolos:
+            try:
+                cierres = datos[simbolo]["Close"].dropna()
+                if cierres.empty:
+                    continue
+
+                precio_actual = float(cierres.iloc[-1])
+                percent_change = None
+                if len(cierres) >= 2:
+                    precio_anterior = float(cierres.iloc[-2])
+                    percent_change = ((precio_actual - precio_anterior) / precio_anterior) * 100
+
+                futuro_moneda = monedas_nuevas.get(simbolo)
+                moneda = futuro_moneda.result() if futuro_moneda is not None else _monedas[simbolo]
+                resultados[simbolo] = (precio_actual, moneda, percent_change)
+            except Exception as e:
+                print(f"*** ERROR leyendo {simbolo} del lote: {e} ***")
+
+    except Exception as e:
+        print(f"*** ERROR en la descarga en lote: {e} ***")
+
+    # Métricas SOLO de los que vinieron: los que faltan los cuenta su plan B
+    # (descargar_cotizacion), así un plan B bueno no sale como error
+    duracion = time.perf_counter() - inicio
+    for simbolo in resultados:
+        _yf_peticiones.con(simbolo=simbolo).incrementar()
+        _yf_latencia.con(simbolo=simbolo).observar(duracion)
+
+    return resultados
+
+
+# --- 2. La Caché compartida ---
+
+class _Vuelo:
+    """Una descarga en curso. Los que lleguen tarde esperan a su resultado."""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = (None, None, None)
+
+
+class CacheCotizaciones:
+    """
+    Caché de cotizaciones para TODO el proceso, con clave = símbolo.
+
+    - Cada entrada guarda (instante, (precio, moneda, percent_change)).
+    - Quien pide decide cuánto de vieja puede ser la cotización (max_edad).
+    - "Single-flight": si 50 usuarios piden el mismo símbolo a la vez y no está
+      en caché, solo UNO va a Yahoo y el resto espera su resultado.
+    - Tamaño acotado: al pasar de 'max_simbolos' se expulsa el menos usado (LRU).
+    - Se pueden pedir varios símbolos de golpe: los que falten van en UN lote.
+    """
+
+    def __init__(self, descargar, descargar_lote, max_simbolos=MAX_SIMBOLOS_CACHE):
+        self._descargar = descargar
+        self._descargar_lote = descargar_lote
+        self._max_simbolos = max_simbolos
+        self._datos = OrderedDict()
+        self._en_vuelo = {}
+        self._lock = threading.Lock()
+
+        # Contadores (para ver si la caché sirve de algo)
+        self.aciertos = 0
+        self.fallos = 0
+        self.coalescidas = 0
+        self.expulsadas = 0
+
+    def obtener(self, simbolo, max_edad):
+        """
+        Devuelve (precio, moneda, percent_change) para 'simbolo'.
+        Si la copia en caché tiene menos de 'max_edad' segundos, no sale a la red.
+        """
+        with self._lock:
+            entrada = self._datos.get(simbolo)
+            if entrada is not None and time.monotonic() - entrada[0] <= max_edad:
+                self._datos.move_to_end(simbolo)
+                self.aciertos += 1
+                return entrada[1]
+
+            self.fallos += 1
+            vuelo = self._en_vuelo.get(simbolo)
+            soy_el_lider = vuelo is None
+            if soy_el_lider:
+                vuelo = _Vuelo()
+                self._en_vuelo[simbolo] = vuelo
+            else:
+                self.coalescidas += 1
+
+        # Alguien ya está descargando este símbolo: esperamos su resultado
+        if not soy_el_lider:
+            vuelo.evento.wait()
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = self._descargar(simbolo)
+            if vuelo.resultado[0] is not None:
+                self.guardar(simbolo, vuelo.resultado)
+        finally:
+            with self._lock:
+                del self._en_vuelo[simbolo]
+            vuelo.evento.set()
+
+        return vuelo.resultado
+
+    def obtener_varios(self, simbolos, max_edad):
+        """
+        Como 'obtener', pero para una lista de símbolos.
+        Devuelve un dict {simbolo: (precio, moneda, percent_change)}.
+        Todos los que falten en la caché se descargan en UNA sola petición.
+        """
+        resultados = {}
+        mis_vuelos = {}
+        vuelos_ajenos = {}
+
+        with self._lock:
+            ahora = time.monotonic()
+            for simbolo in set(simbolos):
+                entrada = self._datos.get(simbolo)
+                if entrada is not None and ahora - entrada[0] <= max_edad:
+                    self._datos.move_to_end(simbolo)
+                    self.aciertos += 1
+                    resultados[simbolo] = entrada[1]
+                    continue
+
+                self.fallos += 1
+                vuelo = self._en_vuelo.get(simbolo)
+                if vuelo is None:
+                    vuelo = _Vuelo()
+                    self._en_vuelo[simbolo] = vuelo
+                    mis_vuelos[simbolo] = vuelo
+                else:
+                    self.coalescidas += 1
+                    vuelos_ajenos[simbolo] = vuelo
+
+        if mis_vuelos:
+            try:
+                lote = self._descargar_lote(list(mis_vuelos))
+                for simbolo, vuelo in mis_vuelos.items():
+                    vuelo.resultado = lote.get(simbolo, (None, None, None))
+                    if vuelo.resultado[0] is not None:
+                        self.guardar(simbolo, vuelo.resultado)
+            finally:
+                with self._lock:
+                    for simbolo in mis_vuelos:
+                        del self._en_vuelo[simbolo]
+                for vuelo in mis_vuelos.values():
+                    vuelo.evento.set()
+
+            for simbolo, vuelo in mis_vuelos.items():
+                resultados[simbolo] = vuelo.resultado
+
+        # Los que ya estaba descargando otro: esperamos su resultado
+        for simbolo, vuelo in vuelos_ajenos.items():
+            vuelo.evento.wait()
+            resultados[simbolo] = vuelo.resultado
+
+        return resultados
+
+    def descargar_ya(self, simbolo):
+        """
+        Descarga 'simbolo' SIN esperar a un vuelo que ya esté en curso (ej: un
+        lote atascado) y guarda el resultado si es bueno.
+        """
+        resultado = self._descargar(simbolo)
+        if resultado[0] is not None:
+            self.guardar(simbolo, resultado)
+        return resultado
+
+    def frescos(self, simbolos, max_edad):
+        """
+        Devuelve SOLO los símbolos que ya están en caché y son frescos.
+        Nunca sale a la red (se puede llamar desde el bucle de eventos).
+        """
+        resultados = {}
+        with self._lock:
+            ahora = time.monotonic()
+            for simbolo in set(simbolos):
+                entrada = self._datos.get(simbolo)
+                if entrada is not None and ahora - entrada[0] <= max_edad:
+                    self._datos.move_to_end(simbolo)
+                    self.aciertos += 1
+                    resultados[simbolo] = entrada[1]
+        return resultados
+
+    def guardar(self, simbolo, resultado):
+        """Mete (o refresca) una cotización en la caché."""
+        with self._lock:
+            self._datos[simbolo] = (time.monotonic(), resultado)
+            self._datos.move_to_end(simbolo)
+
+            while len(self._datos) > self._max_simbolos:
+                self._datos.popitem(last=False)
+                self.expulsadas += 1
+
+    def edad(self, simbolo):
+        """Segundos desde que se guardó 'simbolo' (None si no está en caché)."""
+        with self._lock:
+            entrada = self._datos.get(simbolo)
+            if entrada is None:
+                return None
+            return time.monotonic() - entrada[0]
+
+    def estadisticas(self):
+        """Foto de los contadores de la caché."""
+        with self._lock:
+            return {
+                "simbolos": len(self._datos),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "coalescidas": self.coalescidas,
+                "expulsadas": self.expulsadas,
+            }
+
+
+# Instancia única para todo el proceso
+cache_cotizaciones = CacheCotizaciones(descargar_cotizacion, descargar_cotizaciones_lote)
+
+
+def obtener_precio_actual(ticker_simbolo, uso="interactivo"):
+    """
+    Obtiene el último precio del ticker Y EL CAMBIO DIARIO (pasando por la caché).
+    'uso' es el tipo de llamada ("interactivo", "resumen", "alertas", "moneda")
+    y decide la edad máxima aceptable (ver MAX_EDAD_COTIZACION en config.py).
+    Devuelve (precio_actual, moneda, percent_change) o (None, None, None).
+    """
+    max_edad = MAX_EDAD_COTIZACION.get(uso, MAX_EDAD_COTIZACION["interactivo"])
+    return cache_cotizaciones.obtener(ticker_simbolo, max_edad)
+
+
+def obtener_precios(simbolos, uso="interactivo"):
+    """
+    Versión "lista" de obtener_precio_actual: una sola petición a Yahoo para
+    todos los símbolos que no estén frescos en la caché.
+    Devuelve un dict {simbolo: (precio_actual, moneda, percent_change)}.
+    """
+    max_edad = MAX_EDAD_COTIZACION.get(uso, MAX_EDAD_COTIZACION["interactivo"])
+    return cache_cotizaciones.obtener_varios(simbolos, max_edad)
+
+
+# --- 3. Versión ASYNC (para los handlers y la JobQueue) ---
+
+# yfinance es bloqueante: lo mandamos a un pool de hilos ACOTADO para que una
+# respuesta lenta de Yahoo no congele el bucle de eventos (ni al resto de chats).
+_executor = ThreadPoolExecutor(
+    max_workers=MAX_DESCARGAS_SIMULTANEAS,
+    thread_name_prefix="cotizaciones"
+)
+
+
+async def obtener_precio_async(ticker_simbolo, uso="interactivo", timeout=TIMEOUT_COTIZACION):
+    """
+    Igual que obtener_precio_actual, pero se puede 'await'-ear sin bloquear.
+    Si Yahoo tarda más de 'timeout' segundos, devuelve (None, None, None).
+    """
+    loop = asyncio.get_running_loop()
+    futuro = loop.run_in_executor(_executor, obtener_precio_actual, ticker_simbolo, uso)
+    try:
+        return await asyncio.wait_for(futuro, timeout)
+    except asyncio.TimeoutError:
+        print(f"*** TIMEOUT ({timeout}s) al obtener precio para {ticker_simbolo} ***")
+        return None, None, None
+
+
+async def obtener_varios_async(simbolos, uso="interactivo", timeout=TIMEOUT_COTIZACION):
+    """
+    Pide varios símbolos de golpe (UN lote a Yahoo) y espera como mucho
+    'timeout' segundos EN TOTAL.
+    Devuelve (resultados, caducados):
+      - resultados: dict {simbolo: (precio, moneda, percent_change)}
+      - caducados: set con los símbolos que no respondieron a tiempo
+    Los que ya estaban frescos en la caché se devuelven siempre. Los que no
+    vengan en el lote se piden uno a uno A LA VEZ (plan B), dentro del mismo
+    plazo: la espera la marca el más lento, no la suma, y cada símbolo que
+    llegue a tiempo se devuelve aunque otros no lleguen. Si el lote no ha
+    acabado en FRACCION_ESPERA_LOTE del plazo, el plan B sale para todos sin
+    esperarlo (y el lote sigue: cada símbolo se queda con lo que llegue antes).
+    """
+    max_edad = MAX_EDAD_COTIZACION.get(uso, MAX_EDAD_COTIZACION["interactivo"])
+    simbolos = set(simbolos)
+
+    # 1. Lo que ya tenemos fresco no espera a nadie
+    resultados = cache_cotizaciones.frescos(simbolos, max_edad)
+    pendientes = simbolos - resultados.keys()
+    if not pendientes:
+        return resultados, set()
+
+    # 2. El resto, en un único lote fuera del bucle de eventos
+    loop = asyncio.get_running_loop()
+    fin = loop.time() + timeout
+    futuro_lote = loop.run_in_executor(_executor, obtener_precios, pendientes, uso)
+    await asyncio.wait([futuro_lote], timeout=timeout * FRACCION_ESPERA_LOTE)
+
+    # 3. Plan B, uno a uno y a la vez
+    if futuro_lote.done():
+        # ...de los que no vinieron en el lote
+        resultados.update(_validos_del_lote(futuro_lote, pendientes))
+        esperando = set()
+        futuros = {
+            simbolo: loop.run_in_executor(_executor, obtener_precio_actual, simbolo, uso)
+            for simbolo in pendientes - resultados.keys()
+        }
+    else:
+        # ...de TODOS, sin esperar más al lote (ej: Yahoo atascado). Sin pasar
+        # por el single-flight de la caché, que los tiene "en vuelo" con el lote
+        print(f"*** El lote de {sorted(pendientes)} tarda más de "
+              f"{timeout * FRACCION_ESPERA_LOTE:.1f}s: plan B para todos ***")
+        esperando = {futuro_lote}
+        futuros = {
+            simbolo: loop.run_in_executor(_executor, cache_cotizaciones.descargar_ya, simbolo)
+            for simbolo in pendientes
+        }
+    if not futuros:
+        return resultados, set()
+
+    simbolo_del_futuro = {futuro: simbolo for simbolo, futuro in futuros.items()}
+    esperando |= set(futuros.values())
+    fallidos = {}  # plan B sin precio (por si el lote aún lo trae)
+
+    def faltan():
+        sin_respuesta = pendientes - resultados.keys()
+        return sin_respuesta - fallidos.keys() if futuro_lote.done() else sin_respuesta
+
+    while esperando and faltan():
+        hechos, esperando = await asyncio.wait(
+            esperando, timeout=max(0.0, fin - loop.time()), return_when=asyncio.FIRST_COMPLETED)
+        if not hechos:
+            break
+        for futuro in hechos:
+            if futuro is futuro_lote:
+                for simbolo, datos in _validos_del_lote(futuro_lote, pendientes).items():
+                    resultados.setdefault(simbolo, datos)
+                continue
+            simbolo = simbolo_del_futuro[futuro]
+            datos = futuro.result()
+            if datos[0] is not None:
+                resultados.setdefault(simbolo, datos)
+            else:
+                fallidos[simbolo] = datos
+
+    for futuro in futuros.values():
+        futuro.cancel()  # (no hace nada si ya está corriendo o acabó)
+    caducados = set()
+    for simbolo in pendientes - resultados.keys():
+        if simbolo in fallidos:
+            resultados[simbolo] = fallidos[simbolo]
+        else:
+            caducados.add(simbolo)
+            print(f"*** TIMEOUT ({timeout}s) al obtener precio para {simbolo} ***")
+
+    return resultados, caducados
+
+
+def _validos_del_lote(futuro_lote, pendientes):
+    """Los precios buenos de un lote YA acabado (vacío si falló)."""
+    try:
+        lote = futuro_lote.result()
+    except Exception as e:
+        print(f"*** ERROR en el lote de {sorted(pendientes)}: {e} ***")
+        return {}
+    return {simbolo: datos for simbolo, datos in lote.items()
+            if simbolo in pendientes and datos is not None and datos[0] is not None}
+
+
+# --- 4. La "Foto" de precios (la rellena el job de prefetch) ---
+
+# Una foto es INMUTABLE: el job crea una nueva y la publica de golpe, así los
+# handlers nunca ven una foto a medio rellenar.
+FotoPrecios = namedtuple("FotoPrecios", ["instante", "precios"])
+
+_foto_actual = FotoPrecios(instante=0.0, precios=MappingProxyType({}))
+
+
+def publicar_foto(precios):
+    """Sustituye la foto actual por una nueva con 'precios' (solo los válidos)."""
+    global _foto_actual
+    validos = {simbolo: datos for simbolo, datos in precios.items() if datos[0] is not None}
+    _foto_actual = FotoPrecios(instante=time.monotonic(), precios=MappingProxyType(validos))
+    return _foto_actual
+
+
+def foto_actual():
+    """Devuelve la última foto publicada."""
+    return _foto_actual
+
+
+def precios_de_la_foto(simbolos, max_edad=MAX_EDAD_FOTO):
+    """
+    Lo que la foto puede dar YA de 'simbolos': (precios, faltan, edad).
+    'precios' solo trae los que tiene la foto y 'faltan' es el set del resto
+    (todos si la foto es más vieja que 'max_edad').
+    """
+    foto = _foto_actual
+    edad = time.monotonic() - foto.instante
+    simbolos = set(simbolos)
+    if edad > max_edad:
+        return {}, simbolos, edad
+
+    precios = {simbolo: foto.precios[simbolo] for simbolo in simbolos if simbolo in foto.precios}
+    return precios, simbolos - precios.keys(), edad
+
+
+async def obtener_con_foto(simbolos, uso="interactivo", timeout=TIMEOUT_COTIZACION):
+    """
+    Primero mira la foto (milisegundos) y solo va a la caché / Yahoo por
+    los símbolos que le falten.
+    Devuelve (resultados, caducados, edad) donde 'edad' son los segundos
+    que tiene el dato más viejo de la respuesta.
+    """
+    precios, faltan, edad_foto = precios_de_la_foto(simbolos)
+    if not faltan:
+        return precios, set(), edad_foto
+
+    traidos, caducados = await obtener_varios_async(faltan, uso=uso, timeout=timeout)
+    edades = [cache_cotizaciones.edad(simbolo) for simbolo in traidos]
+    if precios:
+        edades.append(edad_foto)
+    edad = max((e for e in edades if e is not None), default=0.0)
+    precios.update(traidos)
+    return precios, caducados, edad
@@ -0,0 +1,179 @@
+"""
+Prueba local del modo WEBHOOK contra un Telegram FALSO (sin Internet, sin BD).
+
+- Levanta una "Bot API" falsa (getMe, setWebhook, sendMessage...) en un puerto.
+- Levanta el servidor web del bot (servidor_web.py) con el webhook (webhook.py)
+  y una Application de verdad con un handler de eco.
+- Cuando el bot registra el webhook, el Telegram falso le manda N updates por
+  POST (como hace Telegram) y espera las N respuestas 'sendMessage'.
+- Comprueba además '/', '/readyz' y que un secreto incorrecto da 403.
+
+Uso:  python falso_telegram.py [numero_de_updates]
+"""
+import asyncio
+import json
+import statistics
+import sys
+import time
+from urllib.parse import parse_qsl
+
+import httpx
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+from servidor_web import ServidorWeb, respuesta_json, respuesta_texto
+from webhook import ejecutar_webhook
+
+
+TOKEN = "123456:FALSO"
+PUERTO_API = 8701
+PUERTO_BOT = 8702
+SECRETO = "secreto-de-prueba"
+
+
+class TelegramFalso:
+    """Bot API mínima: apunta lo que le llega y contesta como Telegram."""
+
+    def __init__(self):
+        self.servidor = ServidorWeb()
+        self.webhook = None
+        self.webhook_registrado = asyncio.Event()
+        self.enviados = {}  # update_id -> instante en que llegó su sendMessage
+        self.todos_enviados = asyncio.Event()
+        self.esperados = 0
+
+        for metodo, manejador in [
+            ("getMe", self.get_me),
+            ("setWebhook", self.set_webhook),
+            ("deleteWebhook", self.ok),
+            ("sendMessage", self.send_message),
+        ]:
+            self.servidor.ruta("POST", f"/bot{TOKEN}/{metodo}", manejador)
+
+    @staticmethod
+    def _parametros(peticion):
+        """PTB manda los parámetros como formulario; los valores compuestos van en JSON."""
+        parametros = {}
+        for nombre, valor in parse_qsl(peticion.cuerpo.decode("utf-8")):
+            try:
+                parametros[nombre] = json.loads(valor)
+            except ValueError:
+                parametros[nombre] = valor
+        return parametros
+
+    async def ok(self, peticion):
+        return respuesta_json(200, {"ok": True, "result": True})
+
+    async def get_me(self, peticion):
+        return respuesta_json(200, {"ok": True, "result": {
+            "id": 1, "is_bot": True, "first_name": "Falso", "username": "falso_bot"}})
+
+    async def set_webhook(self, peticion):
+        parametros = self._parametros(peticion)
+        self.webhook = (parametros["url"], parametros.get("secret_token"))
+        self.webhook_registrado.set()
+        return respuesta_json(200, {"ok": True, "result": True})
+
+    async def send_message(self, peticion):
+        parametros = self._parametros(peticion)
+        update_id = int(str(parametros["text"]).rsplit(" ", 1)[-1])
+        self.enviados[update_id] = time.perf_counter()
+        if len(self.enviados) >= self.esperados:
+            self.todos_enviados.set()
+        return respuesta_json(200, {"ok": True, "result": {
+            "message_id": update_id, "date": int(time.time()),
+            "chat": {"id": parametros["chat_id"], "type": "private"},
+            "text": parametros["text"]}})
+
+
+def update_de_texto(update_id, texto):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": 1000 + update_id % 50, "type": "private"},
+            "from": {"id": 1000 + update_id % 50, "is_bot": False, "first_name": "Prueba"},
+            "text": texto,
+        },
+    }
+
+
+async def eco(update, context):
+    await update.message.reply_text(f"eco {update.update_id}")
+
+
+async def main():
+    n_updates = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    telegram_falso = TelegramFalso()
+    telegram_falso.esperados = n_updates
+    await telegram_falso.servidor.arrancar(PUERTO_API, host="127.0.0.1")
+
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .base_url(f"http://127.0.0.1:{PUERTO_API}/bot")
+        .updater(None)
+        .concurrent_updates(True)
+        .build()
+    )
+    application.add_handler(MessageHandler(filters.TEXT, eco))
+
+    # Las mismas rutas que registra bot.py
+    async def hello(peticion):
+        return respuesta_texto(200, "Bot is alive!")
+
+    async def readyz(peticion):
+        return respuesta_texto(200, "ready") if application.running else respuesta_texto(503, "not ready")
+
+    servidor_bot = ServidorWeb()
+    servidor_bot.ruta("GET", "/", hello)
+    servidor_bot.ruta("GET", "/readyz", readyz)
+    await servidor_bot.arrancar(PUERTO_BOT, host="127.0.0.1")
+
+    parada = asyncio.Event()
+    url = f"http://127.0.0.1:{PUERTO_BOT}/telegram"
+    bot = asyncio.create_task(ejecutar_webhook(application, servidor_bot, url, SECRETO, parada=parada))
+
+    await asyncio.wait_for(telegram_falso.webhook_registrado.wait(), 10)
+    url_registrada, secreto_registrado = telegram_falso.webhook
+    assert (url_registrada, secreto_registrado) == (url, SECRETO), telegram_falso.webhook
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PUERTO_BOT}") as cliente:
+        assert (await cliente.get("/")).text == "Bot is alive!"
+        assert (await cliente.get("/readyz")).status_code == 200
+        malo = await cliente.post("/telegram", json=update_de_texto(0, "hola"),
+                                  headers={"X-Telegram-Bot-Api-Secret-Token": "otro"})
+        assert malo.status_code == 403, malo.status_code
+
+        # Telegram abre varias conexiones a la vez: simulamos unas cuantas
+        enviados_en = {}
+        cola = list(range(1, n_updates + 1))
+
+        async def conexion_de_telegram():
+            while cola:
+                update_id = cola.pop()
+                enviados_en[update_id] = time.perf_counter()
+                respuesta = await cliente.post("/telegram", json=update_de_texto(update_id, "hola"),
+                                               headers={"X-Telegram-Bot-Api-Secret-Token": SECRETO})
+                assert respuesta.status_code == 200, respuesta.status_code
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(conexion_de_telegram() for _ in range(8)))
+        await asyncio.wait_for(telegram_falso.todos_enviados.wait(), 30)
+        duracion = time.perf_counter() - inicio
+
+    parada.set()
+    await bot
+    await servidor_bot.parar()
+    await telegram_falso.servidor.parar()
+
+    latencias = sorted((telegram_falso.enviados[i] - enviados_en[i]) * 1000 for i in enviados_en)
+    print(f"OK: {n_updates} updates por webhook -> {len(telegram_falso.enviados)} respuestas "
+          f"en {duracion:.2f}s ({n_updates / duracion:,.0f} updates/s)")
+    print(f"Latencia update -> sendMessage: p50 {statistics.median(latencias):.1f} ms, "
+          f"p99 {latencias[int(len(latencias) * 0.99) - 1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,231 @@
+import bisect
+import threading
+from collections import namedtuple
+from itertools import chain
+from operator import itemgetter
+
+
+# Una alerta tal y como la guarda el índice (sale de la tabla 'alerts')
+Alerta = namedtuple("Alerta", ["id", "chat_id", "simbolo", "alias", "target"])
+
+
+class _ListaOrdenada:
+    """
+    Lista de alertas ordenada por una clave numérica (listas paralelas).
+    Las que "cambian de estado" siempre quedan al FINAL de la lista, así que
+    sacarlas es cortar la cola: O(log n) para encontrar el corte + O(k).
+    Meter las k que llegan de la otra lista es UNA fusión lineal (no k
+    inserciones de O(n) cada una).
+    """
+
+    # Con pocas, k inserciones (memmove en C) ganan a la fusión en Python
+    MAX_INSERCIONES_SUELTAS = 16
+
+    def __init__(self):
+        self.claves = []
+        self.alertas = []
+
+    def __len__(self):
+        return len(self.alertas)
+
+    def meter(self, clave, alerta):
+        i = bisect.bisect_right(self.claves, clave)
+        self.claves.insert(i, clave)
+        self.alertas.insert(i, alerta)
+
+    def meter_varias(self, claves, alertas):
+        """Mete muchas de golpe. 'claves' (y sus 'alertas') vienen YA ordenadas."""
+        if len(claves) <= self.MAX_INSERCIONES_SUELTAS:
+            for clave, alerta in zip(claves, alertas):
+                self.meter(clave, alerta)
+        elif not self.claves or claves[0] >= self.claves[-1]:
+            # Todas van detrás (ej: la lista estaba vacía)
+            self.claves.extend(claves)
+            self.alertas.extend(alertas)
+        else:
+            # Dos tramos ya ordenados: el sort (estable) los fusiona en una
+            # pasada, y con la misma clave las que ya estaban van primero
+            # (igual que bisect_right en 'meter')
+            pares = sorted(zip(chain(self.claves, claves), chain(self.alertas, alertas)), key=itemgetter(0))
+            self.claves = [clave for clave, _ in pares]
+            self.alertas = [alerta for _, alerta in pares]
+
+    def cortar_cola(self, desde_clave):
+        """Saca y devuelve todas las alertas con clave > 'desde_clave'."""
+        i = bisect.bisect_right(self.claves, desde_clave)
+        cola = self.alertas[i:]
+        del self.claves[i:]
+        del self.alertas[i:]
+        return cola
+
+    def quitar(self, clave, alert_id):
+        """Quita la alerta 'alert_id' (que tiene esta clave). Devuelve True si estaba."""
+        i = bisect.bisect_left(self.claves, clave)
+        while i < len(self.claves) and self.claves[i] == clave:
+            if self.alertas[i].id == alert_id:
+                del self.claves[i]
+                del self.alertas[i]
+                return True
+            i += 1
+        return False
+
+
+class _IndiceSimbolo:
+    """
+    Las alertas de UN símbolo, en dos listas:
+      - armadas: ordenadas por target ASCENDENTE. Se disparan las que tienen
+        target > precio, que son justo la cola de la lista.
+      - disparadas: ordenadas por -target (target DESCENDENTE). Se re-arman las
+        que tienen target < precio, que también son la cola.
+    """
+
+    def __init__(self):
+        self.armadas = _ListaOrdenada()
+        self.disparadas = _ListaOrdenada()
+
+    def __len__(self):
+        return len(self.armadas) + len(self.disparadas)
+
+
+class IndiceAlertas:
+    """
+    Índice en memoria de TODAS las alertas, agrupadas por símbolo.
+
+    En cada tick, 'evaluar(simbolo, precio)' devuelve solo las alertas que
+    CAMBIAN de estado, con coste O(log n + k) (k = las que cambian) en vez de
+    recorrer las n alertas del símbolo.
+
+    Recarga: empezar_carga() ANTES de leer la tabla y cargar(filas) con lo
+    leído. Las altas y bajas que lleguen mientras tanto se apuntan y se
+    repiten encima de lo leído, así no se pierde una alta ni "resucita" una
+    alerta borrada por leer una foto de la tabla de antes del cambio.
+    """
+
+    def __init__(self):
+        self._por_simbolo = {}
+        self._estado = {}  # alert_id -> (alerta, is_triggered)
+        self._lock = threading.Lock()
+        self._cambios_en_carga = None  # [(alerta, is_triggered) o alert_id...] mientras se recarga
+        self.cargado = False
+
+    def __len__(self):
+        return len(self._estado)
+
+    def empezar_carga(self):
+        """Desde aquí hasta 'cargar', las altas y bajas se apuntan para repetirlas."""
+        with self._lock:
+            self._cambios_en_carga = []
+
+    def cargar(self, filas):
+        """
+        (Re)construye el índice desde cero y le aplica las altas y bajas
+        apuntadas desde 'empezar_carga'.
+        'filas' = (id, chat_id, ticker_symbol, alias_general, target_price, is_triggered)
+        """
+        with self._lock:
+            self._por_simbolo = {}
+            self._estado = {}
+            # Se agrupan primero y se ordena cada lista UNA vez (meterlas una
+            # a una en orden cualquiera sería O(n²) en un símbolo con muchas)
+            por_lista = {}
+            for alert_id, chat_id, simbolo, alias, target, is_triggered in filas:
+                alerta = Alerta(alert_id, chat_id, simbolo, alias, float(target))
+                is_triggered = bool(is_triggered)
+                por_lista.setdefault((simbolo, is_triggered), []).append(alerta)
+                self._estado[alert_id] = (alerta, is_triggered)
+            for (simbolo, is_triggered), alertas in por_lista.items():
+                indice = self._por_simbolo.setdefault(simbolo, _IndiceSimbolo())
+                if is_triggered:
+                    alertas.sort(key=lambda alerta: -alerta.target)
+                    indice.disparadas.meter_varias([-alerta.target for alerta in alertas], alertas)
+                else:
+                    alertas.sort(key=lambda alerta: alerta.target)
+                    indice.armadas.meter_varias([alerta.target for alerta in alertas], alertas)
+
+            for cambio in self._cambios_en_carga or ():
+                if isinstance(cambio, int):
+                    self._quitar(cambio)
+                elif cambio[0].id not in self._estado:
+                    self._meter(*cambio)
+            self._cambios_en_carga = None
+            self.cargado = True
+
+    def agregar(self, alerta, is_triggered=False):
+        """
+        Mete una alerta nueva (recién insertada en la BD).
+        Si el índice se está recargando se apunta para después; si no está
+        cargado (ni cargándose) no hace nada: ya la leerá 'cargar'.
+        """
+        with self._lock:
+            if self._cambios_en_carga is not None:
+                self._cambios_en_carga.append((alerta, is_triggered))
+            elif self.cargado and alerta.id not in self._estado:
+                self._meter(alerta, is_triggered)
+
+    def quitar(self, alert_id):
+        """Quita una alerta (recién borrada de la BD). Devuelve True si estaba."""
+        with self._lock:
+            if self._cambios_en_carga is not None:
+                self._cambios_en_carga.append(alert_id)
+            return self._quitar(alert_id)
+
+    def _quitar(self, alert_id):
+        if alert_id not in self._estado:
+            return False
+        alerta, is_triggered = self._estado.pop(alert_id)
+        indice = self._por_simbolo[alerta.simbolo]
+        if is_triggered:
+            indice.disparadas.quitar(-alerta.target, alert_id)
+        else:
+            indice.armadas.quitar(alerta.target, alert_id)
+        if not indice:
+            del self._por_simbolo[alerta.simbolo]
+        return True
+
+    def simbolos(self):
+        """Símbolos que tienen al menos una alerta."""
+        with self._lock:
+            return list(self._por_simbolo)
+
+    def alertas_por_simbolo(self):
+        """Dict {símbolo: número de alertas} (como base_datos.alertas_por_simbolo)."""
+        with self._lock:
+            return {simbolo: len(indice) for simbolo, indice in self._por_simbolo.items()}
+
+    def evaluar(self, simbolo, precio):
+        """
+        Aplica un precio nuevo a las alertas de 'simbolo'.
+        Devuelve (disparadas, rearmadas): listas de Alerta que han cambiado.
+        El índice queda YA actualizado con el nuevo estado.
+        """
+        with self._lock:
+            indice = self._por_simbolo.get(simbolo)
+            if indice is None:
+                return [], []
+
+            # Armadas con target > precio -> se disparan (el precio cayó por debajo)
+            disparadas = indice.armadas.cortar_cola(precio)
+            # Disparadas con target < precio -> se re-arman (-target > -precio)
+            rearmadas = indice.disparadas.cortar_cola(-precio)
+
+            # Cada cola sale ordenada al revés de como la quiere la otra lista
+            # (target ascendente <-> -target ascendente): se da la vuelta y se fusiona
+            nuevas = disparadas[::-1]
+            indice.disparadas.meter_varias([-alerta.target for alerta in nuevas], nuevas)
+            nuevas = rearmadas[::-1]
+            indice.armadas.meter_varias([alerta.target for alerta in nuevas], nuevas)
+
+            for alerta in disparadas:
+                self._estado[alerta.id] = (alerta, True)
+            for alerta in rearmadas:
+                self._estado[alerta.id] = (alerta, False)
+
+            return disparadas, rearmadas
+
+    def _meter(self, alerta, is_triggered):
+        indice = self._por_simbolo.setdefault(alerta.simbolo, _IndiceSimbolo())
+        if is_triggered:
+            indice.disparadas.meter(-alerta.target, alerta)
+        else:
+            indice.armadas.meter(alerta.target, alerta)
+        self._estado[alerta.id] = (alerta, bool(is_triggered))
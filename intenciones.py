@@ -0,0 +1,154 @@
+import re
+
+from config import (
+    TICKERS_A_VIGILAR,
+    PATRON_SALUDO,
+    PATRON_GRACIAS,
+    PATRON_TICKERS,
+    PATRON_OPCIONES,
+    PATRON_TODO,
+    PATRON_MIS_ALERTAS)
+
+
+# Intenciones "de charla/ayuda", en el MISMO orden de prioridad de siempre
+# (van DESPUÉS de los tickers: si el texto nombra un activo, gana el activo)
+INTENCIONES_TEXTO = [
+    ("opciones", PATRON_OPCIONES),
+    ("tickers", PATRON_TICKERS),
+    ("mis_alertas", PATRON_MIS_ALERTAS),
+    ("saludo", PATRON_SALUDO),
+    ("gracias", PATRON_GRACIAS),
+    ("todo", PATRON_TODO),
+]
+
+# Patrones del tipo \b(palabra|otra|...)\b (los de TICKERS_A_VIGILAR)
+_PATRON_DE_PALABRAS = re.compile(r"\\b\((?:\?:)?([^()\\\[\]]*)\)\\b")
+_PALABRA = re.compile(r"\w+")
+
+
+def _separar_palabras(patron):
+    """
+    Si 'patron' es \\b(a|b|...)\\b devuelve (palabras, resto): las alternativas
+    que son UNA palabra (\\w+) y las demás (ej: 's&p', 'mis alertas').
+    Para cualquier otro patrón devuelve None.
+    """
+    m = _PATRON_DE_PALABRAS.fullmatch(patron)
+    if m is None:
+        return None
+    palabras, resto = [], []
+    for alternativa in m.group(1).split("|"):
+        (palabras if _PALABRA.fullmatch(alternativa) else resto).append(alternativa)
+    return palabras, resto
+
+
+def _alternativas_literales(patron):
+    """Alternativas de \\b(a|b|...)\\b que son texto tal cual (sin símbolos de regex)."""
+    m = _PATRON_DE_PALABRAS.fullmatch(patron)
+    if m is None:
+        return []
+    return [alternativa for alternativa in m.group(1).split("|")
+            if alternativa and not any(c in alternativa for c in ".^$*+?{}")]
+
+
+class RouterIntenciones:
+    """
+    Decide QUÉ quiere el usuario (y qué activo) sin probar los patrones uno a uno.
+
+    Cada patrón tiene una prioridad: primero los activos (en el orden de
+    TICKERS_A_VIGILAR) y después INTENCIONES_TEXTO. Gana, como siempre, el de
+    MENOR prioridad que aparezca en cualquier parte del texto.
+
+    Al compilar, las alternativas que son una palabra entera (\\b(btc|bitcoin)\\b)
+    van a un dict palabra -> prioridad: '\\bbtc\\b' casa justo cuando 'btc' es
+    una de las palabras (\\w+) del texto. Así, nombrar un activo cuesta lo mismo
+    con 7 activos que con 1000. Lo que no cabe en el dict (patrones sin \\b,
+    's&p', 'mis alertas'...) se queda como regex compilada y solo se prueba si
+    tiene MÁS prioridad que lo encontrado por palabras.
+    """
+
+    def __init__(self, tickers=TICKERS_A_VIGILAR, intenciones=INTENCIONES_TEXTO):
+        self._destinos = []    # prioridad -> (intención, ticker_info)
+        self._por_palabra = {}  # palabra -> prioridad (la más alta si se repite)
+        self._restantes = []   # [(prioridad, regex compilada)] en orden
+
+        patrones = [(("ticker", ticker_info), ticker_info["patron_regex"]) for ticker_info in tickers]
+        patrones += [((intencion, None), patron) for intencion, patron in intenciones]
+
+        for prioridad, (destino, patron) in enumerate(patrones):
+            self._destinos.append(destino)
+            separado = _separar_palabras(patron)
+            if separado is None:
+                self._restantes.append((prioridad, re.compile(patron)))
+                continue
+
+            palabras, resto = separado
+            for palabra in palabras:
+                self._por_palabra.setdefault(palabra, prioridad)
+            if resto:
+                self._restantes.append((prioridad, re.compile(r"\b(" + "|".join(resto) + r")\b")))
+
+    def __len__(self):
+        return len(self._destinos)
+
+    def enrutar(self, texto):
+        """
+        Devuelve (intención, ticker_info):
+          - ("ticker", {...entrada de TICKERS_A_VIGILAR...}) si nombra un activo
+          - ("opciones" | "tickers" | "mis_alertas" | "saludo" | "gracias" | "todo", None)
+          - (None, None) si no es nada
+        'texto' ya debe venir en minúsculas.
+        """
+        mejor = len(self._destinos)
+        por_palabra = self._por_palabra
+        for palabra in _PALABRA.findall(texto):
+            prioridad = por_palabra.get(palabra, mejor)
+            if prioridad < mejor:
+                mejor = prioridad
+
+        for prioridad, regex in self._restantes:
+            if prioridad >= mejor:
+                break
+            if regex.search(texto):
+                mejor = prioridad
+                break
+
+        if mejor == len(self._destinos):
+            return None, None
+        return self._destinos[mejor]
+
+
+class IndiceAlias:
+    """
+    Resuelve el <trigger> de '/alerta <trigger> <precio>' con un dict.
+
+    Al cargar, cada alternativa LITERAL de los patrones (sp500, s&p, btc,
+    gold...) se apunta como alias -> entrada de TICKERS_A_VIGILAR. La entrada
+    de cada alias la decide el propio router de activos, así que es la misma
+    que daría el bucle de re.search de siempre (gana el primer activo).
+    Si el trigger no es un alias exacto (ej: 'btc!'), se usa el router de
+    activos como respaldo.
+    """
+
+    def __init__(self, tickers=TICKERS_A_VIGILAR):
+        # Solo activos: aquí no hay saludos ni "gracias"
+        self._router = RouterIntenciones(tickers=tickers, intenciones=())
+        self._por_alias = {}
+        for ticker_info in tickers:
+            for alias in _alternativas_literales(ticker_info["patron_regex"]):
+                if alias not in self._por_alias:
+                    self._por_alias[alias] = self._router.enrutar(alias)[1]
+
+    def __len__(self):
+        return len(self._por_alias)
+
+    def buscar(self, trigger):
+        """Entrada de TICKERS_A_VIGILAR para 'trigger', o None si no es ningún activo."""
+        trigger = trigger.lower().strip()
+        if trigger in self._por_alias:
+            return self._por_alias[trigger]
+        return self._router.enrutar(trigger)[1]
+
+
+# El router y el índice de alias de TICKERS_A_VIGILAR (se crean UNA vez, al importar)
+router_intenciones = RouterIntenciones()
+indice_alias = IndiceAlias()
@@ -0,0 +1,171 @@
+import bisect
+import functools
+import threading
+import time
+
+
+# Límites (en segundos) por defecto de los histogramas de tiempos
+LIMITES_POR_DEFECTO = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histograma:
+    """
+    Histograma de tiempos con "cubos" fijos (al estilo Prometheus).
+    Cada observación suma 1 al primer cubo cuyo límite es >= que el valor.
+    """
+
+    def __init__(self, limites=LIMITES_POR_DEFECTO):
+        self.limites = tuple(limites)
+        self.cubos = [0] * (len(self.limites) + 1)  # el último es "+Inf"
+        self.cuenta = 0
+        self.suma = 0.0
+        self._lock = threading.Lock()
+
+    def observar(self, valor):
+        i = bisect.bisect_left(self.limites, valor)
+        with self._lock:
+            self.cubos[i] += 1
+            self.cuenta += 1
+            self.suma += valor
+
+    def foto(self):
+        """Dict con los cubos (no acumulados), la cuenta y la suma."""
+        with self._lock:
+            cubos = {f"<={limite}": n for limite, n in zip(self.limites, self.cubos)}
+            cubos["+Inf"] = self.cubos[-1]
+            return {"cubos": cubos, "cuenta": self.cuenta, "suma": round(self.suma, 6)}
+
+    def acumulados(self):
+        """[(límite, observaciones <= límite)...] con "+Inf" al final, la suma y la cuenta."""
+        with self._lock:
+            cubos, suma, cuenta = list(self.cubos), self.suma, self.cuenta
+        total, acumulados = 0, []
+        for limite, n in zip(self.limites + ("+Inf",), cubos):
+            total += n
+            acumulados.append((limite, total))
+        return acumulados, suma, cuenta
+
+
+class Contador:
+    """Contador que solo sube."""
+
+    def __init__(self):
+        self.valor = 0
+        self._lock = threading.Lock()
+
+    def incrementar(self, n=1):
+        with self._lock:
+            self.valor += n
+
+
+# --- Registro de métricas (lo que se publica en /metrics) ---
+
+class Familia:
+    """
+    Una métrica con etiquetas: un Contador / Histograma por cada combinación
+    de valores. Ej: familia.con(handler="manejar_texto").observar(0.02)
+    """
+
+    def __init__(self, nombre, ayuda, tipo, etiquetas, crear):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.tipo = tipo
+        self.etiquetas = tuple(etiquetas)
+        self._crear = crear
+        self._hijos = {}  # (valores de las etiquetas) -> Contador / Histograma
+        self._lock = threading.Lock()
+
+    def con(self, **etiquetas):
+        clave = tuple(str(etiquetas[nombre]) for nombre in self.etiquetas)
+        hijo = self._hijos.get(clave)
+        if hijo is None:
+            with self._lock:
+                hijo = self._hijos.setdefault(clave, self._crear())
+        return hijo
+
+    def hijos(self):
+        with self._lock:
+            return list(self._hijos.items())
+
+
+class Registro:
+    """Todas las métricas del proceso, exportables en formato texto de Prometheus."""
+
+    def __init__(self):
+        self._familias = []
+        self._calibres = []  # (nombre, ayuda, funcion que devuelve el valor actual)
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        familia = Familia(nombre, ayuda, "counter", etiquetas, Contador)
+        self._familias.append(familia)
+        return familia
+
+    def histograma(self, nombre, ayuda, etiquetas=(), limites=LIMITES_POR_DEFECTO):
+        familia = Familia(nombre, ayuda, "histogram", etiquetas, lambda: Histograma(limites))
+        self._familias.append(familia)
+        return familia
+
+    def calibre(self, nombre, ayuda, funcion):
+        """Valor que se lee en el momento de exportar (ej: conexiones en uso)."""
+        self._calibres.append((nombre, ayuda, funcion))
+
+    def texto(self):
+        """Todas las métricas en el formato de texto de Prometheus (0.0.4)."""
+        lineas = []
+        for familia in self._familias:
+            lineas.append(f"# HELP {familia.nombre} {familia.ayuda}")
+            lineas.append(f"# TYPE {familia.nombre} {familia.tipo}")
+            for valores, hijo in sorted(familia.hijos()):
+                etiquetas = list(zip(familia.etiquetas, valores))
+                if familia.tipo == "counter":
+                    lineas.append(f"{familia.nombre}{_etiquetas(etiquetas)} {hijo.valor}")
+                    continue
+                acumulados, suma, cuenta = hijo.acumulados()
+                for limite, total in acumulados:
+                    lineas.append(f"{familia.nombre}_bucket{_etiquetas(etiquetas + [('le', limite)])} {total}")
+                lineas.append(f"{familia.nombre}_sum{_etiquetas(etiquetas)} {suma}")
+                lineas.append(f"{familia.nombre}_count{_etiquetas(etiquetas)} {cuenta}")
+
+        for nombre, ayuda, funcion in self._calibres:
+            try:
+                valor = funcion()
+            except Exception as error:
+                print(f"Métricas: no se pudo leer '{nombre}': {error}")
+                continue
+            lineas.append(f"# HELP {nombre} {ayuda}")
+            lineas.append(f"# TYPE {nombre} gauge")
+            lineas.append(f"{nombre} {valor}")
+
+        return "\n".join(lineas) + "\n"
+
+
+def _etiquetas(pares):
+    if not pares:
+        return ""
+    def escapar(valor):
+        return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{nombre}="{escapar(valor)}"' for nombre, valor in pares) + "}"
+
+
+def cronometrar(familia, **etiquetas):
+    """
+    Decorador para funciones 'async': apunta en 'familia' (un histograma)
+    cuánto tarda cada llamada, salga bien o con excepción.
+    """
+    histograma = familia.con(**etiquetas)
+
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        async def cronometrada(*args, **kwargs):
+            inicio = time.perf_counter()
+            try:
+                return await funcion(*args, **kwargs)
+            finally:
+                histograma.observar(time.perf_counter() - inicio)
+        return cronometrada
+
+    return decorador
+
+
+# El registro de ESTE proceso
+registro = Registro()
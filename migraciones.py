@@ -0,0 +1,82 @@
+from base_datos import conexion
+
+
+# --- Migraciones del esquema (en orden, NUNCA se edita una ya publicada) ---
+# Cada una es (version, descripcion, sql). Para cambiar el esquema se añade
+# una nueva al final con la siguiente versión.
+
+MIGRACIONES = [
+    (1, "tabla alerts", """
+        CREATE TABLE IF NOT EXISTS alerts (
+            id SERIAL PRIMARY KEY,
+            chat_id BIGINT NOT NULL,
+            ticker_symbol VARCHAR(20) NOT NULL,
+            alias_general VARCHAR(50) NOT NULL,
+            target_price NUMERIC(12, 2) NOT NULL,
+            is_triggered BOOLEAN DEFAULT FALSE,
+            currency VARCHAR(10)
+        );
+    """),
+
+    # mis_alertas: WHERE chat_id = $1, y lee SOLO estas columnas. Con INCLUDE
+    # PostgreSQL las saca del propio índice (index-only scan) sin ir a la tabla.
+    # (borrar_alerta filtra por (id, chat_id): la PRIMARY KEY de id ya da la fila)
+    (2, "índice por chat_id para /misalertas", """
+        CREATE INDEX IF NOT EXISTS idx_alerts_chat_id
+        ON alerts (chat_id)
+        INCLUDE (id, alias_general, ticker_symbol, target_price, currency);
+    """),
+
+    # Evaluación de alertas: el recuento por símbolo (SELECT ticker_symbol,
+    # count(*) ... GROUP BY ticker_symbol, que sale del índice sin ir a la
+    # tabla) y los UPDATE por (ticker_symbol = ?, is_triggered = ?,
+    # target_price >< precio).
+    (3, "índice por símbolo / estado / objetivo para el JobQueue", """
+        CREATE INDEX IF NOT EXISTS idx_alerts_simbolo_estado_objetivo
+        ON alerts (ticker_symbol, is_triggered, target_price);
+    """),
+]
+
+
+SQL_TABLA_VERSIONES = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    descripcion TEXT NOT NULL,
+    aplicada_en TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+# Número cualquiera (pero fijo) para el cerrojo: si arrancan dos instancias
+# a la vez, la segunda espera a que la primera termine de migrar.
+_CERROJO_MIGRACIONES = 7_446_001
+
+
+async def migrar():
+    """
+    Aplica (en UNA transacción) las migraciones que falten y apunta la versión
+    en 'schema_version'. Devuelve la versión del esquema tras migrar.
+
+    Ojo: CREATE INDEX bloquea las escrituras mientras se construye. Si la tabla
+    ya es enorme, se puede crear antes a mano con CREATE INDEX CONCURRENTLY y
+    el mismo nombre; la migración lo verá (IF NOT EXISTS) y solo lo apuntará.
+    """
+    async with conexion(arranque=True) as conn:
+        async with conn.transaction():
+            await conn.execute("SELECT pg_advisory_xact_lock($1)", _CERROJO_MIGRACIONES)
+            await conn.execute(SQL_TABLA_VERSIONES)
+
+            version_actual = await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+
+            for version, descripcion, sql in MIGRACIONES:
+                if version <= version_actual:
+                    continue
+                print(f"Migración {version}: {descripcion}...")
+                await conn.execute(sql)
+                await conn.execute(
+                    "INSERT INTO schema_version (version, descripcion) VALUES ($1, $2)",
+                    version, descripcion
+                )
+                version_actual = version
+
+    print(f"Esquema de la BD en la versión {version_actual}.")
+    return version_actual
@@ -0,0 +1,251 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque, namedtuple
+from datetime import timedelta
+
+from telegram.error import RetryAfter, TelegramError
+
+from config import (
+    NOTIF_TRABAJADORES,
+    NOTIF_MENSAJES_POR_SEGUNDO,
+    NOTIF_SEGUNDOS_POR_CHAT,
+    NOTIF_MAX_REINTENTOS)
+from metricas import registro
+
+
+# Métricas de los envíos a Telegram (ver /metrics)
+_latencia_envio = registro.histograma(
+    "telegram_envio_latencia_segundos", "Duración de cada send_message de un aviso")
+_retry_after = registro.contador(
+    "telegram_retry_after_total", "Respuestas RetryAfter (flood) de Telegram")
+_envios_fallidos = registro.contador(
+    "telegram_envios_fallidos_total", "Avisos que no se pudieron enviar")
+
+
+# Un mensaje pendiente de enviar
+Mensaje = namedtuple("Mensaje", ["chat_id", "texto", "parse_mode", "intentos"])
+
+
+class _CuboDeFichas:
+    """
+    Limitador global ("token bucket"): como mucho 'tasa' mensajes por segundo,
+    con ráfagas de hasta 'capacidad'. Se puede pausar entero (RetryAfter).
+    """
+
+    def __init__(self, tasa, capacidad):
+        self._tasa = tasa
+        self._capacidad = capacidad
+        self._fichas = capacidad
+        self._ultimo = time.monotonic()
+        self._pausado_hasta = 0.0
+        self._lock = asyncio.Lock()
+
+    def pausar(self, segundos):
+        self._pausado_hasta = max(self._pausado_hasta, time.monotonic() + segundos)
+
+    async def tomar(self):
+        async with self._lock:
+            while True:
+                ahora = time.monotonic()
+                if ahora < self._pausado_hasta:
+                    await asyncio.sleep(self._pausado_hasta - ahora)
+                    continue
+
+                self._fichas = min(self._capacidad, self._fichas + (ahora - self._ultimo) * self._tasa)
+                self._ultimo = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                await asyncio.sleep((1 - self._fichas) / self._tasa)
+
+
+class Despachador:
+    """
+    Despachador de avisos hacia Telegram.
+
+    - La evaluación de alertas solo hace 'encolar(...)' y sigue: nunca espera
+      a Telegram.
+    - Una cola por chat + un montículo de chats ordenado por el instante en
+      que se les puede volver a escribir (límite POR CHAT). Un trabajador
+      solo saca el mensaje de un chat al que YA se le puede escribir: un chat
+      con cientos de avisos no deja dormidos a los trabajadores, los demás
+      chats siguen saliendo mientras tanto.
+    - Límite GLOBAL de mensajes/segundo (cubo de fichas).
+    - Si Telegram responde RetryAfter (flood), se pausa todo el envío esos
+      segundos y el mensaje vuelve a la cola.
+    """
+
+    def __init__(self,
+                 trabajadores=NOTIF_TRABAJADORES,
+                 mensajes_por_segundo=NOTIF_MENSAJES_POR_SEGUNDO,
+                 segundos_por_chat=NOTIF_SEGUNDOS_POR_CHAT):
+        self._num_trabajadores = trabajadores
+        self._mensajes_por_segundo = mensajes_por_segundo
+        self._segundos_por_chat = segundos_por_chat
+        self._bot = None
+        self._cubo = None
+        self._tareas = []
+        self._pendientes = {}          # chat_id -> deque de Mensaje (solo chats con algo pendiente)
+        self._listos = []              # montículo (instante permitido, orden, chat_id), un chat con pendientes = una entrada
+        self._orden = itertools.count()
+        self._siguiente_por_chat = {}  # chat_id -> instante a partir del cual se le puede escribir (chats sin pendientes)
+        self._en_cola = 0              # mensajes esperando turno
+        self._sin_terminar = 0         # en cola + enviándose
+        self._novedades = None         # se activa al meter un mensaje
+        self._vacia = None             # activo cuando no queda nada sin terminar
+
+        # Contadores
+        self.encolados = 0
+        self.enviados = 0
+        self.reintentos_flood = 0
+        self.fallidos = 0
+
+    def arrancar(self, bot):
+        """Crea la cola y lanza los trabajadores (dentro del bucle de eventos)."""
+        self._bot = bot
+        self._novedades = asyncio.Event()
+        self._vacia = asyncio.Event()
+        if not self._sin_terminar:
+            self._vacia.set()
+        self._cubo = _CuboDeFichas(self._mensajes_por_segundo, self._mensajes_por_segundo)
+        self._tareas = [
+            asyncio.create_task(self._trabajador(), name=f"despachador-{i}")
+            for i in range(self._num_trabajadores)
+        ]
+        print(f"Despachador de avisos en marcha ({self._num_trabajadores} trabajadores).")
+
+    async def parar(self, esperar_segundos=5):
+        """Intenta vaciar la cola un rato y después para a los trabajadores."""
+        if self._vacia is None:
+            return
+        try:
+            await asyncio.wait_for(self._vacia.wait(), esperar_segundos)
+        except asyncio.TimeoutError:
+            print(f"Despachador: se quedan {self._en_cola} aviso(s) sin enviar.")
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+
+    async def esperar_vacia(self):
+        """Espera a que se hayan enviado (o descartado) todos los avisos encolados."""
+        await self._vacia.wait()
+
+    def encolar(self, chat_id, texto, parse_mode=None):
+        """Mete un aviso en la cola. No espera NADA (ni a Telegram ni a la cola)."""
+        self._meter(Mensaje(chat_id, texto, parse_mode, 0))
+        self.encolados += 1
+
+    def estadisticas(self):
+        return {
+            "en_cola": self._en_cola,
+            "encolados": self.encolados,
+            "enviados": self.enviados,
+            "reintentos_flood": self.reintentos_flood,
+            "fallidos": self.fallidos,
+        }
+
+    def _meter(self, mensaje, delante=False):
+        """Pone el mensaje en la cola de su chat (delante = el primero de ese chat)."""
+        cola = self._pendientes.get(mensaje.chat_id)
+        if cola is None:
+            cola = self._pendientes[mensaje.chat_id] = deque()
+            instante = self._siguiente_por_chat.pop(mensaje.chat_id, 0.0)
+            heapq.heappush(self._listos, (instante, next(self._orden), mensaje.chat_id))
+        if delante:
+            cola.appendleft(mensaje)
+        else:
+            cola.append(mensaje)
+        self._en_cola += 1
+        self._sin_terminar += 1
+        self._vacia.clear()
+        self._novedades.set()
+
+    def _sacar(self):
+        """
+        Saca el siguiente mensaje de un chat al que ya se le puede escribir.
+        Devuelve (mensaje, None) o (None, segundos hasta el siguiente turno /
+        None si no hay nada).
+        """
+        if not self._listos:
+            return None, None
+        instante, _, chat_id = self._listos[0]
+        ahora = time.monotonic()
+        if instante > ahora:
+            return None, instante - ahora
+
+        heapq.heappop(self._listos)
+        cola = self._pendientes[chat_id]
+        mensaje = cola.popleft()
+        self._en_cola -= 1
+        siguiente = ahora + self._segundos_por_chat
+        if cola:
+            heapq.heappush(self._listos, (siguiente, next(self._orden), chat_id))
+        else:
+            del self._pendientes[chat_id]
+            self._siguiente_por_chat[chat_id] = siguiente
+            # Que el dict no crezca sin fin: fuera los chats que ya no esperan nada
+            if len(self._siguiente_por_chat) > 10_000:
+                self._siguiente_por_chat = {
+                    chat: turno for chat, turno in self._siguiente_por_chat.items() if turno > ahora
+                }
+        return mensaje, None
+
+    async def _siguiente_mensaje(self):
+        while True:
+            mensaje, espera = self._sacar()
+            if mensaje is not None:
+                return mensaje
+            # Nada listo: hasta el siguiente turno o hasta que entre algo nuevo
+            self._novedades.clear()
+            try:
+                await asyncio.wait_for(self._novedades.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+
+    def _terminado(self):
+        self._sin_terminar -= 1
+        if not self._sin_terminar:
+            self._vacia.set()
+
+    async def _trabajador(self):
+        while True:
+            mensaje = await self._siguiente_mensaje()
+            try:
+                await self._enviar(mensaje)
+            finally:
+                self._terminado()
+
+    async def _enviar(self, mensaje):
+        await self._cubo.tomar()
+
+        inicio = time.perf_counter()
+        try:
+            await self._bot.send_message(chat_id=mensaje.chat_id, text=mensaje.texto, parse_mode=mensaje.parse_mode)
+            self.enviados += 1
+
+        except RetryAfter as e:
+            # Telegram nos pide parar: paramos TODOS y reintentamos este después
+            segundos = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else e.retry_after
+            self.reintentos_flood += 1
+            _retry_after.con().incrementar()
+            self._cubo.pausar(segundos)
+            print(f"Despachador: RetryAfter de Telegram, pausa de {segundos}s.")
+
+            if mensaje.intentos < NOTIF_MAX_REINTENTOS:
+                self._meter(mensaje._replace(intentos=mensaje.intentos + 1), delante=True)
+            else:
+                self.fallidos += 1
+                _envios_fallidos.con().incrementar()
+                print(f"Despachador: aviso a {mensaje.chat_id} descartado tras {NOTIF_MAX_REINTENTOS} reintentos.")
+
+        except TelegramError as e:
+            # (Ej: el usuario ha bloqueado al bot) -> no tiene sentido reintentar
+            self.fallidos += 1
+            _envios_fallidos.con().incrementar()
+            print(f"Despachador: no se pudo avisar a {mensaje.chat_id}: {e}")
+
+        finally:
+            _latencia_envio.con().observar(time.perf_counter() - inicio)
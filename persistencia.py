@@ -0,0 +1,356 @@
+import asyncio
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+from config import (
+    PERSISTENCIA_INTERVALO_FOTO,
+    PERSISTENCIA_MAX_REGISTRO)
+
+
+# --- Persistencia en disco del AlmacenAlertas de bot-con-cache.py ---
+# Dos ficheros binarios en un directorio:
+#   alertas.foto      -> FOTO completa (se reescribe entera de vez en cuando)
+#   alertas.registro  -> REGISTRO de cambios desde esa foto (solo se añade al final)
+# Al arrancar: se lee la foto y se le aplican los cambios del registro.
+#
+# Foto (en columnas, como el AlmacenAlertas):
+#   cabecera  "<4sHQIIQ": b"ALRT", versión, generación, nº de pares, nº de alertas,
+#             siguiente ID (para no repetir IDs de alertas ya borradas)
+#   pares     (ticker, alias) sin repetir: cada texto es u16 (longitud) + UTF-8
+#   columnas  (n = nº de alertas, little-endian) IDs n*u32, chat_ids n*i64,
+#             objetivos n*f64, nº de par n*u16, bits de "disparada" (n+7)//8 bytes
+#   crc32     de todo lo anterior
+#
+# Registro:
+#   cabecera  "<4sHQ": b"ALOG", versión, generación (la de la foto a la que sigue)
+#   cambios   "<BI" (tipo, longitud) + datos + crc32 (de tipo, longitud y datos)
+#
+# La foto nueva se escribe a un temporal y se cambia con os.replace (atómico):
+# o queda la vieja o la nueva, nunca media. Un registro de otra generación
+# (ya incluido en la foto) se ignora, y un cambio a medio escribir al final
+# (el bot murió escribiendo) se descarta.
+
+VERSION = 1
+
+_CABECERA_FOTO = struct.Struct("<4sHQIIQ")
+_CABECERA_REGISTRO = struct.Struct("<4sHQ")
+_CAMBIO = struct.Struct("<BI")
+_CRC = struct.Struct("<I")
+_TEXTO = struct.Struct("<H")
+
+# Tipos de cambio del registro
+_ALTA = 1     # "<IqdB" (ID, chat_id, objetivo, disparada) + ticker + alias
+_BAJA = 2     # "<I"  (ID)
+_ESTADO = 3   # "<IB" (ID, disparada)
+
+_DATOS_ALTA = struct.Struct("<IqdB")
+_DATOS_BAJA = struct.Struct("<I")
+_DATOS_ESTADO = struct.Struct("<IB")
+
+
+class ErrorPersistencia(Exception):
+    """La foto de las alertas está dañada o no es de este formato."""
+
+
+def _texto(valor):
+    datos = valor.encode("utf-8")
+    return _TEXTO.pack(len(datos)) + datos
+
+
+def _leer_texto(datos, posicion):
+    (longitud,) = _TEXTO.unpack_from(datos, posicion)
+    posicion += _TEXTO.size
+    return bytes(datos[posicion:posicion + longitud]).decode("utf-8"), posicion + longitud
+
+
+def _bytes_columna(columna):
+    """array -> bytes little-endian."""
+    if sys.byteorder == "big":
+        columna = array(columna.typecode, columna)
+        columna.byteswap()
+    return columna.tobytes()
+
+
+def _leer_columna(tipo, datos, posicion, n):
+    """n valores de tipo 'tipo' (little-endian) desde 'posicion' -> (array, posición siguiente)."""
+    columna = array(tipo)
+    fin = posicion + n * columna.itemsize
+    columna.frombytes(datos[posicion:fin])
+    if sys.byteorder == "big":
+        columna.byteswap()
+    return columna, fin
+
+
+# --- Foto ---
+
+def codificar_foto(almacen, generacion):
+    """AlmacenAlertas -> bytes de la foto."""
+    ids, chats, objetivos, pares, disparadas, lista_pares = almacen.columnas()
+    n = len(ids)
+    datos = bytearray(_CABECERA_FOTO.pack(
+        b"ALRT", VERSION, generacion, len(lista_pares), n, almacen.siguiente_id))
+    for ticker, alias in lista_pares:
+        datos += _texto(ticker) + _texto(alias)
+    for columna in (ids, chats, objetivos, pares):
+        datos += _bytes_columna(columna)
+    datos += disparadas[:(n + 7) // 8]
+    datos += _CRC.pack(zlib.crc32(datos))
+    return bytes(datos)
+
+
+def decodificar_foto(datos, almacen):
+    """
+    Mete en 'almacen' (vacío) las alertas de la foto.
+    Devuelve la generación de la foto.
+    """
+    if len(datos) < _CABECERA_FOTO.size + _CRC.size:
+        raise ErrorPersistencia("Foto demasiado corta")
+    (crc,) = _CRC.unpack_from(datos, len(datos) - _CRC.size)
+    if zlib.crc32(memoryview(datos)[:-_CRC.size]) != crc:
+        raise ErrorPersistencia("Foto dañada (el crc32 no cuadra)")
+
+    magia, version, generacion, n_pares, n_alertas, siguiente_id = _CABECERA_FOTO.unpack_from(datos, 0)
+    if magia != b"ALRT" or version != VERSION:
+        raise ErrorPersistencia(f"Foto de otro formato ({magia!r}, versión {version})")
+
+    posicion = _CABECERA_FOTO.size
+    pares = []
+    for _ in range(n_pares):
+        ticker, posicion = _leer_texto(datos, posicion)
+        alias, posicion = _leer_texto(datos, posicion)
+        pares.append((ticker, alias))
+
+    # Las columnas van tal cual al almacén, sin crear un objeto por alerta
+    vista = memoryview(datos)
+    ids, posicion = _leer_columna("I", vista, posicion, n_alertas)
+    chats, posicion = _leer_columna("q", vista, posicion, n_alertas)
+    objetivos, posicion = _leer_columna("d", vista, posicion, n_alertas)
+    numeros, posicion = _leer_columna("H", vista, posicion, n_alertas)
+    disparadas = vista[posicion:posicion + (n_alertas + 7) // 8]
+    if posicion + len(disparadas) + _CRC.size != len(datos):
+        raise ErrorPersistencia("Foto dañada (no cuadra el nº de alertas)")
+    almacen.cargar_columnas(ids, chats, objetivos, numeros, disparadas, pares, siguiente_id)
+    return generacion
+
+
+# --- Registro de cambios ---
+
+def codificar_cambio(tipo, datos):
+    cabecera = _CAMBIO.pack(tipo, len(datos))
+    return cabecera + datos + _CRC.pack(zlib.crc32(datos, zlib.crc32(cabecera)))
+
+
+def aplicar_registro(datos, generacion, almacen):
+    """
+    Aplica a 'almacen' los cambios del registro si es de 'generacion'.
+    Devuelve (cambios aplicados, bytes buenos del registro): lo que haya
+    detrás de un cambio incompleto o dañado no se aplica.
+    """
+    if len(datos) < _CABECERA_REGISTRO.size:
+        return 0, 0
+    magia, version, generacion_registro = _CABECERA_REGISTRO.unpack_from(datos, 0)
+    if magia != b"ALOG" or version != VERSION or generacion_registro != generacion:
+        return 0, 0  # (de otra foto: sus cambios ya están dentro de la foto)
+
+    posicion, aplicados = _CABECERA_REGISTRO.size, 0
+    while posicion + _CAMBIO.size <= len(datos):
+        tipo, longitud = _CAMBIO.unpack_from(datos, posicion)
+        inicio = posicion + _CAMBIO.size
+        fin = inicio + longitud
+        if fin + _CRC.size > len(datos):
+            break
+        (crc,) = _CRC.unpack_from(datos, fin)
+        if zlib.crc32(datos[inicio:fin], zlib.crc32(datos[posicion:inicio])) != crc:
+            break
+
+        if tipo == _ALTA:
+            alert_id, chat_id, objetivo, disparada = _DATOS_ALTA.unpack_from(datos, inicio)
+            ticker, siguiente = _leer_texto(datos, inicio + _DATOS_ALTA.size)
+            alias, _ = _leer_texto(datos, siguiente)
+            almacen.anadir(ticker, alias, objetivo, chat_id, bool(disparada), alert_id)
+        elif tipo == _BAJA:
+            (alert_id,) = _DATOS_BAJA.unpack_from(datos, inicio)
+            almacen.borrar(alert_id)
+        elif tipo == _ESTADO:
+            alert_id, disparada = _DATOS_ESTADO.unpack_from(datos, inicio)
+            almacen.marcar(alert_id, bool(disparada))
+
+        posicion = fin + _CRC.size
+        aplicados += 1
+    return aplicados, posicion
+
+
+def _escribir_atomico(ruta, datos):
+    """Escribe 'datos' en 'ruta' de forma que, pase lo que pase, queda el fichero viejo o el nuevo."""
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as fichero:
+        fichero.write(datos)
+        fichero.flush()
+        os.fsync(fichero.fileno())
+    os.replace(temporal, ruta)
+
+
+def _sincronizar_directorio(directorio):
+    """fsync del directorio (para que el os.replace sobreviva a un apagón)."""
+    try:
+        descriptor = os.open(directorio, os.O_RDONLY)
+    except OSError:
+        return  # (Windows no deja abrir directorios)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class PersistenciaAlertas:
+    """
+    Guarda en disco la lista de alertas de bot-con-cache.py.
+
+    - El almacén le apunta cada cambio (alta / baja / estado): solo se
+      codifica en memoria, no se toca el disco.
+    - Un job llama a persistir() cada pocos segundos: añade los cambios
+      pendientes al registro (write-behind) y, si el registro ha crecido
+      mucho o la foto es vieja, escribe una foto nueva y empieza un registro
+      vacío. La escritura va en un hilo para no parar el bucle de eventos.
+    - Si una escritura falla (disco lleno, EIO...) no se pierde nada: lo que
+      no llegó al disco vuelve a quedar pendiente para el siguiente intento.
+    - cargar() (al arrancar) deja el almacén tal y como quedó.
+    """
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        self.ruta_foto = os.path.join(directorio, "alertas.foto")
+        self.ruta_registro = os.path.join(directorio, "alertas.registro")
+        self._generacion = 0
+        self._pendiente = bytearray()
+        self._bytes_registro = 0
+        self._registro_al_dia = False  # el registro en disco es de la generación de la foto
+        self._ultima_foto = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    # --- Arranque ---
+
+    def cargar(self, almacen):
+        """
+        Lee la foto + el registro en 'almacen' (vacío) y, a partir de ahí,
+        le apunta los cambios del almacén.
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        inicio = time.perf_counter()
+
+        if os.path.exists(self.ruta_foto):
+            with open(self.ruta_foto, "rb") as fichero:
+                self._generacion = decodificar_foto(fichero.read(), almacen)
+        en_foto = len(almacen)
+
+        aplicados, buenos = 0, 0
+        if os.path.exists(self.ruta_registro):
+            with open(self.ruta_registro, "rb") as fichero:
+                aplicados, buenos = aplicar_registro(fichero.read(), self._generacion, almacen)
+
+        if buenos:
+            # Quitamos lo que haya detrás del último cambio bueno (si el bot
+            # murió a medio escribir) para seguir añadiendo detrás
+            with open(self.ruta_registro, "r+b") as fichero:
+                fichero.truncate(buenos)
+            self._bytes_registro = buenos
+            self._registro_al_dia = True
+        else:
+            self._nuevo_registro()
+
+        almacen.persistencia = self
+        print(f"Persistencia: {len(almacen)} alerta(s) cargadas ({en_foto} de la foto + "
+              f"{aplicados} cambio(s) del registro) en {(time.perf_counter() - inicio) * 1000:.0f} ms.")
+
+    def _nuevo_registro(self):
+        cabecera = _CABECERA_REGISTRO.pack(b"ALOG", VERSION, self._generacion)
+        _escribir_atomico(self.ruta_registro, cabecera)
+        _sincronizar_directorio(self.directorio)
+        self._bytes_registro = len(cabecera)
+        self._registro_al_dia = True
+
+    # --- Cambios (los llama el AlmacenAlertas) ---
+
+    def alta(self, alerta):
+        datos = (_DATOS_ALTA.pack(alerta.id, alerta.chat_id, alerta.target, alerta.triggered)
+                 + _texto(alerta.ticker) + _texto(alerta.alias))
+        self._pendiente += codificar_cambio(_ALTA, datos)
+
+    def baja(self, alert_id):
+        self._pendiente += codificar_cambio(_BAJA, _DATOS_BAJA.pack(alert_id))
+
+    def estado(self, alert_id, disparada):
+        self._pendiente += codificar_cambio(_ESTADO, _DATOS_ESTADO.pack(alert_id, disparada))
+
+    # --- Escritura (job + al apagar) ---
+
+    async def persistir(self, almacen):
+        """Vuelca los cambios pendientes y, si toca, escribe una foto nueva."""
+        if (self._bytes_registro + len(self._pendiente) > PERSISTENCIA_MAX_REGISTRO
+                or time.monotonic() - self._ultima_foto > PERSISTENCIA_INTERVALO_FOTO):
+            await self.guardar_foto(almacen)
+        else:
+            await self.volcar()
+
+    async def volcar(self):
+        """Añade al registro los cambios pendientes (y hace fsync)."""
+        async with self._lock:
+            if not self._pendiente and self._registro_al_dia:
+                return
+            datos, self._pendiente = bytes(self._pendiente), bytearray()
+            try:
+                await asyncio.to_thread(self._anadir_al_registro, datos)
+            except BaseException:
+                # No llegó al disco: sigue pendiente (delante de lo que haya llegado después)
+                self._pendiente = bytearray(datos) + self._pendiente
+                raise
+
+    def _anadir_al_registro(self, datos):
+        if not self._registro_al_dia:
+            # (falló al empezarlo tras la última foto: los cambios irían a
+            #  un registro de otra generación, que al cargar se ignora)
+            self._nuevo_registro()
+        with open(self.ruta_registro, "ab", buffering=0) as fichero:
+            try:
+                vista = memoryview(datos)
+                while vista:
+                    vista = vista[fichero.write(vista):]
+                os.fsync(fichero.fileno())
+            except OSError:
+                # Nada a medias: un cambio cortado pararía la carga ahí
+                fichero.truncate(self._bytes_registro)
+                raise
+        self._bytes_registro += len(datos)
+
+    async def guardar_foto(self, almacen):
+        """Escribe una foto completa del almacén y empieza un registro vacío."""
+        async with self._lock:
+            # La foto se codifica AQUÍ (en el bucle), así es una vista coherente
+            # del almacén; los cambios pendientes ya van dentro
+            generacion = self._generacion + 1
+            datos = codificar_foto(almacen, generacion)
+            pendiente, self._pendiente = self._pendiente, bytearray()
+            try:
+                await asyncio.to_thread(self._escribir_foto, datos, generacion)
+            except BaseException:
+                if self._generacion != generacion:
+                    # La foto no llegó al disco: sus cambios siguen pendientes
+                    # para el registro de la foto de antes (que sigue valiendo)
+                    self._pendiente = pendiente + self._pendiente
+                # (si lo que falló fue empezar el registro nuevo, la foto ya
+                #  los tiene y volcar() lo vuelve a intentar antes de escribir)
+                raise
+            self._ultima_foto = time.monotonic()
+        print(f"Persistencia: foto guardada ({len(almacen)} alerta(s), {len(datos) / 1024:.0f} KB).")
+
+    def _escribir_foto(self, datos, generacion):
+        _escribir_atomico(self.ruta_foto, datos)
+        _sincronizar_directorio(self.directorio)
+        # Si morimos aquí, el registro viejo es de la generación anterior y se ignora
+        self._generacion = generacion
+        self._registro_al_dia = False
+        self._nuevo_registro()
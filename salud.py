@@ -0,0 +1,117 @@
+import asyncio
+import time
+from collections import deque
+
+import base_datos
+from cotizaciones import foto_actual
+from config import (
+    SALUD_INTERVALO_LAG,
+    SALUD_VENTANA_LAG,
+    SALUD_MAX_LAG_LISTO,
+    SALUD_MAX_LAG_VIVO,
+    SALUD_MAX_SIN_TICK,
+    SALUD_MAX_EDAD_FOTO)
+
+
+class MonitorSalud:
+    """
+    Salud REAL del bot, para /healthz (¿reiniciar?) y /readyz (¿mandarle tráfico?).
+
+    - Retraso del bucle de eventos: una tarea duerme SALUD_INTERVALO_LAG
+      segundos y mide cuánto tarda de más en despertar.
+    - Segundos desde el último check_all_alerts que terminó bien.
+    - Edad de la foto de precios que publica el prefetch.
+    - Saturación del pool de la BD.
+    """
+
+    def __init__(self):
+        self._inicio = time.monotonic()
+        self._ultimo_tick_ok = None
+        self._lags = deque()  # (instante, retraso) de los últimos SALUD_VENTANA_LAG segundos
+        self._tarea = None
+
+    def arrancar(self):
+        self._tarea = asyncio.create_task(self._medir_lag(), name="monitor-salud")
+
+    async def parar(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            await asyncio.gather(self._tarea, return_exceptions=True)
+            self._tarea = None
+
+    def tick_ok(self):
+        """Lo llama check_all_alerts al terminar bien."""
+        self._ultimo_tick_ok = time.monotonic()
+
+    async def _medir_lag(self):
+        while True:
+            antes = time.monotonic()
+            await asyncio.sleep(SALUD_INTERVALO_LAG)
+            ahora = time.monotonic()
+            self._lags.append((ahora, max(0.0, ahora - antes - SALUD_INTERVALO_LAG)))
+            while self._lags[0][0] < ahora - SALUD_VENTANA_LAG:
+                self._lags.popleft()
+
+    def informe(self, bot_en_marcha):
+        """
+        Devuelve (vivo, listo, informe):
+          - vivo:  False si el bucle está atascado o las alertas llevan mucho
+                   sin comprobarse (reiniciar la instancia lo arregla).
+          - listo: además, el bot procesa updates, los precios están frescos y
+                   el pool de la BD no está saturado.
+        """
+        ahora = time.monotonic()
+
+        lag_actual = self._lags[-1][1] if self._lags else 0.0
+        lag_maximo = max((lag for _, lag in self._lags), default=0.0)
+
+        desde = self._ultimo_tick_ok if self._ultimo_tick_ok is not None else self._inicio
+        sin_tick = ahora - desde
+
+        foto = foto_actual()
+        edad_foto = ahora - foto.instante if foto.precios else None
+
+        pool = base_datos.metricas_pool()
+        pool_saturado = pool["tamano"] == 0 or (pool["en_uso"] >= pool["maximo"] and pool["esperando"] > 0)
+
+        comprobaciones = {
+            "bucle_eventos": {
+                "ok": lag_maximo <= SALUD_MAX_LAG_LISTO,
+                "retraso_segundos": round(lag_actual, 4),
+                "retraso_max_segundos": round(lag_maximo, 4),
+            },
+            "alertas": {
+                "ok": sin_tick <= SALUD_MAX_SIN_TICK,
+                "segundos_sin_tick_ok": round(sin_tick, 1),
+                "algun_tick_ok": self._ultimo_tick_ok is not None,
+            },
+            "cotizaciones": {
+                "ok": edad_foto is not None and edad_foto <= SALUD_MAX_EDAD_FOTO,
+                "edad_foto_segundos": round(edad_foto, 1) if edad_foto is not None else None,
+                "simbolos": len(foto.precios),
+            },
+            "base_datos": {
+                "ok": not pool_saturado,
+                "en_uso": pool["en_uso"],
+                "maximo": pool["maximo"],
+                "esperando": pool["esperando"],
+                "fallos_adquisicion": pool["fallos_adquisicion"],
+                "fallos_arranque": pool["fallos_arranque"],
+            },
+            "bot": {
+                "ok": bot_en_marcha,
+            },
+        }
+
+        vivo = lag_maximo <= SALUD_MAX_LAG_VIVO and comprobaciones["alertas"]["ok"]
+        listo = vivo and all(comprobacion["ok"] for comprobacion in comprobaciones.values())
+        return vivo, listo, {
+            "vivo": vivo,
+            "listo": listo,
+            "segundos_en_marcha": round(ahora - self._inicio, 1),
+            "comprobaciones": comprobaciones,
+        }
+
+
+# El monitor de ESTE proceso
+monitor_salud = MonitorSalud()
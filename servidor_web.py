@@ -0,0 +1,142 @@
+import asyncio
+import json
+from collections import namedtuple
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from config import WEB_MAX_CUERPO, WEB_TIMEOUT_INACTIVIDAD
+
+
+# --- Servidor HTTP mínimo sobre asyncio ---
+# Vive en el MISMO bucle de eventos que el bot: sin hilos y sin Flask.
+# Atiende el health check de Koyeb, las métricas y (en modo webhook) los
+# updates de Telegram, todo en el puerto $PORT.
+
+Peticion = namedtuple("Peticion", ["metodo", "camino", "consulta", "cabeceras", "cuerpo"])
+Respuesta = namedtuple("Respuesta", ["estado", "tipo", "cuerpo"])
+
+
+class _PeticionErronea(Exception):
+    """La petición no se puede atender: se contesta 'estado' y se cierra."""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+def respuesta_texto(estado, texto):
+    return Respuesta(estado, "text/plain; charset=utf-8", texto.encode("utf-8"))
+
+
+def respuesta_json(estado, datos):
+    return Respuesta(estado, "application/json", json.dumps(datos, default=str).encode("utf-8"))
+
+
+class ServidorWeb:
+    """
+    Servidor HTTP/1.1 muy pequeño (con keep-alive) para unas pocas rutas.
+    Cada ruta es un 'async def manejador(peticion) -> Respuesta'.
+    """
+
+    def __init__(self):
+        self._rutas = {}  # (metodo, camino) -> manejador
+        self._servidor = None
+
+    def ruta(self, metodo, camino, manejador):
+        """Registra 'manejador' para 'METODO /camino'."""
+        self._rutas[(metodo.upper(), camino)] = manejador
+
+    async def arrancar(self, puerto, host="0.0.0.0"):
+        self._servidor = await asyncio.start_server(self._atender_conexion, host, puerto)
+        print(f"Servidor web escuchando en {host}:{puerto}.")
+
+    async def parar(self):
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+            self._servidor = None
+
+    async def _atender_conexion(self, reader, writer):
+        try:
+            seguir = True
+            while seguir:
+                try:
+                    peticion, seguir = await asyncio.wait_for(self._leer_peticion(reader), WEB_TIMEOUT_INACTIVIDAD)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except ValueError:
+                    # (readline: línea más larga que el límite del StreamReader)
+                    break
+                except _PeticionErronea as error:
+                    # Petición mal formada (o demasiado grande): contestamos y cerramos
+                    self._escribir(writer, respuesta_texto(error.estado, str(error)), False)
+                    await writer.drain()
+                    break
+
+                if peticion is None:
+                    break
+                respuesta = await self._despachar(peticion)
+                self._escribir(writer, respuesta, seguir, cabeza=(peticion.metodo == "HEAD"))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _leer_peticion(self, reader):
+        """Lee UNA petición. Devuelve (peticion, keep_alive) o (None, False) si se cerró."""
+        linea = await reader.readline()
+        if not linea:
+            return None, False
+        try:
+            metodo, destino, version = linea.decode("latin-1").split()
+        except ValueError:
+            raise _PeticionErronea(HTTPStatus.BAD_REQUEST, "Línea de petición mal formada") from None
+
+        cabeceras = {}
+        while True:
+            linea = await reader.readline()
+            if linea in (b"\r\n", b"\n", b""):
+                break
+            nombre, _, valor = linea.decode("latin-1").partition(":")
+            cabeceras[nombre.strip().lower()] = valor.strip()
+
+        try:
+            longitud = int(cabeceras.get("content-length") or 0)
+        except ValueError:
+            raise _PeticionErronea(HTTPStatus.BAD_REQUEST, "Content-Length no válido") from None
+        if longitud > WEB_MAX_CUERPO:
+            raise _PeticionErronea(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Cuerpo demasiado grande")
+        cuerpo = await reader.readexactly(longitud) if longitud else b""
+
+        conexion = cabeceras.get("connection", "").lower()
+        keep_alive = conexion != "close" if version == "HTTP/1.1" else conexion == "keep-alive"
+
+        partes = urlsplit(destino)
+        return Peticion(metodo.upper(), partes.path or "/", partes.query, cabeceras, cuerpo), keep_alive
+
+    async def _despachar(self, peticion):
+        # HEAD se contesta como GET (pero sin cuerpo)
+        metodo = "GET" if peticion.metodo == "HEAD" else peticion.metodo
+        manejador = self._rutas.get((metodo, peticion.camino))
+        if manejador is None:
+            if any(camino == peticion.camino for _, camino in self._rutas):
+                return respuesta_texto(HTTPStatus.METHOD_NOT_ALLOWED, "Method Not Allowed")
+            return respuesta_texto(HTTPStatus.NOT_FOUND, "Not Found")
+        try:
+            return await manejador(peticion)
+        except Exception as error:
+            print(f"Servidor web: error en {peticion.metodo} {peticion.camino}: {error}")
+            return respuesta_texto(HTTPStatus.INTERNAL_SERVER_ERROR, "Internal Server Error")
+
+    @staticmethod
+    def _escribir(writer, respuesta, keep_alive, cabeza=False):
+        estado = HTTPStatus(respuesta.estado)
+        cabecera = (
+            f"HTTP/1.1 {estado.value} {estado.phrase}\r\n"
+            f"Content-Type: {respuesta.tipo}\r\n"
+            f"Content-Length: {len(respuesta.cuerpo)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n"
+        )
+        writer.write(cabecera.encode("latin-1") + (b"" if cabeza else respuesta.cuerpo))
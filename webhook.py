@@ -0,0 +1,88 @@
+import asyncio
+import hmac
+import json
+import signal
+from http import HTTPStatus
+from urllib.parse import urlsplit
+
+from telegram import Update
+
+from config import WEBHOOK_MAX_CONEXIONES
+from servidor_web import respuesta_texto
+
+
+# --- Modo WEBHOOK ---
+# Telegram nos hace POST con cada update al servidor web del bot (el mismo
+# que contesta el health check). Sin long-polling y sin hilos extra.
+
+
+def manejador_webhook(application, secreto):
+    """
+    Ruta 'POST <WEBHOOK_RUTA>': comprueba el token secreto que Telegram manda
+    en la cabecera y mete el update en la cola de la Application.
+    Se contesta 200 YA: el update se procesa después, como en polling.
+    """
+    secreto = secreto.encode("utf-8")
+
+    async def recibir_update(peticion):
+        recibido = peticion.cabeceras.get("x-telegram-bot-api-secret-token", "").encode("utf-8")
+        if not hmac.compare_digest(recibido, secreto):
+            return respuesta_texto(HTTPStatus.FORBIDDEN, "Forbidden")
+
+        try:
+            update = Update.de_json(json.loads(peticion.cuerpo), application.bot)
+        except (ValueError, TypeError, KeyError) as error:
+            print(f"Webhook: update no válido: {error}")
+            return respuesta_texto(HTTPStatus.BAD_REQUEST, "Bad Request")
+
+        await application.update_queue.put(update)
+        return respuesta_texto(HTTPStatus.OK, "ok")
+
+    return recibir_update
+
+
+async def ejecutar_webhook(application, servidor, url, secreto, parada=None):
+    """
+    Equivalente a 'application.run_polling()' pero en modo webhook:
+    arranca la Application (con su post_init), registra la URL en Telegram y
+    se queda atendiendo hasta que se activa 'parada' (por defecto, un Event
+    que activan SIGINT / SIGTERM).
+    """
+    servidor.ruta("POST", urlsplit(url).path, manejador_webhook(application, secreto))
+
+    if parada is None:
+        parada = asyncio.Event()
+        bucle = asyncio.get_running_loop()
+        for senal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                bucle.add_signal_handler(senal, parada.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # (Windows: Ctrl+C llega como KeyboardInterrupt y cancela esto)
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+
+        await application.bot.set_webhook(
+            url=url,
+            secret_token=secreto,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=WEBHOOK_MAX_CONEXIONES,
+        )
+        print(f"Webhook registrado en Telegram: {url}")
+
+        await parada.wait()
+        print("Parando el bot (webhook)...")
+
+    finally:
+        # Mismo orden que run_polling al terminar.
+        # (El webhook NO se borra: la siguiente instancia lo vuelve a registrar)
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)